@@ -0,0 +1,189 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from fetch_scheduler import current_priority, fetch_priority
+from market_provider import get_provider
+from screener import fusion_score
+from sentiment import polarity_label
+from telemetry import span, cache_event
+
+# ==========================================
+# PIPELINES DE ANÁLISIS (TÉCNICO + NOTICIAS)
+# ==========================================
+# Cada etapa tiene su propia caché y duración, se ejecutan en paralelo y se
+# fusionan al final. Si una etapa tarda demasiado se usa su último resultado
+# (aunque esté caducado) y el resultado indica qué entradas se usaron.
+
+TECH_TTL = 120          # segundos de vida del análisis técnico
+NEWS_TTL = 900          # las noticias cambian mucho más despacio
+STALE_TTL = 24 * 3600   # hasta cuándo se acepta un resultado caducado
+STAGE_TIMEOUT = 4       # espera máxima por etapa antes de degradar
+NEWS_LIMIT = 8
+SENTIMENT_TIMEOUT = 3
+PENDING_TTL = 10        # titulares aún sin puntuar: se vuelve a intentar enseguida
+PENDING = "PENDIENTE"
+
+FRESH, STALE, MISSING = 'fresh', 'stale', 'missing'
+
+
+
+def extract_headlines(raw_news, limit=NEWS_LIMIT):
+    # Normaliza el formato de t.news (antiguo y nuevo con 'content')
+    items = []
+    for n in (raw_news or [])[:limit]:
+        title = n.get('title')
+        if not title and 'content' in n:
+            title = n['content'].get('title')
+        if not title: continue
+        items.append({'title': title, 'publisher': n.get('publisher', 'Yahoo Finance'), 'link': n.get('link', '#')})
+    return items
+
+
+def sentiment_from_polarities(pols):
+    # Polaridad media (-1..1) -> score 0..100; 50 si no hay titulares puntuados
+    scores = [p for p in pols if p is not None]
+    if not scores: return 50
+    return ((sum(scores) / len(scores) + 1) / 2) * 100
+
+
+class StageCache:
+    # Resultado por ticker con marca de tiempo; se conserva después del TTL
+    # para poder servirlo como 'stale'
+    def __init__(self, ttl, stale_ttl=STALE_TTL, name='stage'):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+        age = time.time() - item[1] if item is not None else None
+        if item is None or age > self.stale_ttl: value, status, age = None, MISSING, None
+        elif age <= item[2]: value, status = item[0], FRESH
+        else: value, status = item[0], STALE
+        cache_event(self.name, {FRESH: 'hit', STALE: 'stale', MISSING: 'miss'}[status])
+        return value, status, age
+
+    def age(self, key):
+        # Antigüedad sin contar acierto/fallo (None si no hay resultado)
+        with self._lock:
+            item = self._items.get(key)
+        return time.time() - item[1] if item is not None else None
+
+    def peek(self, key):
+        # Último valor aceptable (fresco o caducado) sin lanzar refresco ni contar acierto/fallo
+        with self._lock:
+            item = self._items.get(key)
+        if item is None or time.time() - item[1] > self.stale_ttl: return None
+        return item[0]
+
+    def ttl_of(self, key):
+        with self._lock:
+            item = self._items.get(key)
+        return item[2] if item is not None else self.ttl
+
+    def put(self, key, value, ttl=None):
+        # ttl propio para resultados provisionales (más corto que el de la etapa)
+        with self._lock:
+            self._items[key] = (value, time.time(), self.ttl if ttl is None else ttl)
+
+
+class AnalysisPipeline:
+    def __init__(self, store, engine, sentiment_cache, provider=None, tech_ttl=TECH_TTL,
+                 news_ttl=NEWS_TTL, timeout=STAGE_TIMEOUT, max_workers=8):
+        self.store = store
+        self.engine = engine
+        self.sentiment_cache = sentiment_cache
+        self.provider = provider if provider is not None else get_provider()
+        self.timeout = timeout
+        self._caches = {'technical': StageCache(tech_ttl, name='analysis.technical'),
+                        'sentiment': StageCache(news_ttl, name='analysis.sentiment')}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+
+    # --- ETAPAS ---
+    def compute_technical(self, ticker):
+        # Solo se convierte el tramo de 6 meses, en formato compacto
+        hist = self.store.get_range(ticker, '6mo', compact=True)
+        if hist is None or hist.empty: return None
+        rsi, macd, sig = self.engine.sync(ticker, hist.series('Close'))
+        return {'rsi': rsi, 'macd': macd, 'signal': sig, 'asof': hist.index[-1]}
+
+    def compute_sentiment(self, ticker):
+        items = extract_headlines(self.provider.Ticker(ticker).news)
+        pols = self.sentiment_cache.score_batch([i['title'] for i in items], timeout=SENTIMENT_TIMEOUT)
+        news = [dict(i, label=PENDING if p is None else polarity_label(p)) for i, p in zip(items, pols)]
+        return {'score': sentiment_from_polarities(pols), 'news': news, 'pending': sum(p is None for p in pols)}
+
+    def _run(self, stage, ticker, priority=None):
+        compute = self.compute_technical if stage == 'technical' else self.compute_sentiment
+        try:
+            # La etapa hereda la prioridad de quien la pidió (p. ej. WARMUP)
+            with span(f'analysis.{stage}'), fetch_priority(priority):
+                value = compute(ticker)
+            if value is not None:
+                # Con titulares pendientes el resultado es provisional: caduca enseguida y
+                # la siguiente petición recoge las puntuaciones ya terminadas
+                self._caches[stage].put(ticker, value, PENDING_TTL if value.get('pending') else None)
+            return value
+        finally:
+            with self._lock: self._inflight.pop((stage, ticker), None)
+
+    def _submit(self, stage, ticker):
+        # Un solo refresco en curso por etapa y ticker
+        with self._lock:
+            fut = self._inflight.get((stage, ticker))
+            if fut is None:
+                fut = self._pool.submit(self._run, stage, ticker, current_priority())
+                self._inflight[(stage, ticker)] = fut
+            return fut
+
+    def refresh_due(self, ticker, ahead=1.0, timeout=None):
+        # Refresca ya las etapas con más de ahead * ttl de antigüedad (precalentamiento)
+        futures = [self._submit(stage, ticker) for stage, cache in self._caches.items()
+                   if cache.age(ticker) is None or cache.age(ticker) >= cache.ttl_of(ticker) * ahead]
+        if futures: wait(futures, timeout=self.timeout if timeout is None else timeout)
+        return len(futures)
+
+    def cached_sentiment(self, tickers):
+        # Scores de noticias ya calculados (sin llamar al proveedor), para el screener
+        cache = self._caches['sentiment']
+        values = {t: cache.peek(t) for t in tickers}
+        return {t: v['score'] for t, v in values.items() if v is not None}
+
+    # --- FUSIÓN ---
+    def analyze(self, ticker, timeout=None):
+        # Ambas etapas se refrescan en paralelo; la espera total es la de la más lenta
+        results, futures = {}, {}
+        for stage, cache in self._caches.items():
+            results[stage] = cache.get(ticker)
+            if results[stage][1] != FRESH: futures[stage] = self._submit(stage, ticker)
+        if futures: wait(list(futures.values()), timeout=self.timeout if timeout is None else timeout)
+        errors = {}
+        for stage, fut in futures.items():
+            # Tiempo agotado o error: se queda lo último conocido (si existe)
+            if not fut.done(): errors[stage] = "sin respuesta a tiempo"
+            elif fut.exception() is not None: errors[stage] = str(fut.exception())
+            elif fut.result() is not None: results[stage] = (fut.result(), FRESH, 0.0)
+            else: errors[stage] = "sin datos"
+
+        tech, tech_status, tech_age = results['technical']
+        sent, sent_status, sent_age = results['sentiment']
+        rsi, macd, sig = (tech['rsi'], tech['macd'], tech['signal']) if tech else (np.nan, np.nan, np.nan)
+        sent_score = sent['score'] if sent else 50
+        news = sent['news'] if sent else []
+        prob = float(fusion_score(rsi, macd, sig, sent_score))
+
+        inputs = {
+            'technical': {'status': tech_status, 'age': tech_age, 'asof': tech['asof'] if tech else None,
+                          'rsi': rsi, 'macd': macd, 'signal': sig},
+            'sentiment': {'status': sent_status, 'age': sent_age, 'headlines': len(news)},
+        }
+        for stage, msg in errors.items(): inputs[stage]['error'] = msg
+        return prob, sent_score, news, inputs
@@ -1,16 +1,24 @@
 import streamlit as st
-import yfinance as yf
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import pandas as pd
 import time
-from datetime import datetime, timedelta
-import pytz
-import hashlib
-import json
+import math
 import os
-import numpy as np
-from textblob import TextBlob 
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from paths import DATA_DIR
+from ledger import Ledger, InsufficientFunds, COMMISSION_RATE
+from users import UserStore, UserExists
+from sentiment import SentimentCache
+from shared_cache import SharedCache
+from fetch_scheduler import UpstreamError, describe_error, fetch_priority, CHART
+import telemetry
+from telemetry import span, traced_cache, mark_miss, timed_import
+
+# Arranque en frío: el login solo necesita Streamlit, SQLite y la librería
+# estándar. pandas/NumPy (motores de datos), plotly y el resto se importan
+# con timed_import() la primera vez que una sección los usa, y esa carga
+# queda en el histograma 'import_seconds' del panel de telemetría.
+RUN_STARTED = time.perf_counter()
 
 # ==========================================
 # 1. CONFIGURACIÓN DEL SISTEMA
@@ -25,248 +33,302 @@ st.set_page_config(
 # ==========================================
 # 2. ESTÉTICA "GOOGLE FINANCE PRO" (CSS)
 # ==========================================
-BACKGROUND_URL = "https://images.unsplash.com/photo-1486406146926-c627a92ad1ab?q=80&w=2070&auto=format&fit=crop"
-
-st.markdown(f"""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Manrope:wght@300;400;600;800&family=Roboto+Mono:wght@400;600&display=swap');
-
-    /* FONDO */
-    .stApp {{
-        background-image: url("{BACKGROUND_URL}");
-        background-size: cover;
-        background-position: center;
-        background-attachment: fixed;
-    }}
-    .stApp::before {{
-        content: ""; position: absolute; top: 0; left: 0; width: 100%; height: 100%;
-        background: rgba(10, 14, 20, 0.95); backdrop-filter: blur(5px); z-index: -1;
-    }}
-
-    /* TIPOGRAFÍA */
-    html, body, [class*="css"] {{ font-family: 'Manrope', sans-serif; color: #e0e0e0; letter-spacing: -0.3px; }}
-    h1, h2, h3, h4 {{ font-family: 'Manrope', sans-serif; font-weight: 800; color: #fff !important; }}
-
-    /* COMPONENTES */
-    section[data-testid="stSidebar"] {{ background-color: rgba(5, 7, 10, 0.98); border-right: 1px solid #1f222a; }}
-    
-    .stTextInput>div>div>input, .stNumberInput>div>div>input {{
-        background-color: rgba(255,255,255,0.03) !important; color: #fff !important;
-        border: 1px solid #2d323e !important; font-family: 'Roboto Mono', monospace;
-    }}
-    
-    div[data-testid="stMetric"] {{
-        background: rgba(255,255,255,0.02); border: 1px solid #2d323e;
-        padding: 15px; border-radius: 10px;
-    }}
-    
-    /* BOTONES GOOGLE STYLE */
-    .stButton>button {{
-        background: rgba(255,255,255,0.05); color: #fff; border: 1px solid #2d323e;
-        border-radius: 20px; font-weight: 700; transition: 0.2s;
-    }}
-    .stButton>button:hover {{ background: rgba(255,255,255,0.1); border-color: #5f6368; }}
-    .stButton>button[kind="primary"] {{
-        background: #4285f4; border-color: #4285f4; color: #fff;
-    }}
-
-    /* HEADER PRECIOS */
-    .live-header {{
-        background: rgba(0,0,0,0.3); backdrop-filter: blur(10px); padding: 25px;
-        border-bottom: 2px solid #2d323e; margin-bottom: 25px; border-radius: 0 0 15px 15px;
-    }}
-    .live-price {{ font-family: 'Roboto Mono'; font-size: 3.5rem; font-weight: 700; }}
-    
-    /* COLORES ESTADO */
-    .bg-up {{ background-color: rgba(52, 168, 83, 0.15); color: #34a853; }}
-    .bg-down {{ background-color: rgba(234, 67, 53, 0.15); color: #ea4335; }}
-    .text-up {{ color: #34a853 !important; }}
-    .text-down {{ color: #ea4335 !important; }}
-
-    /* CONTENEDOR IA */
-    .ai-container {{
-        background: rgba(20, 25, 35, 0.9); border: 1px solid #4285f4;
-        border-radius: 15px; padding: 30px; margin-top: 20px;
-        box-shadow: 0 0 30px rgba(66, 133, 244, 0.15);
-    }}
-    .probability-score {{ font-size: 4rem; font-weight: 900; font-family: 'Roboto Mono'; line-height: 1; }}
-    
-    /* PANEL DE OPERACIONES */
-    .trade-panel {{
-        background: rgba(255, 255, 255, 0.03);
-        border: 1px solid #333;
-        border-radius: 10px;
-        padding: 20px;
-        margin-top: 20px;
-    }}
-</style>
-<script>
-    // JS para manejar la persistencia de la sesión en localStorage
-    const USER_KEY = 'titanium_user_session';
-    
-    // 1. Al cargar la página, verifica si hay una sesión guardada
-    window.onload = function() {{
-        const savedUser = localStorage.getItem(USER_KEY);
-        if (savedUser) {{
-            // Si hay un usuario, usa Streamlit.setComponentValue para notificar al backend
-            // Usaremos un componente Streamlit invisible para pasar el valor
-            const element = document.getElementById('session_manager');
-            if (element) {{
-                element.value = savedUser;
-                element.dispatchEvent(new Event('change')); 
-            }}
-        }}
-    }};
-    
-    // 2. Función para guardar sesión
-    function saveSession(username) {{
-        localStorage.setItem(USER_KEY, username);
-    }}
-
-    // 3. Función para borrar sesión (al hacer logout)
-    function clearSession() {{
-        localStorage.removeItem(USER_KEY);
-    }}
-</script>
-""", unsafe_allow_html=True)
+# Estilos y JS viven en static/. Con el servidor estático activo
+# (.streamlit/config.toml) cada rerun solo envía dos etiquetas y el navegador
+# descarga los ficheros una vez por sesión; si no, se incrustan como antes.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
 
-# ==========================================
-# 3. SEGURIDAD Y ESTADO
-# ==========================================
-DB_FILE = 'users_db.json'
+@st.cache_resource
+def inline_assets():
+    with open(os.path.join(STATIC_DIR, 'titanium.css'), 'r') as f: css = f.read()
+    with open(os.path.join(STATIC_DIR, 'titanium.js'), 'r') as f: js = f.read()
+    return f"<style>\n{css}</style>\n<script>\n{js}</script>"
 
-def load_users():
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, 'r') as f: return json.load(f)
-    default = {'admin': hashlib.sha256(str.encode('admin123')).hexdigest()}
-    with open(DB_FILE, 'w') as f: json.dump(default, f)
-    return default
+def inject_assets():
+    if st.get_option('server.enableStaticServing'):
+        st.markdown('<link rel="stylesheet" href="app/static/titanium.css"><script src="app/static/titanium.js"></script>', unsafe_allow_html=True)
+    else:
+        st.markdown(inline_assets(), unsafe_allow_html=True)
 
-def save_users(db):
-    with open(DB_FILE, 'w') as f: json.dump(db, f)
+inject_assets()
 
-def check_hashes(password, hashed_text):
-    return hashlib.sha256(str.encode(password)).hexdigest() == hashed_text
+# ==========================================
+# 3. SEGURIDAD Y ESTADO
+# ==========================================
+# Usuarios en SQLite (users.py): consulta indexada y altas atómicas; la
+# primera vez importa users_db.json
+@st.cache_resource
+def get_user_store():
+    return UserStore()
 
 # Inicialización de estado de Seguridad
-if 'db_users' not in st.session_state: st.session_state['db_users'] = load_users()
 if 'authenticated' not in st.session_state: st.session_state['authenticated'] = False
 if 'user_current' not in st.session_state: st.session_state['user_current'] = None
 
-# INICIALIZACIÓN DE ESTADO PERSISTENTE DE MONEDERO (CRÍTICO)
-st.session_state.setdefault('liquidez_usd', 10000.0)
-st.session_state.setdefault('posiciones', {})
-st.session_state.setdefault('historial', [])
+# El monedero (liquidez, posiciones e historial) vive en el libro de operaciones (ledger.py)
 st.session_state.setdefault('ticker_actual', 'BTC-USD')
 st.session_state.setdefault('timeframe', '1y')
 
+# Universo del EXPLORADOR (también se usa para pedir cotizaciones en lote)
+WATCHLIST_CATEGORIES = {
+    "🔥 TENDENCIA": ["NVDA", "TSLA", "AAPL", "MSFT", "AMZN"],
+    "₿ CRIPTO": ["BTC-USD", "ETH-USD", "SOL-USD", "DOGE-USD"],
+    "💱 FOREX": ["EURUSD=X", "JPY=X", "GBPUSD=X"]
+}
+WATCHLIST = [s for v in WATCHLIST_CATEGORIES.values() for s in v]
+
 
 # ==========================================
 # 4. FUNCIONES GLOBALES DE DATOS (ACCESIBLES)
 # ==========================================
 
-@st.cache_data(ttl=300) 
+# Resultados compartidos entre workers (disco local o Redis): un solo
+# refresco por clave y el valor caducado se sirve mientras se revalida
+@st.cache_resource
+def get_shared_cache():
+    cache = SharedCache()
+    telemetry.register_collector('shared_cache', lambda: {
+        ('cache_entries', (('cache', 'shared.memo'),)): cache.memo_stats()['entries'],
+        ('cache_bytes', (('cache', 'shared.memo'),)): cache.memo_stats()['bytes'],
+    })
+    return cache
+
+@st.cache_resource
+def get_indicator_engine():
+    return timed_import('indicators').IndicatorEngine()
+
+# Caché de sentimiento por titular (compartida entre tickers y sesiones)
+@st.cache_resource
+def get_sentiment_cache():
+    cache = SentimentCache(path=os.path.join(DATA_DIR, 'sentiment_cache.json'))
+    telemetry.register_collector('sentiment', lambda: {
+        ('cache_entries', (('cache', 'sentiment'),)): cache.stats()['entries'],
+        ('cache_pending', (('cache', 'sentiment'),)): cache.stats()['pending'],
+    })
+    return cache
+
+# Técnico y noticias son pipelines independientes (cada uno con su caché),
+# se ejecutan en paralelo y se fusionan al final
+@st.cache_resource
+def get_analysis_pipeline():
+    return timed_import('analysis').AnalysisPipeline(get_bar_store(), get_indicator_engine(), get_sentiment_cache())
+
+def _analysis_complete(result):
+    # Solo se comparten análisis con ambas entradas frescas y todos los titulares puntuados
+    _, _, news, inputs = result
+    analysis = timed_import('analysis')
+    return (all(v.get('status') == analysis.FRESH for v in inputs.values())
+            and all(n['label'] != analysis.PENDING for n in news))
+
+@span('get_ai_analysis')
 def get_ai_analysis(ticker):
-    try:
-        t = yf.Ticker(ticker)
-        hist = t.history(period="6mo")
-        if hist.empty: return None, 0, []
-        
-        # --- CÁLCULO TÉCNICO BÁSICO (para IA) ---
-        delta = hist['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        current_rsi = rsi.iloc[-1]
-        
-        ema12 = hist['Close'].ewm(span=12).mean()
-        ema26 = hist['Close'].ewm(span=26).mean()
-        macd = ema12 - ema26
-        signal = macd.ewm(span=9).mean()
-        current_macd = macd.iloc[-1]
-        current_sig = signal.iloc[-1]
-        
-        # --- ANÁLISIS NOTICIAS (TEXTBLOB) ---
-        news_data = []
-        sent_score = 50
-        
-        try:
-            raw_news = t.news
-            if not raw_news: raw_news = []
-            
-            scores = []
-            for n in raw_news[:8]:
-                title = n.get('title')
-                if not title and 'content' in n:
-                    title = n['content'].get('title')
-                if not title: continue
-                
-                publisher = n.get('publisher', 'Yahoo Finance')
-                link = n.get('link', '#')
-                
-                blob = TextBlob(title)
-                pol = blob.sentiment.polarity
-                
-                if pol > 0.1: lbl = "POSITIVO"
-                elif pol < -0.1: lbl = "NEGATIVO"
-                else: lbl = "NEUTRAL"
-                
-                scores.append(pol)
-                news_data.append({'title': title, 'label': lbl, 'publisher': publisher, 'link': link})
-            
-            if scores:
-                avg_pol = sum(scores) / len(scores)
-                sent_score = ((avg_pol + 1) / 2) * 100
-        except Exception as e: pass
-        
-        # --- FUSIÓN DE PROBABILIDAD ---
-        prob = 50
-        if current_rsi < 30: prob += 20 
-        elif current_rsi > 70: prob -= 20 
-        if current_macd > current_sig: prob += 10 
-        else: prob -= 10 
-        if sent_score > 60: prob += 15
-        elif sent_score < 40: prob -= 15
-        prob = max(0, min(100, prob))
-        
-        return prob, sent_score, news_data
-    except Exception as e: return 0, 0, []
+    # Los errores suben a la pestaña de análisis (sin puntuación inventada)
+    analysis = timed_import('analysis')
+    return get_shared_cache().get_or_compute(
+        'analysis', (ticker,), lambda: get_analysis_pipeline().analyze(ticker),
+        ttl=analysis.TECH_TTL, stale_ttl=analysis.NEWS_TTL, store_if=_analysis_complete
+    )
 
-@st.cache_data(ttl=60)
+def describe_inputs(inputs):
+    # Texto corto con el estado de cada entrada usada en la fusión
+    names = {'technical': 'Técnico', 'sentiment': 'Noticias'}
+    states = {'fresh': 'actualizado', 'stale': 'en caché', 'missing': 'no disponible'}
+    parts = []
+    for k, label in names.items():
+        info = inputs.get(k, {})
+        txt = f"{label}: {states.get(info.get('status'), 'no disponible')}"
+        if info.get('status') == 'stale' and info.get('age') is not None: txt += f" ({info['age'] / 60:.0f} min)"
+        if info.get('error'): txt += f" — error: {info['error']}"
+        parts.append(txt)
+    return " · ".join(parts)
+
+# Motor compartido entre sesiones: un solo lote de precios para todos los símbolos
+@st.cache_resource
+def get_quote_engine():
+    return timed_import('quotes').QuoteEngine()
+
+def get_quote_table(symbols, names=False):
+    return get_quote_engine().get_quotes(symbols, names=names)
+
+# Feed en vivo: un hilo productor por proceso con el último precio de los
+# símbolos que alguna sesión está mirando
+LIVE_REFRESH = float(os.environ.get('TITANIUM_LIVE_REFRESH', '3')) or None   # s entre refrescos del fragmento
+
+@st.cache_resource
+def get_price_feed():
+    live_feed = timed_import('live_feed')
+    return live_feed.PriceFeed(live_feed.make_source(get_quote_engine()))
+
+def current_price(ticker, snapshot):
+    # Último precio del feed si lo hay; si no, el del snapshot del rerun
+    live = get_price_feed().latest(ticker)
+    if live is not None:
+        pct = live[1] if math.isfinite(live[1]) else snapshot['pct']
+        return live[0], pct, True, live[3]
+    return snapshot['price'], snapshot['pct'], snapshot['error'] is None, None
+
+@span('get_market_snapshot')
 def get_market_snapshot(ticker):
-    try:
-        t = yf.Ticker(ticker)
-        price = float(t.fast_info.last_price)
-        prev_close = float(t.fast_info.previous_close)
-        name = t.info.get('longName', ticker)
-        
-        change = price - prev_close
-        pct_change = (change / prev_close) * 100
-        return price, pct_change, name, change
-    except: return 0, 0, ticker, 0
-
-@st.cache_data(ttl=60)
+    # Sin cotización válida se lanza el error del proveedor (nunca un precio a cero)
+    engine = get_quote_engine()
+    q = engine.get_quote(ticker)
+    price, prev_close = float(q['price']), float(q['prev_close'])
+    if math.isnan(price) or math.isnan(prev_close) or prev_close == 0:
+        raise engine.error(ticker) or UpstreamError(f"sin cotización para {ticker}")
+    change = price - prev_close
+    pct_change = (change / prev_close) * 100
+    return price, pct_change, q['name'], change
+
+# Velas OHLCV en disco: solo se descargan las posteriores a la última guardada
+@st.cache_resource
+def get_bar_store():
+    return timed_import('bar_store').BarStore()
+
+CHART_TTL, CHART_STALE = 60, 600
+
+@span('get_chart_data')
 def get_chart_data(ticker, period):
-    try:
-        t = yf.Ticker(ticker)
-        # Mapeo de Periodo -> Intervalo óptimo
-        if period == '1d': data = t.history(period='1d', interval='5m')
-        elif period == '5d': data = t.history(period='5d', interval='15m')
-        elif period == '1mo': data = t.history(period='1mo', interval='60m')
-        elif period == '6mo': data = t.history(period='6mo', interval='1d')
-        elif period == '1y': data = t.history(period='1y', interval='1d')
-        else: data = t.history(period='max', interval='1wk')
-        
-        # Corrección CRÍTICA: Forzar un rango más amplio si el corto es vacío (fin de semana/feriado)
-        if period in ['1d', '5d'] and data.empty:
-             data = t.history(period='7d', interval='15m')
-        
-        if data.empty: return None
-        return data
-    except Exception as e: 
-        print(f"Error fetching chart data: {e}")
-        return None
+    return get_shared_cache().get_or_compute('chart', (ticker, period), lambda: _load_chart_data(ticker, period), ttl=CHART_TTL, stale_ttl=CHART_STALE)
+
+def _load_chart_data(ticker, period):
+    # None = el proveedor no tiene velas para el rango; los fallos se lanzan
+    # Cada rango es un recorte de un nivel de la pirámide (bar_store.RANGE_INTERVAL):
+    # los rangos cortos cuentan sesiones, así que fines de semana y festivos
+    # ya no dejan el gráfico vacío ni piden un segundo rango más amplio.
+    # Se guarda como Bars (float32, solo lectura): la caché entrega la misma serie sin copiarla
+    data = get_bar_store().get_range(ticker, period, compact=True)
+    if data is None or data.empty: return None
+    return data
+
+# Libro de operaciones durable (fills + saldos materializados)
+@st.cache_resource
+def get_ledger():
+    return Ledger()
+
+# Valoración de la cartera completa de la sesión: se reconstruye solo cuando
+# el libro del usuario cambia; entre ejecuciones solo se actualizan precios
+def get_portfolio(user):
+    version = (user, get_ledger().version(user))
+    pf = st.session_state.get('portfolio')
+    if pf is None: pf = st.session_state['portfolio'] = timed_import('portfolio').PortfolioValuation()
+    if pf.version != version: pf.set_positions(get_ledger().holdings(user), version)
+    return pf
+
+# Órdenes del panel: pasarela asíncrona (broker simulado por defecto, Alpaca
+# con TITANIUM_BROKER=alpaca); cada ejecución se apunta en el libro. El panel
+# no espera a la ejecución: live_order_updates avisa cuando la orden se cierra.
+
+@st.cache_resource
+def get_broker_gateway():
+    ledger, feed, engine = get_ledger(), get_price_feed(), get_quote_engine()
+
+    def market_price(symbol):
+        live = feed.latest(symbol)
+        return live[0] if live is not None else engine.get_quote(symbol)['price']
+
+    def settle(ticket):
+        # La comisión se descuenta de lo que se recibe: acciones en la compra, efectivo en la venta
+        price = ticket.filled_avg_price
+        gross = ticket.filled_qty * price
+        fee = gross * COMMISSION_RATE
+        if ticket.side == 'BUY':
+            ledger.record_fill(ticket.user, ticket.symbol, 'BUY', (gross - fee) / price, price, fee, -gross, order_id=ticket.client_order_id)
+        else:
+            ledger.record_fill(ticket.user, ticket.symbol, 'SELL', ticket.filled_qty, price, fee, gross - fee, order_id=ticket.client_order_id)
+
+    broker_gateway = timed_import('broker_gateway')
+    broker = broker_gateway.make_broker(market_price)
+    # Al cerrarse una orden (ejecutada, cancelada o rechazada) se libera lo que reservó
+    gateway = broker_gateway.BrokerGateway(broker, on_fill=settle, on_close=lambda t: ledger.release(t.client_order_id))
+    metrics = lambda: {('broker_open_orders', ()): gateway.open_orders()}
+    engine = getattr(broker, 'engine', None)
+    if engine is not None:
+        # Broker simulado: cada vuelta del feed pasa por el motor de casamiento y
+        # los símbolos con órdenes en reposo siguen suscritos aunque nadie los mire
+        def on_quotes(quotes):
+            engine.on_prices({s: price for s, (price, _) in quotes.items()})
+            for s in engine.symbols(): feed.subscribe(s)
+        feed.add_listener(on_quotes)
+        metrics = lambda: {('broker_open_orders', ()): gateway.open_orders(), ('matching_resting_orders', ()): engine.depth()}
+    telemetry.register_collector('broker', metrics)
+    return gateway
+
+# Tipos de orden del panel -> (tipo en el broker, campo del precio de disparo).
+# Take-profit es una venta límite por encima del precio; stop-loss, una venta stop por debajo.
+ORDER_TYPES = {
+    "MERCADO": ('market', None), "LÍMITE": ('limit', 'limit_price'), "STOP": ('stop', 'stop_price'),
+    "TAKE-PROFIT": ('limit', 'limit_price'), "STOP-LOSS": ('stop', 'stop_price'),
+}
+ORDER_LABELS = {'market': "MERCADO", 'limit': "LÍMITE", 'stop': "STOP"}
+
+def order_terms(label, trigger):
+    kind, field = ORDER_TYPES[label]
+    if kind == 'market': return {}
+    if not trigger > 0: raise ValueError("Indica un precio de disparo.")
+    return {'type': kind, field: float(trigger)}
+
+def place_order(side, **order):
+    # Un client_order_id por intención de orden (lado, símbolo y condiciones):
+    # repetir el clic mientras la anterior sigue en curso devuelve esa misma
+    # orden en vez de duplicarla; otra orden, o la misma ya terminada, lleva id nuevo.
+    # Las órdenes en reposo reservan antes de enviarse lo que gastarán. Se
+    # vuelve nada más encolarla; el resultado llega por live_order_updates.
+    gateway = get_broker_gateway()
+    user, ticker = st.session_state['user_current'], st.session_state['ticker_actual']
+    resting = order.get('type', 'market') != 'market'
+    intent = (side, ticker) + tuple(sorted(order.items()))
+    intents = st.session_state.setdefault('order_intents', {})
+    previous = gateway.get(intents.get(intent))
+    if previous is None or previous.is_final or (resting and previous.accepted.is_set()):
+        intents[intent] = timed_import('broker_gateway').new_order_id()
+    # Solo se recuerdan las intenciones con la orden aún en curso
+    for k in [k for k, cid in intents.items() if k != intent and (gateway.get(cid) is None or gateway.get(cid).is_final)]:
+        del intents[k]
+    cid = intents[intent]
+    if resting: get_ledger().hold(cid, user, ticker, cash=order.get('notional') or 0.0, qty=order.get('qty') or 0.0)
+    ticket = gateway.submit(user, ticker, side, client_order_id=cid, **order)
+    sent = st.session_state.setdefault('orders_sent', [])
+    if cid not in sent: sent.append(cid)
+    return ticket
+
+def report_order(ticket):
+    # Mensaje del panel según el estado de la orden; True si quedó ejecutada y apuntada
+    if ticket.status == 'filled' and not ticket.error:
+        st.success("ORDEN EJECUTADA")
+        return True
+    if not ticket.is_final and ticket.type != 'market':
+        st.info(f"ORDEN {ORDER_LABELS.get(ticket.type, ticket.type)} ENVIADA a ${ticket.trigger:,.2f}: se ejecutará cuando el precio la cruce.")
+    elif not ticket.is_final: st.info("ORDEN ENVIADA: se apuntará en el libro al ejecutarse.")
+    else: st.error(ticket.error or f"Orden no ejecutada ({ticket.status}).")
+    return False
+
+def show_order_notices():
+    # Avisos de órdenes cerradas desde el último repintado (ver live_order_updates)
+    for ok, msg in st.session_state.pop('order_notices', []):
+        st.toast(msg, icon="✅" if ok else "⚠️")
+
+def render_open_orders(user):
+    # Órdenes en reposo del usuario (todas sus sesiones) con cancelación
+    gateway = get_broker_gateway()
+    orders = gateway.open_for(user)
+    if not orders: return
+    st.markdown("#### ⏳ ÓRDENES ACTIVAS")
+    for t in orders:
+        c_txt, c_btn = st.columns([5, 1])
+        size = f"{t.qty:.4f} acc." if t.qty is not None else f"${t.notional:,.2f}"
+        trigger = f" · disparo ${t.trigger:,.2f}" if t.trigger is not None else ""
+        c_txt.caption(f"{t.side} {ORDER_LABELS.get(t.type, t.type)} {t.symbol} · {size}{trigger} · {t.status}")
+        if c_btn.button("CANCELAR", key=f"cancel_{t.client_order_id}", use_container_width=True):
+            gateway.cancel(t.client_order_id)
+            st.toast(f"Cancelación enviada: {t.symbol}")
+
+# Screener: todo el universo puntuado en una sola pasada vectorizada
+@traced_cache('run_screener')
+@st.cache_data(ttl=300)
+def run_screener(symbols):
+    mark_miss()
+    # La descarga masiva cede el paso a cotizaciones interactivas
+    with fetch_priority(CHART): return timed_import('screener').screen(get_bar_store(), list(symbols))
 
 # Función de Estrategia (sin cache, usa datos pasados)
 def generate_strategy(df, sent_score):
@@ -288,6 +350,229 @@ def set_ticker(t):
     st.session_state['ticker_actual'] = t
     st.rerun()
 
+# ==========================================
+# 5. PRECARGA PARALELA DE DATOS POR RERUN
+# ==========================================
+# Todas las peticiones de la página arrancan a la vez al inicio del script;
+# cada sección espera solo su future, así la latencia en frío es la de la
+# llamada más lenta y no la suma de todas.
+@st.cache_resource
+def get_prefetch_pool():
+    return ThreadPoolExecutor(max_workers=16, thread_name_prefix='prefetch')
+
+def _run_with_ctx(ctx, fn, *args):
+    # Los hilos del pool se reutilizan: se enlaza el contexto de la sesión actual
+    if ctx is not None: add_script_run_ctx(threading.current_thread(), ctx)
+    return fn(*args)
+
+def _fetch_snapshot(ticker):
+    # Ticker actual + EXPLORADOR en un solo lote; el snapshot sale de esa caché
+    get_quote_table([ticker] + WATCHLIST)
+    return get_market_snapshot(ticker)
+
+def _load_snapshot(ticker):
+    # Los errores no se guardan: el siguiente rerun vuelve a intentarlo
+    quote_ttl = timed_import('quotes').QUOTE_TTL
+    return get_shared_cache().get_or_compute(
+        'snapshot', (ticker,), lambda: _fetch_snapshot(ticker), ttl=quote_ttl, stale_ttl=5 * quote_ttl
+    )
+
+def prefetch_page_data(ticker, timeframe):
+    pool, ctx = get_prefetch_pool(), get_script_run_ctx()
+    return {
+        'timeframe': timeframe,
+        'snapshot': pool.submit(_run_with_ctx, ctx, _load_snapshot, ticker),
+        'analysis': pool.submit(_run_with_ctx, ctx, get_ai_analysis, ticker),
+        'chart': pool.submit(_run_with_ctx, ctx, get_chart_data, ticker, timeframe),
+    }
+
+# ==========================================
+# 5a. PRECALENTAMIENTO (CONJUNTO CALIENTE)
+# ==========================================
+# Un hilo por proceso refresca, antes de que caduquen, análisis, snapshot y
+# gráfico de los símbolos más visitados más el EXPLORADOR, dentro de un
+# presupuesto de llamadas por minuto (warmup.py, TITANIUM_WARMUP_BUDGET).
+WARMUP_AHEAD = 0.8   # se refresca al 80 % de la vida de cada entrada
+
+def _due(namespace, key_parts, ttl):
+    age = get_shared_cache().age(namespace, key_parts)
+    return age is None or age >= ttl * WARMUP_AHEAD
+
+def warm_quotes(symbols):
+    # Precios de todo el conjunto en un solo lote; los snapshots salen de esa caché
+    quote_ttl = timed_import('quotes').QUOTE_TTL
+    due = [s for s in symbols if _due('snapshot', (s,), quote_ttl)]
+    if not due: return
+    get_quote_engine().refresh_prices(due)
+    for s in due:
+        try:
+            get_shared_cache().refresh('snapshot', (s,), lambda s=s: get_market_snapshot(s), ttl=quote_ttl, stale_ttl=5 * quote_ttl)
+        except Exception as e:
+            print(f"Sin snapshot para {s}: {e}")
+
+def warm_symbol(symbol, timeframes):
+    analysis, shared = timed_import('analysis'), get_shared_cache()
+    if _due('analysis', (symbol,), analysis.TECH_TTL):
+        # Primero las etapas internas (sus propias cachés), luego el resultado compartido
+        get_analysis_pipeline().refresh_due(symbol, WARMUP_AHEAD)
+        shared.refresh('analysis', (symbol,), lambda: get_analysis_pipeline().analyze(symbol),
+                       ttl=analysis.TECH_TTL, stale_ttl=analysis.NEWS_TTL, store_if=_analysis_complete)
+    for tf in timeframes:
+        if _due('chart', (symbol, tf), CHART_TTL):
+            shared.refresh('chart', (symbol, tf), lambda tf=tf: _load_chart_data(symbol, tf), ttl=CHART_TTL, stale_ttl=CHART_STALE)
+
+@st.cache_resource
+def get_warmup():
+    warmup = timed_import('warmup')
+    scheduler = warmup.WarmupScheduler(warm_symbol, prepare=warm_quotes, seeds=WATCHLIST, default_timeframe='1y')
+    telemetry.register_collector('warmup', lambda: {
+        ('warmup_hot_set', ()): scheduler.last_hot_size,
+        ('warmup_budget_remaining', ()): scheduler.remaining(),
+    })
+    return scheduler
+
+def track_view(ticker, timeframe):
+    # Una visita por cambio de vista (no por cada rerun de la misma página)
+    view = (ticker, timeframe)
+    if st.session_state.get('last_view') != view:
+        st.session_state['last_view'] = view
+        get_warmup().touch(ticker, timeframe)
+
+# ==========================================
+# 5b. TELEMETRÍA (PANEL DE ADMINISTRADOR)
+# ==========================================
+# Tramos, cachés y llamadas al proveedor de este worker. El mismo registro se
+# sirve en texto Prometheus en http://127.0.0.1:TITANIUM_METRICS_PORT/metrics.
+ADMIN_USERS = {'admin'}
+
+@st.cache_resource
+def get_metrics_server():
+    return telemetry.start_http_server()
+
+def render_telemetry_panel():
+    reg = telemetry.REGISTRY
+    server = get_metrics_server()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/metrics" if server else "desactivado"
+    col_m, col_r = st.columns([4, 1])
+    col_m.caption(f"Modo: {reg.mode.upper()} · activo hace {reg.snapshot()['uptime'] / 60:.0f} min · endpoint: {endpoint}")
+    if col_r.button("REINICIAR", key="btn_tel_reset", use_container_width=True):
+        reg.reset()
+        st.rerun()
+    if not reg.enabled:
+        st.info("Telemetría desactivada (TITANIUM_TELEMETRY=off).")
+        return
+
+    pd = timed_import('pandas')
+    st.markdown("##### TRAMOS")
+    st.dataframe(pd.DataFrame(reg.spans_table()), use_container_width=True, hide_index=True)
+    c_cache, c_up = st.columns(2)
+    with c_cache:
+        st.markdown("##### CACHÉS")
+        st.dataframe(pd.DataFrame(reg.cache_table()), use_container_width=True, hide_index=True)
+    with c_up:
+        st.markdown("##### PROVEEDOR (UPSTREAM)")
+        st.dataframe(pd.DataFrame(reg.upstream_table()), use_container_width=True, hide_index=True)
+    if reg.mode == 'full':
+        st.markdown("##### ÚLTIMOS TRAMOS")
+        recent = pd.DataFrame(reg.snapshot()['recent'][-100:][::-1])
+        if not recent.empty: recent['ts'] = pd.to_datetime(recent['ts'], unit='s')
+        st.dataframe(recent, use_container_width=True, hide_index=True)
+
+# ==========================================
+# 5c. FRAGMENTOS EN VIVO (CABECERA Y POSICIÓN)
+# ==========================================
+# Se refrescan solos cada LIVE_REFRESH segundos leyendo del feed, sin volver
+# a ejecutar el resto del script (gráfico, paneles, noticias).
+@st.fragment(run_every=LIVE_REFRESH)
+def live_position_metrics(ticker, snapshot):
+    with span('render.live_metrics'):
+        lp, _, price_ok, _ = current_price(ticker, snapshot)
+        user = st.session_state['user_current']
+        liquidez_usd = get_ledger().cash(user)
+        pf = get_portfolio(user)
+        # Todas las posiciones en una sola petición en lote (caché de QUOTE_TTL);
+        # el activo abierto usa además el precio en vivo
+        if pf.symbols:
+            quotes = get_quote_table(pf.symbols)
+            pf.update_prices(quotes.index, quotes['price'].to_numpy())
+        if price_ok: pf.update_quote(ticker, lp)
+        current_qty = pf.quantity(ticker)
+        cartera = pf.summary(liquidez_usd)
+
+        # Mostrar liquidez_usd y el valor de la posición actual
+        st.metric("LIQUIDEZ USD", f"${liquidez_usd:,.2f}")
+        st.metric("POSICIÓN VALORIZADA", f"${current_qty * lp:,.2f}" if price_ok else "N/D")
+        st.metric(f"UNIDADES {ticker}", f"{current_qty:.4f}") # POSICIÓN ESPECÍFICA
+        st.metric("VALOR CARTERA TOTAL", f"${cartera['equity']:,.2f}",
+                  delta=f"{cartera['unrealized']:+,.2f} ({cartera['unrealized_pct']:+.2f}%) P&L" if pf.symbols else None)
+        if cartera['missing']: st.caption(f"Sin precio (fuera del total): {', '.join(pf.missing())}")
+        if pf.symbols:
+            with st.expander(f"POSICIONES ({len(pf.symbols)})"):
+                st.dataframe(pf.table(), use_container_width=True, column_config={
+                    'qty': st.column_config.NumberColumn("Unid.", format="%.4f"),
+                    'price': st.column_config.NumberColumn("Precio", format="$%.2f"),
+                    'value': st.column_config.NumberColumn("Valor", format="$%.2f"),
+                    'cost': None,
+                    'pnl': st.column_config.NumberColumn("P&L", format="$%.2f"),
+                    'pnl_pct': st.column_config.NumberColumn("P&L %", format="%.2f%%"),
+                    'weight': st.column_config.NumberColumn("Peso", format="%.1f%%"),
+                })
+
+@st.fragment(run_every=LIVE_REFRESH)
+def live_order_updates():
+    # Órdenes enviadas desde esta sesión: al cerrarse se deja el aviso y se
+    # repinta la app entera (saldos, límites del panel y órdenes activas)
+    sent = st.session_state.get('orders_sent')
+    if not sent: return
+    gateway = get_broker_gateway()
+    notices = st.session_state.setdefault('order_notices', [])
+    closed = False
+    for cid in list(sent):
+        ticket = gateway.get(cid)
+        if ticket is not None and not ticket.is_final: continue
+        sent.remove(cid)
+        closed = True
+        if ticket is None or ticket.status == 'canceled': continue
+        if ticket.status == 'filled' and not ticket.error:
+            notices.append((True, f"ORDEN EJECUTADA: {ticket.side} {ticket.symbol} a ${ticket.filled_avg_price:,.2f}"))
+        else:
+            notices.append((False, ticket.error or f"Orden {ticket.symbol} no ejecutada ({ticket.status})."))
+    if closed: st.rerun()
+
+@st.fragment(run_every=LIVE_REFRESH)
+def live_header(ticker, snapshot):
+    with span('render.live_header'):
+        lp, chg_pct, price_ok, age = current_price(ticker, snapshot)
+        current_qty = get_ledger().position(st.session_state['user_current'], ticker)
+        col_cls = "bg-up" if chg_pct >= 0 else "bg-down"
+        txt_cls = "text-up" if chg_pct >= 0 else "text-down"
+        sign = "+" if chg_pct >= 0 else ""
+        price_txt = f"${lp:,.2f}" if price_ok else "—"
+        change_txt = f"{sign}{chg_pct:.2f}%" if price_ok else "SIN DATOS"
+        live_txt = f"● EN VIVO · hace {age:.0f} s" if age is not None else ""
+
+        st.markdown(f"""
+        <div class="live-header">
+            <div style="display:flex; justify-content:space-between; align-items:flex-end;">
+                <div>
+                    <h1 class="ticker-name">{ticker}</h1>
+                    <div class="company-name">{snapshot['name']}</div>
+                    <div style='font-family: Roboto Mono; font-size: 1.1rem; color: #888; margin-top: 5px;'>
+                        POSICIÓN ACTUAL: {current_qty:.4f} {ticker}
+                    </div>
+                </div>
+                <div>
+                    <div class="live-price {txt_cls}">{price_txt}</div>
+                    <div style="text-align:right;">
+                        <span class="price-change {col_cls}">{change_txt}</span>
+                    </div>
+                    <div style="text-align:right; color:#888; font-size:0.75rem; margin-top:4px;">{live_txt}</div>
+                </div>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+        if not price_ok: st.error(f"Cotización no disponible — {snapshot['error']}")
+
 # ==========================================
 # 7. FUNCIÓN DE LOGIN
 # ==========================================
@@ -301,7 +586,7 @@ def login_screen():
     # Si la sesión viene de localStorage (del script JS inyectado)
     if st.session_state.get('session_data') and st.session_state['session_data'] != 'False':
         saved_user = st.session_state['session_data']
-        if saved_user in st.session_state['db_users']:
+        if get_user_store().exists(saved_user):
             st.session_state['authenticated'] = True
             st.session_state['user_current'] = saved_user
             return # Salir del login y proceder a main_app
@@ -326,8 +611,7 @@ def login_screen():
             
             st.markdown("<br>", unsafe_allow_html=True)
             if st.button("INICIAR SESIÓN", use_container_width=True, type="primary"):
-                db = load_users()
-                if user in db and check_hashes(pw, db[user]):
+                if get_user_store().authenticate(user, pw):
                     st.session_state['authenticated'] = True
                     st.session_state['user_current'] = user
                     # Llamar a JS para guardar sesión
@@ -343,14 +627,16 @@ def login_screen():
             cp = st.text_input("CONFIRMAR CLAVE", type="password", key="cp", placeholder="Repita la clave")
 
             if st.button("REGISTRAR PERFIL SEGURO", use_container_width=True):
-                db = load_users()
-                if nu in db: st.error("Error: El ID de perfil ya existe.")
+                users = get_user_store()
+                if users.exists(nu): st.error("Error: El ID de perfil ya existe.")
                 elif len(np) < 6: st.error("Error: La clave debe tener al menos 6 caracteres.")
                 elif np != cp: st.error("Error: Las claves no coinciden.")
                 else:
-                    db[nu] = hashlib.sha256(str.encode(np)).hexdigest()
-                    save_users(db)
-                    st.success("¡Perfil creado con éxito! Inicie sesión.")
+                    try:
+                        users.create(nu, np)
+                        st.success("¡Perfil creado con éxito! Inicie sesión.")
+                    except UserExists as e:
+                        st.error(str(e))
             st.caption("Su clave se guarda con cifrado SHA-256.")
 
 # ==========================================
@@ -359,38 +645,37 @@ def login_screen():
 def main_app():
     # El estado persistente ya fue inicializado al inicio del script.
 
-    COMMISSION_RATE = 0.0015 
-    
+    # Precarga concurrente: snapshot, análisis y gráfico del rango actual
+    prefetch = prefetch_page_data(st.session_state['ticker_actual'], st.session_state.get('tf_selector', '1y'))
+    track_view(st.session_state['ticker_actual'], prefetch['timeframe'])
+
     # Datos de Market Snapshot (Precios Vivos)
-    lp, chg_pct, long_name, _ = get_market_snapshot(st.session_state['ticker_actual'])
-    
-    # Datos para Gráficos e IA (Caché)
-    df_analysis, news_list, sent_score = get_ai_analysis(st.session_state['ticker_actual'])
+    # Si el proveedor falla no se inventa un precio: se avisa y se bloquea la operativa
+    current_ticker = st.session_state['ticker_actual']
+    get_price_feed().subscribe(current_ticker)
+    snapshot = {'price': float('nan'), 'pct': 0.0, 'name': current_ticker, 'error': None}
+    try:
+        with span('wait.snapshot'): snapshot['price'], snapshot['pct'], snapshot['name'], _ = prefetch['snapshot'].result()
+    except Exception as e:
+        snapshot['error'] = describe_error(e)
+    # Precio de las operaciones: el más reciente del feed o el del snapshot
+    lp, chg_pct, price_ok, _ = current_price(current_ticker, snapshot)
     
     # Lógica de Operativa
-    current_ticker = st.session_state['ticker_actual']
     # Obtener cantidad de la posición actual de forma segura
-    current_qty = st.session_state['posiciones'].get(current_ticker, 0.0)
-
-    try:
-        valor_posicion = current_qty * lp
-        equity = st.session_state['liquidez_usd'] + valor_posicion
-    except:
-        valor_posicion = 0.0
-        equity = st.session_state['liquidez_usd']
+    ledger, user = get_ledger(), st.session_state['user_current']
+    # Disponible para nuevas órdenes: sin lo reservado por las órdenes en reposo
+    liquidez_usd = ledger.available_cash(user)
+    current_qty = ledger.available_qty(user, current_ticker)
 
     # --- BARRA LATERAL ---
-    with st.sidebar:
+    with st.sidebar, span('render.sidebar'):
         st.markdown("### 💠 TITANIUM")
         curr_t = st.text_input("BUSCAR ACTIVO", value=st.session_state['ticker_actual']).upper().strip()
         if curr_t != st.session_state['ticker_actual']: set_ticker(curr_t)
         
         st.markdown("---")
-        # Mostrar liquidez_usd y el valor de la posición actual
-        st.metric("LIQUIDEZ USD", f"${st.session_state['liquidez_usd']:,.2f}")
-        st.metric("POSICIÓN VALORIZADA", f"${valor_posicion:,.2f}")
-        st.metric(f"UNIDADES {current_ticker}", f"{current_qty:.4f}") # POSICIÓN ESPECÍFICA
-        st.metric("VALOR CARTERA TOTAL", f"${equity:,.2f}")
+        live_position_metrics(current_ticker, snapshot)
         
         st.markdown("---")
         if st.button("CERRAR SESIÓN"):
@@ -403,38 +688,13 @@ def main_app():
     # CUERPO PRINCIPAL
     # ==========================
     
-    # 1. HEADER (Live Ticker)
-    col_cls = "bg-up" if chg_pct >= 0 else "bg-down"
-    txt_cls = "text-up" if chg_pct >= 0 else "text-down"
-    sign = "+" if chg_pct >= 0 else ""
-
-    st.markdown(f"""
-    <div class="live-header">
-        <div style="display:flex; justify-content:space-between; align-items:flex-end;">
-            <div>
-                <h1 class="ticker-name">{st.session_state['ticker_actual']}</h1>
-                <div class="company-name">{long_name}</div>
-                <div style='font-family: Roboto Mono; font-size: 1.1rem; color: #888; margin-top: 5px;'>
-                    POSICIÓN ACTUAL: {current_qty:.4f} {st.session_state['ticker_actual']}
-                </div>
-            </div>
-            <div>
-                <div class="live-price {txt_cls}">${lp:,.2f}</div>
-                <div style="text-align:right;">
-                    <span class="price-change {col_cls}">{sign}{chg_pct:.2f}%</span>
-                </div>
-            </div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    # 1. HEADER (Live Ticker): fragmento con refresco propio
+    live_header(current_ticker, snapshot)
+    show_order_notices()
 
     # 2. SELECTOR DE CATEGORÍAS
     with st.expander("📁 EXPLORADOR DE ACTIVOS", expanded=False):
-        cats = {
-            "🔥 TENDENCIA": ["NVDA", "TSLA", "AAPL", "MSFT", "AMZN"],
-            "₿ CRIPTO": ["BTC-USD", "ETH-USD", "SOL-USD", "DOGE-USD"],
-            "💱 FOREX": ["EURUSD=X", "JPY=X", "GBPUSD=X"]
-        }
+        cats = WATCHLIST_CATEGORIES
         cols_cat = st.columns(len(cats))
         for i, (k, v) in enumerate(cats.items()):
             with cols_cat[i]:
@@ -445,10 +705,13 @@ def main_app():
     st.markdown("<br>", unsafe_allow_html=True)
 
     # 3. PESTAÑAS PRINCIPALES
-    tab_chart, tab_ai = st.tabs(["📊 GRÁFICO & OPERACIONES", "🧠 ANÁLISIS ESTRATÉGICO"])
+    tab_names = ["📊 GRÁFICO & OPERACIONES", "🧠 ANÁLISIS ESTRATÉGICO", "🔎 SCREENER"]
+    is_admin = user in ADMIN_USERS
+    if is_admin: tab_names.append("📈 TELEMETRÍA")
+    tab_chart, tab_ai, tab_scr, *tab_tel = st.tabs(tab_names)
 
     # --- PESTAÑA GRÁFICO & OPERATIVA UNIFICADA ---
-    with tab_chart:
+    with tab_chart, span('render.chart'):
         col_tf, col_sp = st.columns([2, 4])
         with col_tf:
             timeframe = st.select_slider(
@@ -457,23 +720,40 @@ def main_app():
                 value='1y', 
                 key='tf_selector'
             )
+        with col_sp:
+            # AUTO: la serie se reduce en el servidor al presupuesto de píxeles
+            render_mode = st.radio("RENDER", ["AUTO", "COMPLETO"], horizontal=True, key='render_mode')
         
-        df_chart = get_chart_data(st.session_state['ticker_actual'], timeframe)
+        chart_error = None
+        try:
+            if timeframe == prefetch['timeframe']:
+                with span('wait.chart'): df_chart = prefetch['chart'].result()
+            else: df_chart = get_chart_data(st.session_state['ticker_actual'], timeframe)
+        except Exception as e:
+            df_chart, chart_error = None, describe_error(e)
         
-        if df_chart is not None and not df_chart.empty:
+        if chart_error:
+            st.error(f"Gráfico no disponible — {chart_error}")
+        elif df_chart is not None and not df_chart.empty:
             color_chart = '#34a853' if chg_pct >= 0 else '#ea4335'
             fill_chart = 'rgba(52, 168, 83, 0.1)' if chg_pct >= 0 else 'rgba(234, 67, 53, 0.1)'
             
-            fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_width=[0.2, 0.8])
-            
-            fig.add_trace(go.Scatter(x=df_chart.index, y=df_chart['Close'], mode='lines', fill='tozeroy', line=dict(color=color_chart, width=2), fillcolor=fill_chart, name='Precio'), row=1, col=1)
-            fig.add_trace(go.Bar(x=df_chart.index, y=df_chart['Volume'], marker_color='#555', name='Volumen', opacity=0.3), row=2, col=1)
+            charting = timed_import('charting')
+            go, make_subplots = timed_import('plotly.graph_objects'), timed_import('plotly.subplots').make_subplots
+            df_plot = charting.downsample_ohlcv(df_chart, charting.PIXEL_BUDGET) if render_mode == "AUTO" else df_chart
+            Line = charting.line_trace_class(len(df_plot))
             
-            fig.update_layout(template="plotly_dark", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', height=500, margin=dict(l=0, r=0, t=10, b=0), showlegend=False, hovermode="x unified", xaxis_rangeslider_visible=False)
-            fig.update_xaxes(showgrid=False, row=1, col=1)
-            fig.update_yaxes(showgrid=True, gridcolor='rgba(255,255,255,0.05)', side="right", row=1, col=1)
+            with span('render.chart.figure', points=len(df_plot)):
+                fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_width=[0.2, 0.8])
+                
+                fig.add_trace(Line(x=df_plot.index, y=df_plot['Close'], mode='lines', fill='tozeroy', line=dict(color=color_chart, width=2), fillcolor=fill_chart, name='Precio'), row=1, col=1)
+                fig.add_trace(go.Bar(x=df_plot.index, y=df_plot['Volume'], marker_color='#555', name='Volumen', opacity=0.3), row=2, col=1)
+                
+                fig.update_layout(template="plotly_dark", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', height=500, margin=dict(l=0, r=0, t=10, b=0), showlegend=False, hovermode="x unified", xaxis_rangeslider_visible=False)
+                fig.update_xaxes(showgrid=False, row=1, col=1)
+                fig.update_yaxes(showgrid=True, gridcolor='rgba(255,255,255,0.05)', side="right", row=1, col=1)
             
-            st.plotly_chart(fig, use_container_width=True)
+            with span('render.chart.plotly'): st.plotly_chart(fig, use_container_width=True)
         else:
             st.warning("Datos no disponibles para este rango.")
 
@@ -483,15 +763,20 @@ def main_app():
         
         c_b, c_s = st.columns(2)
         
-        with c_b:
+        with c_b, span('render.trade_panel.buy'):
             with st.container(border=True):
                 st.markdown("<h3 style='color:#34a853'>COMPRAR</h3>", unsafe_allow_html=True)
                 # LÍMITE: liquidez_usd
-                amount = st.number_input("Monto a invertir ($)", 0.0, st.session_state['liquidez_usd'], step=100.0, key="buy_amount_input")
+                amount = st.number_input("Monto a invertir ($)", 0.0, liquidez_usd, step=100.0, key="buy_amount_input")
+                buy_type = st.radio("Tipo de orden", ["MERCADO", "LÍMITE", "STOP"], horizontal=True, key="buy_order_type")
+                buy_trigger = None
+                if buy_type != "MERCADO":
+                    buy_trigger = st.number_input("Precio de disparo ($)", 0.0, value=float(lp) if price_ok else 0.0, step=0.01, format="%.2f", key="buy_trigger_price")
                 
                 fee = amount * COMMISSION_RATE
                 total_cost = amount 
-                shares = (amount - fee) / lp if lp > 0 else 0
+                ref_price = buy_trigger or lp
+                shares = (amount - fee) / ref_price if ref_price > 0 else 0
                 
                 st.markdown(f"""
                 <div style='display:flex; justify-content:space-between; color:#888; font-size:0.9rem;'>
@@ -502,19 +787,16 @@ def main_app():
                 </div>
                 """, unsafe_allow_html=True)
                 
-                if st.button("CONFIRMAR COMPRA", key="btn_buy", use_container_width=True, type="primary"):
-                    if amount > 0 and st.session_state['liquidez_usd'] >= total_cost:
-                        st.session_state['liquidez_usd'] -= total_cost
-                        # --- MODIFICACIÓN CLAVE DE ESTADO ---
-                        st.session_state['posiciones'][current_ticker] = current_qty + shares
-                        st.session_state['historial'].append(f"BUY {shares:.4f} {st.session_state['ticker_actual']} @ ${lp:.2f}")
-                        st.success("ORDEN EJECUTADA")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                         st.error("Fondos insuficientes.")
-
-        with c_s:
+                if st.button("CONFIRMAR COMPRA", key="btn_buy", use_container_width=True, type="primary", disabled=not price_ok):
+                    try:
+                        if not (amount > 0 and shares > 0): raise InsufficientFunds("Fondos insuficientes.")
+                        # --- ORDEN POR LA PASARELA (la ejecución se apunta en el libro) ---
+                        if report_order(place_order('BUY', notional=total_cost, **order_terms(buy_type, buy_trigger))):
+                            st.rerun()
+                    except ValueError as e:   # InsufficientFunds o precio de disparo inválido
+                         st.error(str(e))
+
+        with c_s, span('render.trade_panel.sell'):
             with st.container(border=True):
                 st.markdown("<h3 style='color:#ea4335'>VENDER</h3>", unsafe_allow_html=True)
                 
@@ -522,6 +804,10 @@ def main_app():
                 
                 # Input de cantidad (Límite máximo la posición actual)
                 qty = col_qty.number_input("Cantidad acciones", 0.0, current_qty, step=0.0001, key="sell_qty_input")
+                sell_type = st.radio("Tipo de orden", ["MERCADO", "TAKE-PROFIT", "STOP-LOSS"], horizontal=True, key="sell_order_type")
+                sell_trigger = None
+                if sell_type != "MERCADO":
+                    sell_trigger = st.number_input("Precio de disparo ($)", 0.0, value=float(lp) if price_ok else 0.0, step=0.01, format="%.2f", key="sell_trigger_price")
                 
                 # Lógica de Botón Venta Total (Trigger)
                 if col_all.button("TODO", key="btn_sell_all", use_container_width=True):
@@ -538,7 +824,7 @@ def main_app():
                     qty_to_sell = qty 
 
                 # Calcular costos (usando qty_to_sell)
-                gross = qty_to_sell * lp
+                gross = qty_to_sell * (sell_trigger or lp) if price_ok else 0.0
                 fee_s = gross * COMMISSION_RATE
                 net = gross - fee_s
                 
@@ -551,78 +837,141 @@ def main_app():
                 </div>
                 """, unsafe_allow_html=True)
                 
-                if st.button("CONFIRMAR VENTA", key="btn_sell", use_container_width=True):
+                if st.button("CONFIRMAR VENTA", key="btn_sell", use_container_width=True, disabled=not price_ok):
                     
                     # Validación estricta
-                    if qty_to_sell > 0 and current_qty >= qty_to_sell: 
-                        st.session_state['liquidez_usd'] += net
-                        # --- MODIFICACIÓN CLAVE DE ESTADO ---
-                        st.session_state['posiciones'][current_ticker] = current_qty - qty_to_sell
-                        st.session_state['historial'].append(f"SELL {qty_to_sell:.4f} {st.session_state['ticker_actual']} @ ${lp:.2f}")
-                        st.success("ORDEN EJECUTADA")
+                    try:
+                        if not (qty_to_sell > 0 and lp > 0): raise InsufficientFunds("Cantidad insuficiente para vender.")
+                        # --- ORDEN POR LA PASARELA (la ejecución se apunta en el libro) ---
+                        filled = report_order(place_order('SELL', qty=qty_to_sell, **order_terms(sell_type, sell_trigger)))
                         
-                        # Resetear la bandera y el input después de la venta exitosa
+                        # Resetear la bandera y el input después de la venta
                         st.session_state['liquidar_todo'] = False 
-                        st.rerun()
-                    else:
-                        st.error("Cantidad insuficiente para vender.")
+                        if filled: st.rerun()
+                    except ValueError as e:   # InsufficientFunds o precio de disparo inválido
+                        st.error(str(e))
                         st.session_state['liquidar_todo'] = False # Asegurar que la bandera se resetee en fallo
 
+        live_order_updates()
+        render_open_orders(st.session_state['user_current'])
+
     # --- PESTAÑA CEREBRO QUANTUM & NOTICIAS ---
-    with tab_ai:
-        prob, sent_val, news = get_ai_analysis(st.session_state['ticker_actual'])
+    with tab_ai, span('render.analysis'):
+        analysis_error = None
+        try:
+            with span('wait.analysis'): prob, sent_val, news, inputs = prefetch['analysis'].result()
+            if inputs and all(v.get('status') == 'missing' for v in inputs.values()):
+                # Sin ninguna entrada el score sería un 50 inventado
+                analysis_error = describe_inputs(inputs)
+        except Exception as e:
+            analysis_error = describe_error(e)
         
-        col_gauge, col_info = st.columns([1, 1.5])
+        if analysis_error:
+            st.error(f"Análisis no disponible — {analysis_error}")
+        else:
+            col_gauge, col_info = st.columns([1, 1.5])
         
-        with col_gauge:
-            st.markdown(f"""
-            <div class='ai-container' style='text-align: center;'>
-                <div style='color:#888; font-size:0.9rem; font-weight:700;'>PROBABILIDAD DE ÉXITO (ALZA)</div>
-                <div class='probability-score' style='color: {"#34a853" if prob > 60 else "#ea4335" if prob < 40 else "#fbbc04"};'>
-                    {prob:.1f}%
-                </div>
-                <div style='margin-top:10px; font-weight:bold; color:#fff;'>
-                    {"COMPRA FUERTE" if prob > 70 else "COMPRA" if prob > 55 else "VENTA FUERTE" if prob < 30 else "NEUTRAL"}
+            with col_gauge:
+                st.markdown(f"""
+                <div class='ai-container' style='text-align: center;'>
+                    <div style='color:#888; font-size:0.9rem; font-weight:700;'>PROBABILIDAD DE ÉXITO (ALZA)</div>
+                    <div class='probability-score' style='color: {"#34a853" if prob > 60 else "#ea4335" if prob < 40 else "#fbbc04"};'>
+                        {prob:.1f}%
+                    </div>
+                    <div style='margin-top:10px; font-weight:bold; color:#fff;'>
+                        {"COMPRA FUERTE" if prob > 70 else "COMPRA" if prob > 55 else "VENTA FUERTE" if prob < 30 else "NEUTRAL"}
+                    </div>
                 </div>
-            </div>
-            """, unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
             
-            st.info(f"""
-            **Análisis de Fusión:**
-            El algoritmo ha detectado un sentimiento de noticias de **{sent_val:.0f}/100** y señales técnicas combinadas que resultan en este score.
-            """)
-
-        with col_info:
-            st.markdown("#### 📰 NOTICIAS ANALIZADAS")
-            if news:
-                for n in news:
-                    b_col = "#34a853" if n['label']=="POSITIVO" else "#ea4335" if n['label']=="NEGATIVO" else "#555"
+                st.info(f"""
+                **Análisis de Fusión:**
+                El algoritmo ha detectado un sentimiento de noticias de **{sent_val:.0f}/100** y señales técnicas combinadas que resultan en este score.
+                """)
+                if inputs: st.caption(f"Entradas usadas — {describe_inputs(inputs)}")
+
+            with col_info, span('render.news'):
+                st.markdown("#### 📰 NOTICIAS ANALIZADAS")
+                if news:
+                    for n in news:
+                        b_col = "#34a853" if n['label']=="POSITIVO" else "#ea4335" if n['label']=="NEGATIVO" else "#555"
                     
-                    # Verificar si existe link, sino usar #
-                    link_url = n.get('link', '#')
+                        # Verificar si existe link, sino usar #
+                        link_url = n.get('link', '#')
                     
-                    st.markdown(f"""
-                    <div style='border-left: 3px solid {b_col}; padding-left: 10px; margin-bottom: 10px; background: rgba(255,255,255,0.03); padding: 10px; border-radius: 0 5px 5px 0;'>
-                        <div style='display:flex; justify-content:space-between;'>
-                            <span style='font-size:0.75rem; font-weight:bold; color:{b_col};'>{n['label']}</span>
-                            <span style='font-size:0.7rem; color:#888;'>{n.get('publisher', 'Yahoo Finance')}</span>
-                        </div>
-                        <div style='color:#eee; font-weight:600; margin-top:3px;'>
-                            <a href="{link_url}" target="_blank" style="text-decoration:none; color:#eee;">{n['title']}</a>
+                        st.markdown(f"""
+                        <div style='border-left: 3px solid {b_col}; padding-left: 10px; margin-bottom: 10px; background: rgba(255,255,255,0.03); padding: 10px; border-radius: 0 5px 5px 0;'>
+                            <div style='display:flex; justify-content:space-between;'>
+                                <span style='font-size:0.75rem; font-weight:bold; color:{b_col};'>{n['label']}</span>
+                                <span style='font-size:0.7rem; color:#888;'>{n.get('publisher', 'Yahoo Finance')}</span>
+                            </div>
+                            <div style='color:#eee; font-weight:600; margin-top:3px;'>
+                                <a href="{link_url}" target="_blank" style="text-decoration:none; color:#eee;">{n['title']}</a>
+                            </div>
                         </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-            else:
-                st.write("Sin noticias recientes relevantes o error de conexión.")
+                        """, unsafe_allow_html=True)
+                else:
+                    st.write("Sin noticias recientes relevantes o error de conexión.")
+        
         
         # --- LOGS ---
         st.markdown("---")
         st.markdown("#### AUDITORÍA DE TRANSACCIONES")
-        if st.session_state['historial']:
-            for h in reversed(st.session_state['historial']):
-                st.code(h, language="text")
+        with span('render.audit'):
+            total_fills = ledger.count_fills(user)
+            if total_fills:
+                AUDIT_PAGE = 20
+                audit_pages = (total_fills - 1) // AUDIT_PAGE + 1
+                col_ap, col_at = st.columns([1, 3])
+                audit_pg = col_ap.number_input("PÁGINA", 1, audit_pages, key="audit_page")
+                col_at.caption(f"{total_fills} operaciones registradas")
+                rows = ledger.fills(user, limit=AUDIT_PAGE, offset=(audit_pg - 1) * AUDIT_PAGE)
+                pd = timed_import('pandas')
+                audit = pd.DataFrame(rows)
+                audit['ts'] = pd.to_datetime(audit['ts'], unit='s')
+                st.dataframe(audit[['ts', 'side', 'qty', 'symbol', 'price', 'fee', 'cash_delta']], use_container_width=True, hide_index=True)
+            else:
+                st.caption("No hay operaciones registradas en esta cuenta.")
+
+    # --- PESTAÑA SCREENER ---
+    with tab_scr, span('render.screener'):
+        st.markdown("#### 🔎 SCREENER DE PROBABILIDAD")
+        extra = st.text_area("UNIVERSO ADICIONAL", key="scr_universe", placeholder="Símbolos separados por comas o líneas (se suman al EXPLORADOR)")
+        universe = WATCHLIST + [s.strip().upper() for s in extra.replace(',', '\n').splitlines() if s.strip()]
+
+        if st.button("EJECUTAR SCREENER", key="btn_screener", type="primary"):
+            st.session_state['scr_symbols'] = tuple(dict.fromkeys(universe))
+            st.session_state['scr_page'] = 1
+
+        if st.session_state.get('scr_symbols'):
+            try:
+                table, scr_error = run_screener(st.session_state['scr_symbols']), None
+            except Exception as e:
+                table, scr_error = None, describe_error(e)
+            if scr_error:
+                st.error(f"Screener no disponible — {scr_error}")
+            elif table.empty:
+                st.warning("Sin datos para el universo seleccionado.")
+            else:
+                # Sentimiento de los tickers ya analizados (pestaña de análisis o
+                # precalentamiento); el resto cuenta como neutral
+                sentiment = get_analysis_pipeline().cached_sentiment(table.index)
+                table = timed_import('screener').apply_sentiment(table, sentiment)
+                PAGE_SIZE = 25
+                pages = (len(table) - 1) // PAGE_SIZE + 1
+                if st.session_state.get('scr_page', 1) > pages: st.session_state['scr_page'] = pages
+                col_pg, col_tot = st.columns([1, 3])
+                pg = col_pg.number_input("PÁGINA", 1, pages, key="scr_page")
+                col_tot.caption(f"{len(table)} activos puntuados · {pages} páginas · "
+                                f"sentimiento de noticias en {len(sentiment)} (el resto, neutral 50)")
+                st.dataframe(timed_import('screener').page(table, pg, PAGE_SIZE), use_container_width=True)
         else:
-            st.caption("No hay operaciones registradas en esta sesión.")
+            st.caption("Ejecute el screener para puntuar el universo completo.")
+
+    # --- PESTAÑA TELEMETRÍA (SOLO ADMIN) ---
+    if is_admin:
+        with tab_tel[0]:
+            render_telemetry_panel()
 
 # ==========================================
 # 6. INICIO (CONTROL DE FLUJO)
@@ -632,7 +981,15 @@ session_data = st.query_params.get('session_data', [None])[0]
 if session_data:
     st.session_state['session_data'] = session_data
 
+get_metrics_server()   # endpoint /metrics local (uno por proceso)
+
 if not st.session_state['authenticated']:
-    login_screen()
+    with span('rerun.login'): login_screen()
 else:
-    main_app()
\ No newline at end of file
+    with span('rerun.main_app'): main_app()
+
+# Primer pintado de cada sesión (login o panel), desde el inicio del script
+if 'first_paint' not in st.session_state:
+    st.session_state['first_paint'] = time.perf_counter() - RUN_STARTED
+    telemetry.observe('first_paint_seconds', st.session_state['first_paint'],
+                      page='main_app' if st.session_state['authenticated'] else 'login')
\ No newline at end of file
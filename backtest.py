@@ -0,0 +1,146 @@
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BarStore, DATA_DIR
+from indicators import RSI_PERIOD, MACD_FAST, MACD_SLOW, MACD_SIGNAL
+from ledger import COMMISSION_RATE
+from screener import fusion_score
+
+# ==========================================
+# BACKTESTER VECTORIZADO DE LAS REGLAS TITANIUM
+# ==========================================
+# Reproduce sobre velas diarias almacenadas las reglas de get_ai_analysis
+# (RSI 30/70, cruce MACD, sentimiento) y los umbrales de generate_strategy.
+# Señales, posiciones y curvas de capital se calculan con operaciones de
+# arrays por símbolo; los símbolos se reparten entre procesos.
+
+BUY_THRESHOLD = 55     # "COMPRA (ACUMULAR)" o mejor
+SELL_THRESHOLD = 45    # "VENTA (REDUCIR)" o peor
+TRADING_DAYS = 252
+
+
+def indicator_series(close, period=RSI_PERIOD, fast=MACD_FAST, slow=MACD_SLOW, signal=MACD_SIGNAL):
+    # RSI de Wilder y MACD para toda la serie, con la misma definición que
+    # indicators.IndicatorEngine (semilla de media simple + suavizado 1/period)
+    delta = close.diff()
+    gain, loss = delta.clip(lower=0), (-delta).clip(lower=0)
+    seeded = []
+    for s in (gain, loss):
+        x = s.copy()
+        x.iloc[:period + 1] = np.nan
+        if len(s) > period: x.iloc[period] = s.iloc[1:period + 1].mean()
+        seeded.append(x.ewm(alpha=1.0 / period, adjust=False).mean())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - (100 / (1 + seeded[0] / seeded[1]))
+    macd = close.ewm(span=fast).mean() - close.ewm(span=slow).mean()
+    return rsi, macd, macd.ewm(span=signal).mean()
+
+
+def run_symbol(close, sentiment=None, commission=COMMISSION_RATE, buy=BUY_THRESHOLD, sell=SELL_THRESHOLD):
+    # Devuelve un DataFrame con prob, posición, retornos y curva de capital (base 1)
+    close = close.dropna()
+    rsi, macd, sig = indicator_series(close)
+    sent = 50.0 if sentiment is None else sentiment.reindex(close.index).ffill().fillna(50.0).to_numpy()
+    prob = fusion_score(rsi.to_numpy(), macd.to_numpy(), sig.to_numpy(), sent)
+
+    # Objetivo largo/plano; entre umbrales se mantiene la posición anterior
+    target = np.where(prob >= buy, 1.0, np.where(prob <= sell, 0.0, np.nan))
+    target[:max(RSI_PERIOD, MACD_SLOW)] = 0.0    # sin historia suficiente no se opera
+    position = pd.Series(target, index=close.index).ffill().fillna(0.0)
+    held = position.shift(1).fillna(0.0)          # se opera al cierre, cuenta desde la vela siguiente
+    turnover = held.diff().abs().fillna(held.abs())
+
+    fee = turnover * commission                   # fracción del capital pagada en comisiones
+    ret = close.pct_change().fillna(0.0) * held - fee
+    equity = (1.0 + ret).cumprod()
+    return pd.DataFrame({'close': close, 'prob': prob, 'position': held, 'turnover': turnover, 'fee': fee,
+                         'ret': ret, 'equity': equity})
+
+
+def summarize(frame):
+    if frame.empty: return {}
+    eq, ret = frame['equity'], frame['ret']
+    years = max(len(frame) / TRADING_DAYS, 1e-9)
+    drawdown = eq / eq.cummax() - 1
+    std = ret.std()
+    entries = int(((frame['position'].diff() > 0)).sum())
+    return {
+        'bars': len(frame),
+        'start': frame.index[0], 'end': frame.index[-1],
+        'total_return': float(eq.iloc[-1] - 1),
+        'cagr': float(eq.iloc[-1] ** (1 / years) - 1) if eq.iloc[-1] > 0 else -1.0,
+        'max_drawdown': float(drawdown.min()),
+        'sharpe': float(ret.mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else 0.0,
+        'exposure': float(frame['position'].mean()),
+        'trades': entries,
+        'fees_paid': float(frame['fee'].sum()),
+        'buy_hold': float(frame['close'].iloc[-1] / frame['close'].iloc[0] - 1),
+    }
+
+
+def _run_shard(root, symbols, years, with_curves):
+    # Trabajo de un proceso: lee del almacén local (sin red) y evalúa sus símbolos
+    store = BarStore(root=root)
+    out = []
+    for s in symbols:
+        df = store.read(s, '1d')
+        if df is None or df.empty: continue
+        if years: df = df[df.index >= df.index[-1] - pd.DateOffset(years=years)]
+        frame = run_symbol(df['Close'])
+        out.append((s, summarize(frame), frame['equity'] if with_curves else None))
+    return out
+
+
+def backtest(symbols, root=DATA_DIR, years=5, workers=None, with_curves=True):
+    # Reparte los símbolos entre procesos; devuelve (resumen por símbolo, curva de cartera equiponderada)
+    symbols = list(dict.fromkeys(s.upper().strip() for s in symbols if s.strip()))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(symbols) or 1))
+    shards = [symbols[i::workers] for i in range(workers)]
+    results = []
+    if workers == 1:
+        results = _run_shard(root, symbols, years, with_curves)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_run_shard, [root] * workers, shards, [years] * workers, [with_curves] * workers):
+                results.extend(part)
+
+    summary = pd.DataFrame({s: stats for s, stats, _ in results}).T
+    if not summary.empty: summary = summary.sort_values('total_return', ascending=False)
+    portfolio = None
+    if with_curves and results:
+        # Alineadas por fecha local de cada mercado
+        curves = pd.concat({s: c.set_axis(c.index.tz_localize(None).normalize()) for s, _, c in results}, axis=1)
+        daily = curves.ffill().pct_change().mean(axis=1).fillna(0.0)
+        portfolio = (1.0 + daily).cumprod()
+    return summary, portfolio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest de las reglas TITANIUM sobre velas almacenadas")
+    parser.add_argument('symbols', nargs='*', help="Símbolos a evaluar")
+    parser.add_argument('--file', help="Fichero con un símbolo por línea")
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--update', action='store_true', help="Actualiza el almacén antes de evaluar")
+    parser.add_argument('--root', default=DATA_DIR)
+    args = parser.parse_args()
+
+    symbols = list(args.symbols)
+    if args.file:
+        with open(args.file, 'r') as f: symbols += [l.strip() for l in f if l.strip() and not l.startswith('#')]
+    if not symbols: parser.error("indique al menos un símbolo")
+    if args.update: BarStore(root=args.root, min_refresh=0).update_many(symbols, '1d')
+
+    summary, portfolio = backtest(symbols, root=args.root, years=args.years, workers=args.workers)
+    pd.set_option('display.width', 160)
+    print(summary.to_string())
+    if portfolio is not None and len(portfolio):
+        print(f"\nCartera equiponderada: {portfolio.iloc[-1] - 1:+.2%}")
+
+
+if __name__ == "__main__":
+    main()
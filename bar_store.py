@@ -0,0 +1,417 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from market_provider import get_provider
+from paths import DATA_DIR
+from telemetry import cache_event
+
+# ==========================================
+# ALMACÉN LOCAL DE VELAS OHLCV (COLUMNAR)
+# ==========================================
+# Una carpeta por símbolo e intervalo con un .npy por columna (memory-mapped).
+# Solo se piden al proveedor las velas posteriores a la última guardada.
+#
+# Pirámide de resoluciones: al proveedor solo se le piden dos series base por
+# símbolo (5m, limitada por Yahoo a ~60 días, y diaria con toda la historia).
+# Los niveles más gruesos (15m y 60m desde 5m, semanal desde diario) se
+# agregan en local y se actualizan de forma incremental cada vez que entran
+# velas base: solo se recalcula desde la sesión (o semana) de la primera vela
+# nueva. Cualquier rango del gráfico es un recorte de un nivel ya calculado.
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+MIN_REFRESH = 60  # segundos entre consultas al proveedor por símbolo/intervalo
+
+# Historial inicial y antigüedad máxima que Yahoo sirve por intervalo
+INITIAL_PERIOD = {'5m': '60d', '15m': '60d', '60m': '730d', '1d': 'max', '1wk': 'max'}
+MAX_LOOKBACK = {'5m': timedelta(days=59), '15m': timedelta(days=59), '60m': timedelta(days=729)}
+
+# Rango del gráfico -> intervalo almacenado
+RANGE_INTERVAL = {'1d': '5m', '5d': '15m', '7d': '15m', '1mo': '60m', '6mo': '1d', '1y': '1d', 'max': '1wk'}
+RANGE_SESSIONS = {'1d': 1, '5d': 5, '7d': 7}
+RANGE_OFFSET = {'1mo': pd.DateOffset(months=1), '6mo': pd.DateOffset(months=6), '1y': pd.DateOffset(years=1)}
+
+# Nivel -> serie base de la que se deriva (las bases se derivan de sí mismas)
+BASE_INTERVAL = {'5m': '5m', '15m': '5m', '60m': '5m', '1d': '1d', '1wk': '1d'}
+DERIVED = {'5m': ['15m', '60m'], '1d': ['1wk']}
+LEVEL_WIDTH = {'15m': 15 * 60 * 10**9, '60m': 3600 * 10**9}
+DAY_NS = 86400 * 10**9
+# Margen hacia atrás que cubre el día/semana de la primera vela nueva (con husos horarios)
+RESUME_SPAN = {'15m': 2 * DAY_NS, '60m': 2 * DAY_NS, '1wk': 8 * DAY_NS}
+
+
+
+SESSION_MARGIN = 10 * DAY_NS   # fines de semana y festivos al contar sesiones hacia atrás
+
+
+def range_start(ts, tz, period):
+    # Primera posición del rango pedido en una serie ordenada de timestamps
+    # (int64 ns UTC): las últimas N sesiones o un periodo de calendario
+    if not len(ts): return 0
+    if period in RANGE_SESSIONS:
+        n = RANGE_SESSIONS[period]
+        # Basta con mirar la cola de la serie (salvo huecos de más de 10 días)
+        lo = int(np.searchsorted(ts, ts[-1] - (n + 1) * DAY_NS - SESSION_MARGIN))
+        for start in (lo, 0):
+            dates = pd.to_datetime(np.asarray(ts[start:]), utc=True).tz_convert(tz).normalize()
+            keep = dates.unique()[-n:]
+            if start == 0 or len(keep) == n: return start + int(np.argmax(dates.isin(keep)))
+    if period in RANGE_OFFSET:
+        last = pd.Timestamp(int(ts[-1]), tz='UTC').tz_convert(tz)
+        return int(np.searchsorted(ts, (last - RANGE_OFFSET[period]).value, side='right'))
+    return 0
+
+
+def slice_range(df, period):
+    # Recorta una serie almacenada (DataFrame o Bars) al rango pedido
+    if df is None or df.empty: return df
+    if isinstance(df, Bars): return df[range_start(df.ts, df.tz, period):]
+    start = range_start(df.index.asi8, df.index.tz or 'UTC', period)
+    return df.iloc[start:]
+
+
+def _frozen(a):
+    a.setflags(write=False)
+    return a
+
+
+class Bars:
+    # Velas OHLCV compactas: timestamps int64 (ns UTC), precios float32 y
+    # volumen float64 en arrays de solo lectura. Recortar devuelve vistas (sin
+    # copiar), así una misma serie cacheada se comparte entre sesiones; solo
+    # se crea un índice de fechas o un DataFrame cuando alguien lo pide.
+    __slots__ = ('ts', 'cols', 'tz')
+
+    def __init__(self, ts, cols, tz='UTC'):
+        # Se copia siempre (con el tipo compacto): nunca se retiene un memmap del almacén
+        self.ts = _frozen(np.array(ts, dtype=np.int64))
+        self.cols = {c: _frozen(np.array(cols[c], dtype=np.float64 if c == 'Volume' else np.float32)) for c in COLUMNS}
+        self.tz = tz
+
+    @classmethod
+    def _view(cls, ts, cols, tz):
+        bars = cls.__new__(cls)
+        bars.ts, bars.cols, bars.tz = ts, cols, tz
+        return bars
+
+    def __getstate__(self):
+        return self.ts, self.cols, self.tz
+
+    def __setstate__(self, state):
+        ts, cols, self.tz = state
+        self.ts, self.cols = _frozen(ts), {c: _frozen(a) for c, a in cols.items()}
+
+    # --- ACCESO (MISMA FORMA QUE EL DATAFRAME QUE SUSTITUYE) ---
+    def __len__(self):
+        return len(self.ts)
+
+    def __contains__(self, column):
+        return column in self.cols
+
+    def __getitem__(self, key):
+        # 'Close' -> array de la columna; slice -> Bars con vistas del rango
+        if isinstance(key, str): return self.cols[key]
+        return Bars._view(self.ts[key], {c: a[key] for c, a in self.cols.items()}, self.tz)
+
+    @property
+    def empty(self):
+        return len(self.ts) == 0
+
+    @property
+    def columns(self):
+        return list(self.cols)
+
+    @property
+    def nbytes(self):
+        return self.ts.nbytes + sum(a.nbytes for a in self.cols.values())
+
+    @property
+    def index(self):
+        return pd.to_datetime(self.ts, utc=True).tz_convert(self.tz)
+
+    def take(self, positions, **overrides):
+        # Filas sueltas (copia pequeña, p. ej. tras reducir para el gráfico)
+        cols = {c: overrides[c] if c in overrides else a[positions] for c, a in self.cols.items()}
+        return Bars(self.ts[positions], cols, self.tz)
+
+    def series(self, column):
+        return pd.Series(self.cols[column], index=self.index, name=column, copy=False)
+
+    def to_frame(self):
+        return pd.DataFrame(dict(self.cols), index=self.index)
+
+
+def _group_keys(ts, level, tz):
+    # Para cada vela: (ancla, inicio de su vela agregada, hora local) en ns.
+    # El ancla es el día local (intradía) o la semana que empieza en lunes.
+    utc = pd.to_datetime(np.asarray(ts), utc=True)
+    local = utc.tz_convert(tz).tz_localize(None).as_unit('ns').asi8
+    days = local // DAY_NS
+    if level == '1wk':
+        week = (days - (days + 3) % 7) * DAY_NS      # 1970-01-01 fue jueves
+        return week, week, local
+    # Intradía: las velas se alinean con la primera de cada sesión (9:30, 10:30...)
+    starts = np.r_[0, np.flatnonzero(np.diff(days)) + 1]
+    first = np.repeat(local[starts], np.diff(np.r_[starts, len(local)]))
+    width = LEVEL_WIDTH[level]
+    return days * DAY_NS, first + (local - first) // width * width, local
+
+
+def resample_ohlcv(ts, cols, level, tz, since=None):
+    # Agrega velas base (ordenadas) al nivel pedido de forma vectorizada.
+    # Con since, solo desde el ancla (día o semana) que contiene esa vela.
+    ts = np.asarray(ts)
+    ok = np.isfinite(np.asarray(cols['Close']))
+    ts, cols = ts[ok], {c: np.asarray(a)[ok] for c, a in cols.items()}
+    if not len(ts): return ts, {c: a for c, a in cols.items()}
+    anchor, key, local = _group_keys(ts, level, tz)
+    if since is not None:
+        j = min(int(np.searchsorted(ts, since)), len(ts) - 1)
+        keep = anchor >= anchor[j]
+        ts, anchor, key, local = ts[keep], anchor[keep], key[keep], local[keep]
+        cols = {c: a[keep] for c, a in cols.items()}
+    starts = np.r_[0, np.flatnonzero(np.diff(key)) + 1]
+    ends = np.r_[starts[1:], len(ts)] - 1
+    out = {
+        'Open': cols['Open'][starts],
+        'High': np.fmax.reduceat(cols['High'], starts),
+        'Low': np.fmin.reduceat(cols['Low'], starts),
+        'Close': cols['Close'][ends],
+        'Volume': np.add.reduceat(np.nan_to_num(cols['Volume']), starts),
+    }
+    # Inicio de cada vela agregada, de hora local a UTC con el desfase de su primera vela
+    return key[starts] - (local[starts] - ts[starts]), out
+
+
+def _ticker_frame(data, symbol, n_symbols):
+    # Extrae las velas de un símbolo de una descarga masiva de yf.download
+    if data is None or data.empty: return None
+    if isinstance(data.columns, pd.MultiIndex):
+        if symbol not in data.columns.get_level_values(0): return None
+        frame = data[symbol]
+    elif n_symbols == 1:
+        frame = data
+    else:
+        return None
+    return frame.dropna(how='all')
+
+
+class BarStore:
+    def __init__(self, root=DATA_DIR, provider=None, min_refresh=MIN_REFRESH):
+        self.root = root
+        self._provider = provider
+        self.min_refresh = min_refresh
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    @property
+    def provider(self):
+        # yfinance solo se importa si hace falta pedir velas (lecturas puras no lo necesitan)
+        if self._provider is None: self._provider = get_provider()
+        return self._provider
+
+    # --- RUTAS Y BLOQUEOS ---
+    def _dir(self, symbol, interval):
+        safe = symbol.upper().replace('/', '_').replace('\\', '_')
+        return os.path.join(self.root, safe, interval)
+
+    def _lock(self, symbol, interval):
+        with self._locks_guard:
+            return self._locks.setdefault((symbol.upper(), interval), threading.Lock())
+
+    def _read_meta(self, path):
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r') as f: return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # --- LECTURA ---
+    def read_arrays(self, symbol, interval):
+        # Devuelve (timestamps int64 ns UTC, {columna: array}, meta) sin copiar
+        path = self._dir(symbol, interval)
+        meta = self._read_meta(path)
+        if not meta or not meta.get('rows'): return None, None, meta
+        try:
+            ts = np.load(os.path.join(path, 'ts.npy'), mmap_mode='r')
+            cols = {c: np.load(os.path.join(path, f'{c}.npy'), mmap_mode='r') for c in COLUMNS}
+        except (OSError, ValueError):
+            return None, None, meta
+        n = min([meta['rows'], len(ts)] + [len(a) for a in cols.values()])
+        return ts[:n], {c: a[:n] for c, a in cols.items()}, meta
+
+    def read_bars(self, symbol, interval, period=None):
+        # Serie compacta (Bars); con period solo se convierte el tramo del rango
+        ts, cols, meta = self.read_arrays(symbol, interval)
+        if ts is None: return None
+        tz = meta.get('tz') or 'UTC'
+        start = range_start(ts, tz, period) if period else 0
+        return Bars(ts[start:], {c: a[start:] for c, a in cols.items()}, tz)
+
+    def read(self, symbol, interval):
+        ts, cols, meta = self.read_arrays(symbol, interval)
+        if ts is None: return None
+        index = pd.to_datetime(np.asarray(ts), utc=True).tz_convert(meta.get('tz') or 'UTC')
+        return pd.DataFrame({c: np.asarray(a) for c, a in cols.items()}, index=index)
+
+    def last_timestamp(self, symbol, interval):
+        ts, _, _ = self.read_arrays(symbol, interval)
+        if ts is None or len(ts) == 0: return None
+        return pd.Timestamp(int(ts[-1]), tz='UTC')
+
+    # --- ESCRITURA ---
+    def _write(self, path, ts, cols, tz, fetched_at, **extra):
+        os.makedirs(path, exist_ok=True)
+        # Cada columna se reemplaza de forma atómica; meta.json va al final
+        for name, arr in [('ts', ts)] + [(c, cols[c]) for c in COLUMNS]:
+            tmp = os.path.join(path, f'.{name}.{os.getpid()}.{threading.get_ident()}.npy')
+            np.save(tmp, arr)
+            os.replace(tmp, os.path.join(path, f'{name}.npy'))
+        self._write_meta(path, {'rows': int(len(ts)), 'tz': tz, 'fetched_at': fetched_at, **extra})
+
+    def _write_meta(self, path, meta):
+        tmp = os.path.join(path, f'.meta.{os.getpid()}.{threading.get_ident()}.json')
+        with open(tmp, 'w') as f: json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, 'meta.json'))
+
+    def merge(self, symbol, interval, new, fetched_at=None):
+        # Las velas nuevas reemplazan a las guardadas desde su primer timestamp
+        # (la última vela almacenada suele estar incompleta)
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        path = self._dir(symbol, interval)
+        old_ts, old_cols, meta = self.read_arrays(symbol, interval)
+        new_tz = str(new.index.tz) if new is not None and getattr(new.index, 'tz', None) is not None else 'UTC'
+        tz = (meta or {}).get('tz') or new_tz
+
+        if new is None or new.empty:
+            # Sin velas nuevas: solo se registra la consulta
+            os.makedirs(path, exist_ok=True)
+            self._write_meta(path, dict(meta or {'rows': 0, 'tz': tz}, fetched_at=fetched_at))
+            return
+
+        new = new[~new.index.duplicated(keep='last')].sort_index()
+        idx = new.index if new.index.tz is not None else new.index.tz_localize('UTC')
+        new_ts = idx.tz_convert('UTC').as_unit('ns').asi8.astype(np.int64)
+        new_cols = {c: new[c].to_numpy(dtype=np.float64) if c in new else np.full(len(new), np.nan) for c in COLUMNS}
+        since = int(new_ts[0])
+
+        if old_ts is not None:
+            keep = np.asarray(old_ts) < new_ts[0]
+            new_ts = np.concatenate([np.asarray(old_ts)[keep], new_ts])
+            new_cols = {c: np.concatenate([np.asarray(old_cols[c])[keep], new_cols[c]]) for c in COLUMNS}
+        self._write(path, new_ts, new_cols, tz, fetched_at)
+        if interval in DERIVED: self._derive(symbol, interval, since, fetched_at)
+
+    # --- PIRÁMIDE DE RESOLUCIONES ---
+    def _derive(self, symbol, base, since=None, fetched_at=None):
+        # Recalcula los niveles de `base` desde el día/semana de `since`
+        # (None = desde cero). Se llama con el candado de la serie base.
+        ts, cols, meta = self.read_arrays(symbol, base)
+        if ts is None: return
+        tz = meta.get('tz') or 'UTC'
+        fetched_at = fetched_at if fetched_at is not None else meta.get('fetched_at', 0)
+        for level in DERIVED[base]:
+            old_ts, old_cols, old_meta = self.read_arrays(symbol, level)
+            incremental = since is not None and old_ts is not None and (old_meta or {}).get('source') == base
+            start = int(np.searchsorted(ts, since - RESUME_SPAN[level])) if incremental else 0
+            lvl_ts, lvl_cols = resample_ohlcv(ts[start:], {c: a[start:] for c, a in cols.items()}, level, tz,
+                                              since if incremental else None)
+            if incremental and len(lvl_ts):
+                keep = np.asarray(old_ts) < lvl_ts[0]
+                lvl_ts = np.concatenate([np.asarray(old_ts)[keep], lvl_ts])
+                lvl_cols = {c: np.concatenate([np.asarray(old_cols[c])[keep], lvl_cols[c]]) for c in COLUMNS}
+            elif incremental:
+                continue
+            # Se marca el origen: los niveles descargados antes de la pirámide se rehacen
+            self._write(self._dir(symbol, level), lvl_ts.astype(np.int64), lvl_cols, tz, fetched_at, source=base)
+
+    def _sync_level(self, symbol, level):
+        # Nivel ausente o de otra procedencia (p. ej. descargado antes): se rehace desde la base
+        base = BASE_INTERVAL.get(level, level)
+        if base == level or (self._read_meta(self._dir(symbol, level)) or {}).get('source') == base: return
+        with self._lock(symbol, base):
+            if (self._read_meta(self._dir(symbol, level)) or {}).get('source') != base:
+                self._derive(symbol, base)
+
+    # --- ACTUALIZACIÓN INCREMENTAL ---
+    def _fetch(self, symbol, interval, last):
+        t = self.provider.Ticker(symbol)
+        limit = MAX_LOOKBACK.get(interval)
+        now = datetime.now(timezone.utc)
+        if last is None or (limit is not None and now - last.to_pydatetime() > limit):
+            return t.history(period=INITIAL_PERIOD.get(interval, 'max'), interval=interval)
+        return t.history(start=last.to_pydatetime(), interval=interval)
+
+    def update(self, symbol, interval, force=False):
+        # Los niveles derivados se actualizan a través de su serie base
+        interval = BASE_INTERVAL.get(interval, interval)
+        with self._lock(symbol, interval):
+            meta = self._read_meta(self._dir(symbol, interval)) or {}
+            now = time.time()
+            if not force and now - meta.get('fetched_at', 0) < self.min_refresh:
+                cache_event(f'bars.{interval}', 'hit')
+                return False
+            cache_event(f'bars.{interval}', 'miss')
+            last = self.last_timestamp(symbol, interval)
+            new = self._fetch(symbol, interval, last)
+            self.merge(symbol, interval, new, fetched_at=now)
+            return True
+
+    def update_many(self, symbols, interval, force=False):
+        # Actualiza muchos símbolos con una descarga masiva: una para los que ya
+        # tienen historia (desde la vela más antigua pendiente) y otra para los nuevos
+        interval = BASE_INTERVAL.get(interval, interval)
+        now = time.time()
+        due = []
+        for s in symbols:
+            meta = self._read_meta(self._dir(s, interval)) or {}
+            if force or now - meta.get('fetched_at', 0) >= self.min_refresh: due.append(s)
+        cache_event(f'bars.{interval}', 'hit', len(symbols) - len(due))
+        if not due: return []
+        cache_event(f'bars.{interval}', 'miss', len(due))
+
+        lasts = {s: self.last_timestamp(s, interval) for s in due}
+        limit = MAX_LOOKBACK.get(interval)
+        cutoff = pd.Timestamp.now(tz='UTC') - limit if limit is not None else None
+        fresh = [s for s in due if lasts[s] is None or (cutoff is not None and lasts[s] < cutoff)]
+        known = [s for s in due if s not in fresh]
+
+        batches = []
+        if fresh: batches.append((fresh, {'period': INITIAL_PERIOD.get(interval, 'max')}))
+        if known: batches.append((known, {'start': min(lasts[s] for s in known).to_pydatetime()}))
+        for group, kwargs in batches:
+            data = self.provider.download(
+                group, interval=interval, group_by='ticker', auto_adjust=True,
+                ignore_tz=False, progress=False, threads=True, **kwargs
+            )
+            for s in group:
+                frame = _ticker_frame(data, s, len(group))
+                if frame is not None and lasts.get(s) is not None:
+                    frame = frame[frame.index >= lasts[s]]
+                with self._lock(s, interval):
+                    self.merge(s, interval, frame, fetched_at=now)
+        return due
+
+    def get_bars(self, symbol, interval, refresh=True, compact=False, period=None):
+        # Si el refresco falla se sirven las velas guardadas; sin ninguna, el error sube.
+        # compact=True devuelve Bars (recortadas a period si se indica) en vez de DataFrame.
+        error = None
+        if refresh:
+            try:
+                self.update(symbol, interval)
+            except Exception as e:
+                print(f"Error updating bar store {symbol} {interval}: {e}")
+                error = e
+        self._sync_level(symbol, interval)
+        data = self.read_bars(symbol, interval, period) if compact else self.read(symbol, interval)
+        if data is None and error is not None: raise error
+        return data
+
+    def get_range(self, symbol, period, refresh=True, compact=False):
+        interval = RANGE_INTERVAL.get(period, '1wk')
+        if compact: return self.get_bars(symbol, interval, refresh=refresh, compact=True, period=period)
+        return slice_range(self.get_bars(symbol, interval, refresh=refresh), period)
@@ -0,0 +1,207 @@
+import os
+import sys
+import csv
+import math
+import time
+import argparse
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from paths import DATA_DIR
+
+# ==========================================
+# ANÁLISIS TITANIUM POR LOTES (SIN INTERFAZ)
+# ==========================================
+# La misma puntuación que la pestaña de análisis (AnalysisPipeline: técnico +
+# noticias fusionados), para miles de símbolos desde la línea de comandos.
+# Los símbolos se reparten en tandas entre procesos; cada proceso actualiza
+# las velas diarias de su tanda con una sola descarga masiva y analiza sus
+# símbolos con unos pocos hilos. El ritmo y la concurrencia hacia el
+# proveedor se reparten entre los procesos, y las filas se escriben (CSV o
+# Parquet) en cuanto termina cada tanda: la memoria no crece con la lista.
+#
+#   python batch_analysis.py --file universo.txt --output informe.parquet
+
+CHUNK_SIZE = 25            # símbolos por tanda (una descarga de velas por tanda)
+THREADS = 4                # análisis simultáneos por proceso
+TASKS_PER_CHILD = 40       # tandas antes de reciclar un proceso (memoria plana)
+ANALYSIS_TIMEOUT = 60.0    # s por símbolo; la interfaz degrada a los 4 s, aquí se espera
+RATE = 5.0                 # peticiones/s al proveedor entre todos los procesos
+CONCURRENCY = 8            # peticiones simultáneas entre todos los procesos
+ROW_GROUP = 500            # filas por grupo de Parquet
+
+OUTPUT_COLUMNS = ['symbol', 'prob', 'rec', 'sentiment', 'rsi', 'macd', 'signal', 'asof',
+                  'headlines', 'technical', 'news', 'error']
+
+
+# ==========================================
+# TRABAJO DE CADA PROCESO
+# ==========================================
+_pipeline = None
+
+
+def _init_worker(root, rate, concurrency, replay):
+    # Planificador propio con su parte del ritmo global y pipeline sin Streamlit
+    global _pipeline
+    import market_provider
+    from fetch_scheduler import FetchScheduler, set_scheduler
+    from bar_store import BarStore
+    from indicators import IndicatorEngine
+    from sentiment import SentimentCache
+    from analysis import AnalysisPipeline
+
+    set_scheduler(FetchScheduler(rate=rate, burst=max(1, math.ceil(rate)), max_workers=concurrency))
+    if replay:
+        from benchmarks.provider import ReplayProvider
+        market_provider.set_provider(ReplayProvider(replay))
+    sentiment = SentimentCache(path=os.path.join(root, 'sentiment_cache.json'))
+    try:
+        sentiment.scorer(['warmup'])   # carga TextBlob antes del primer lote con plazo
+    except Exception as e:
+        print(f"Puntuación de titulares no disponible: {e}", file=sys.stderr)
+    _pipeline = AnalysisPipeline(BarStore(root=root), IndicatorEngine(), sentiment, max_workers=2 * THREADS)
+
+
+def _number(x, digits=4):
+    return round(float(x), digits) if x is not None and math.isfinite(x) else None
+
+
+def _analyze_one(symbol):
+    from screener import recommendation
+    row = dict.fromkeys(OUTPUT_COLUMNS)
+    row['symbol'] = symbol
+    try:
+        prob, sent_score, _, inputs = _pipeline.analyze(symbol, timeout=ANALYSIS_TIMEOUT)
+    except Exception as e:
+        row['error'] = str(e)
+        return row
+    tech, news = inputs['technical'], inputs['sentiment']
+    row.update(
+        prob=_number(prob, 2), rec=str(recommendation(prob)), sentiment=_number(sent_score, 2),
+        rsi=_number(tech.get('rsi')), macd=_number(tech.get('macd')), signal=_number(tech.get('signal')),
+        asof=tech['asof'].isoformat() if tech.get('asof') is not None else None,
+        headlines=news.get('headlines', 0), technical=tech['status'], news=news['status'],
+        error='; '.join(f"{k}: {v['error']}" for k, v in inputs.items() if v.get('error')) or None,
+    )
+    return row
+
+
+def _analyze_chunk(symbols):
+    # Velas diarias de toda la tanda en una descarga; después, análisis en paralelo
+    try:
+        _pipeline.store.update_many(symbols, '1d')
+    except Exception as e:
+        print(f"Error actualizando velas de la tanda ({symbols[0]}...): {e}", file=sys.stderr)
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(_analyze_one, symbols))
+
+
+# ==========================================
+# SALIDA INCREMENTAL
+# ==========================================
+class CsvSink:
+    def __init__(self, path):
+        self._file = sys.stdout if path in (None, '-') else open(path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_COLUMNS)
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout: self._file.close()
+
+
+class ParquetSink:
+    # Se acumulan ROW_GROUP filas por grupo (grupos diminutos harían el fichero lento de leer)
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._schema = pa.schema([
+            ('symbol', pa.string()), ('prob', pa.float64()), ('rec', pa.string()), ('sentiment', pa.float64()),
+            ('rsi', pa.float64()), ('macd', pa.float64()), ('signal', pa.float64()), ('asof', pa.string()),
+            ('headlines', pa.int32()), ('technical', pa.string()), ('news', pa.string()), ('error', pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._rows = []
+
+    def _flush(self):
+        if self._rows: self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+        self._rows = []
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        if len(self._rows) >= ROW_GROUP: self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_sink(path, fmt=None):
+    fmt = fmt or ('parquet' if path and path.endswith('.parquet') else 'csv')
+    return ParquetSink(path) if fmt == 'parquet' else CsvSink(path)
+
+
+# ==========================================
+# ORQUESTACIÓN
+# ==========================================
+def run_batch(symbols, sink, workers=None, chunk_size=CHUNK_SIZE, rate=RATE, concurrency=CONCURRENCY,
+              root=DATA_DIR, replay=None, progress=True):
+    # Como mucho 2 tandas en vuelo por proceso; cada una se escribe al terminar
+    symbols = list(dict.fromkeys(s.upper().strip() for s in symbols if s.strip()))
+    chunks = iter([symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)])
+    workers = max(1, min(workers or os.cpu_count() or 1, concurrency, math.ceil(len(symbols) / chunk_size) or 1))
+    initargs = (root, rate / workers, max(1, concurrency // workers), replay)
+    done, errors, t0 = 0, 0, time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs,
+                             max_tasks_per_child=TASKS_PER_CHILD) as pool:
+        pending = {pool.submit(_analyze_chunk, c) for c in islice(chunks, 2 * workers)}
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                rows = fut.result()
+                sink.write(rows)
+                done += len(rows)
+                errors += sum(1 for r in rows if r['prob'] is None)
+            pending |= {pool.submit(_analyze_chunk, c) for c in islice(chunks, len(finished))}
+            if progress:
+                print(f"{done}/{len(symbols)} símbolos ({errors} sin puntuación) en {time.time() - t0:.0f} s", file=sys.stderr)
+    return done, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Puntuación TITANIUM por lotes, sin interfaz")
+    parser.add_argument('symbols', nargs='*', help="Símbolos a analizar")
+    parser.add_argument('--file', help="Fichero con un símbolo por línea")
+    parser.add_argument('--output', '-o', default='-', help="Fichero .csv o .parquet (por defecto CSV a stdout)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None)
+    parser.add_argument('--workers', type=int, default=None, help="Procesos (por defecto, uno por CPU)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--rate', type=float, default=RATE, help="Peticiones/s al proveedor en total")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="Peticiones simultáneas en total")
+    parser.add_argument('--root', default=DATA_DIR)
+    parser.add_argument('--replay', help="Reproduce respuestas grabadas (benchmarks/fixtures) en vez de yfinance")
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args()
+
+    symbols = list(args.symbols)
+    if args.file:
+        with open(args.file, 'r') as f: symbols += [l.strip() for l in f if l.strip() and not l.startswith('#')]
+    if not symbols: parser.error("indique al menos un símbolo")
+    if args.format == 'parquet' and args.output == '-': parser.error("Parquet necesita --output")
+
+    sink = open_sink(None if args.output == '-' else args.output, args.format)
+    try:
+        done, errors = run_batch(symbols, sink, workers=args.workers, chunk_size=args.chunk_size, rate=args.rate,
+                                 concurrency=args.concurrency, root=args.root, replay=args.replay,
+                                 progress=not args.quiet)
+    finally:
+        sink.close()
+    if errors == done: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
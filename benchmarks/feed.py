@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import argparse
+
+os.environ.setdefault('TITANIUM_METRICS_PORT', '0')
+
+import numpy as np
+
+from broker_gateway import MockBroker
+from live_feed import PriceFeed, SimulatedSource
+
+# ==========================================
+# COMPROBACIÓN DEL FEED EN VIVO Y DEL MOTOR DE CASAMIENTO
+# ==========================================
+# Mueve PriceFeed con SimulatedSource (sin red, semilla fija) vuelta a vuelta
+# y comprueba que:
+#   - cada símbolo parte de su cotización guardada (y de 'start' si no hay),
+#   - lo publicado en latest() es lo que devolvió la fuente en esa vuelta,
+#   - las órdenes en reposo de MockBroker (stop-loss, compra límite,
+#     take-profit) se ejecutan en la primera vuelta que cruza su disparo y a
+#     ese precio, y las que nunca se cruzan siguen abiertas.
+# Sale con error si algo no cuadra:
+#
+#   python -m benchmarks.feed --ticks 400 --seed 7
+
+SETTLE_TIMEOUT = 5.0   # s de espera a que el hilo del motor entregue las ejecuciones
+
+
+def check(cond, msg):
+    if not cond: raise AssertionError(msg)
+
+
+def manual_feed(source):
+    # Sin hilo productor: cada vuelta la da la comprobación con poll()
+    feed = PriceFeed(source, interval=3600)
+    feed.stop()
+    feed._thread.join(1)
+    return feed
+
+
+def check_prices(seed):
+    cached = {'AAA': (50.0, 40.0)}
+    source = SimulatedSource(seed=seed, start=100.0, vol=0.01, initial=lambda symbols: {s: cached[s] for s in symbols if s in cached})
+    feed = manual_feed(source)
+    published = []
+    feed.add_listener(published.append)
+    for s in ('AAA', 'BBB'): feed.subscribe(s)
+
+    rng = np.random.default_rng(seed)
+    expected = {'AAA': 50.0, 'BBB': 100.0}
+    for _ in range(5):
+        check(feed.poll() == 2, "cada vuelta debe publicar los dos símbolos")
+        for s in ('AAA', 'BBB'):   # mismo orden de sorteo que SimulatedSource.fetch
+            expected[s] *= float(np.exp(rng.standard_normal() * 0.01))
+        quotes = published[-1]
+        for s, prev in (('AAA', 40.0), ('BBB', 100.0)):
+            price, pct, change, age = feed.latest(s)
+            check(np.isclose(quotes[s][0], expected[s]), f"{s}: la fuente se desvió del paseo aleatorio")
+            check(price == quotes[s][0], f"{s}: latest() no es lo publicado en la vuelta")
+            check(np.isclose(change, price - prev) and np.isclose(pct, (price - prev) / prev * 100),
+                  f"{s}: el cambio no se mide contra el cierre anterior")
+            check(age >= 0, f"{s}: antigüedad negativa")
+    check(feed.latest('CCC') is None, "un símbolo sin suscribir no debe tener precio")
+    print(f"precios publicados: {len(published)} vueltas, {sorted(published[-1])}")
+
+
+def check_triggers(seed, ticks):
+    source = SimulatedSource(seed=seed, start=100.0, vol=0.01)
+    feed = manual_feed(source)
+    broker = MockBroker(lambda s: feed.latest(s)[0])
+    feed.add_listener(lambda quotes: broker.engine.on_prices({s: p for s, (p, _) in quotes.items()}))
+    feed.subscribe('SIM')
+    feed.poll()
+    start = feed.latest('SIM')[0]
+
+    orders = {
+        'stop_loss': broker.submit_order('SIM', qty=1, side='sell', type='stop', stop_price=start * 0.97),
+        'buy_limit': broker.submit_order('SIM', qty=1, side='buy', type='limit', limit_price=start * 0.95),
+        'take_profit': broker.submit_order('SIM', qty=1, side='sell', type='limit', limit_price=start * 1.03),
+        'never': broker.submit_order('SIM', qty=1, side='buy', type='limit', limit_price=start * 0.01),
+    }
+    path = []
+    for _ in range(ticks):
+        feed.poll()
+        path.append(feed.latest('SIM')[0])
+    path = np.array(path)
+
+    # Primera vuelta que cruza cada disparo (None si nunca)
+    def first(mask):
+        hits = np.flatnonzero(mask)
+        return float(path[hits[0]]) if len(hits) else None
+    expected = {
+        'stop_loss': first(path <= start * 0.97),
+        'buy_limit': first(path <= start * 0.95),
+        'take_profit': first(path >= start * 1.03),
+        'never': first(path <= start * 0.01),
+    }
+    check(expected['never'] is None, "el paseo no debería llegar a la orden de control")
+    check(any(v is not None for v in expected.values()), f"ningún disparo cruzado en {ticks} vueltas; sube --ticks")
+
+    deadline = time.time() + SETTLE_TIMEOUT
+    while time.time() < deadline and any((o.status == 'filled') != (expected[k] is not None) for k, o in orders.items()):
+        time.sleep(0.01)
+    for name, order in orders.items():
+        if expected[name] is None:
+            check(order.status == 'new', f"{name}: no se cruzó y debería seguir abierta ({order.status})")
+        else:
+            check(order.status == 'filled', f"{name}: se cruzó y no se ejecutó ({order.status})")
+            check(order.filled_avg_price == expected[name], f"{name}: ejecutada a {order.filled_avg_price}, se esperaba {expected[name]}")
+        print(f"{name:<12} disparo={order.stop_price or order.limit_price:10.4f} estado={order.status:<7} precio={order.filled_avg_price}")
+    check(broker.engine.symbols() == ['SIM'], "la orden de control mantiene el libro del símbolo")
+    for order in orders.values():
+        if order.status == 'new': broker.cancel_order(order.id)
+    check(broker.engine.symbols() == [], "sin órdenes vivas el feed ya no debe seguir el símbolo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprobación del feed en vivo con SimulatedSource")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--ticks', type=int, default=400)
+    args = parser.parse_args()
+    try:
+        check_prices(args.seed)
+        check_triggers(args.seed, args.ticks)
+    except AssertionError as e:
+        print(f"FALLO: {e}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
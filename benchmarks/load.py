@@ -0,0 +1,340 @@
+import os
+import gc
+import ast
+import sys
+import json
+import time
+import pickle
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# Velas y cachés en un directorio temporal propio (antes de importar la app);
+# usuarios, libro y fixtures quedan fuera para sobrevivir al arranque en frío de cada nivel
+LOAD_DATA = tempfile.mkdtemp(prefix='titanium_load_')
+APP_DATA = os.path.join(LOAD_DATA, 'data')
+os.environ['TITANIUM_DATA_DIR'] = APP_DATA
+os.environ.setdefault('TITANIUM_LEDGER', os.path.join(LOAD_DATA, 'ledger.db'))
+os.environ.setdefault('TITANIUM_USERS', os.path.join(LOAD_DATA, 'users.db'))
+os.environ.setdefault('TITANIUM_LIVE_FEED', 'sim')      # cotizaciones en vivo sin red
+os.environ.setdefault('TITANIUM_METRICS_PORT', '0')
+os.environ.setdefault('TITANIUM_WARMUP_BUDGET', '0')
+
+import numpy as np
+
+import market_provider
+from telemetry import REGISTRY
+from ledger import Ledger
+from users import UserStore
+from benchmarks.provider import ReplayProvider, synthesize
+
+# ==========================================
+# PRUEBA DE CARGA CON SESIONES CONCURRENTES
+# ==========================================
+# Simula N usuarios a la vez contra la app completa (AppTest, un hilo por
+# sesión, todos en el mismo proceso como en un servidor Streamlit) y con el
+# proveedor offline. Cada usuario inicia sesión por el formulario y después
+# encadena acciones al azar: cambiar de símbolo con los botones del
+# EXPLORADOR, cambiar el rango temporal y comprar o vender a mercado. Por
+# cada N se informa de la latencia de los reruns (p50/p95/p99, total y por
+# acción), la memoria por sesión y la tasa de acierto de cada caché:
+#
+#   python -m benchmarks.load --users 1 5 10 25 --steps 20
+#   python -m benchmarks.load --users 10 --latency 0.05 --think 0.5
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'app.py')
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+TIMEFRAMES = ['1d', '5d', '1mo', '6mo', '1y']
+ACTIONS = {'ticker': 0.4, 'timeframe': 0.35, 'trade': 0.25}   # peso de cada acción
+PASSWORD = 'loadtest123'
+TRADE_AMOUNT = 250.0
+
+
+def watchlist():
+    # Universo del EXPLORADOR leído de app.py (importarla ejecutaría la página)
+    with open(APP, 'r', encoding='utf-8') as f: tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'WATCHLIST_CATEGORIES' for t in node.targets):
+            return [s for v in ast.literal_eval(node.value).values() for s in v]
+    raise RuntimeError("WATCHLIST_CATEGORIES no encontrado en app.py")
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def _rss():
+    # Memoria residente del proceso en bytes
+    try:
+        with open('/proc/self/statm', 'r') as f: pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _state_bytes(at):
+    # Tamaño serializado del session_state (lo que no se serializa cuenta por getsizeof)
+    total = 0
+    for v in at.session_state.values():
+        try:
+            total += len(pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            total += sys.getsizeof(v)
+    return total
+
+
+def _percentiles(samples):
+    if not samples: return {'count': 0}
+    ms = np.array(samples) * 1000
+    return {'count': len(ms), 'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)), 'p99_ms': float(np.percentile(ms, 99)), 'max_ms': float(ms.max())}
+
+
+def _serve_like_streamlit():
+    # AppTest está pensado para una sesión a la vez: en cada run crea un
+    # Runtime simulado global (y lo borra al acabar) y compila app.py con una
+    # caché propia. Como en el servidor, aquí todas las sesiones comparten un
+    # único Runtime y una única compilación del script.
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    class _SharedInstance(type):
+        # El primer Runtime simulado se queda; los siguientes (y el borrado) se ignoran
+        def __setattr__(cls, name, value):
+            if name != '_instance': return super().__setattr__(name, value)
+            if value is not None and Runtime._instance is None: Runtime._instance = value
+
+    shared = ScriptCache()
+    app_test.Runtime = _SharedInstance('Runtime', (Runtime,), {})
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: shared
+    # Los avisos de obsolescencia se repetirían en cada rerun de cada sesión
+    config.get_option('logger.level')
+    set_log_level('error')
+
+
+# ==========================================
+# USUARIO SIMULADO
+# ==========================================
+class SimulatedUser:
+    def __init__(self, name, symbols, steps, think, seed, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.name = name
+        self.symbols = symbols
+        self.steps = steps
+        self.think = think
+        self.rng = random.Random(seed)
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.samples = []      # (acción, segundos)
+        self.errors = defaultdict(int)
+
+    def _run(self, action):
+        t0 = time.perf_counter()
+        try:
+            self.at.run()
+        except Exception as e:
+            self.errors[action] += 1
+            print(f"[{self.name}] {action}: {type(e).__name__}: {e}", file=sys.stderr)
+            return False
+        self.samples.append((action, time.perf_counter() - t0))
+        if self.at.exception:
+            self.errors[action] += 1
+            print(f"[{self.name}] {action}: {self.at.exception[0].value}", file=sys.stderr)
+            return False
+        return True
+
+    # --- ACCIONES ---
+    def login(self):
+        self._run('open')
+        self.at.text_input(key='lu').input(self.name)
+        self.at.text_input(key='lp').input(PASSWORD)
+        next(b for b in self.at.button if b.label == 'INICIAR SESIÓN').click()
+        self._run('login')
+        return bool(self.at.session_state['authenticated']) if 'authenticated' in self.at.session_state else False
+
+    def switch_ticker(self):
+        current = self.at.session_state['ticker_actual']
+        symbol = self.rng.choice([s for s in self.symbols if s != current] or self.symbols)
+        self.at.button(key=f'b_{symbol}').click()
+        self._run('ticker')
+
+    def switch_timeframe(self):
+        current = self.at.select_slider(key='tf_selector').value
+        self.at.select_slider(key='tf_selector').set_value(self.rng.choice([t for t in TIMEFRAMES if t != current]))
+        self._run('timeframe')
+
+    def trade(self):
+        # Vende toda la posición si la hay y, si no, compra a mercado
+        sell = self.at.number_input(key='sell_qty_input')
+        if sell.max:
+            self.at.button(key='btn_sell_all').click()
+            self._run('trade')
+            self.at.button(key='btn_sell').click()
+        else:
+            self.at.number_input(key='buy_amount_input').set_value(TRADE_AMOUNT)
+            self.at.button(key='btn_buy').click()
+        self._run('trade')
+
+    def session(self, start):
+        start.wait()
+        if not self.login():
+            self.errors['login'] += 1
+            return
+        actions, weights = list(ACTIONS), list(ACTIONS.values())
+        handlers = {'ticker': self.switch_ticker, 'timeframe': self.switch_timeframe, 'trade': self.trade}
+        for _ in range(self.steps):
+            if self.think: time.sleep(self.rng.uniform(0, 2 * self.think))
+            action = self.rng.choices(actions, weights)[0]
+            try:
+                handlers[action]()
+            except Exception as e:   # un widget que no está (p. ej. la página falló)
+                self.errors[action] += 1
+                print(f"[{self.name}] {action}: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+# ==========================================
+# NIVELES DE CARGA
+# ==========================================
+def _reset_app():
+    # Cada nivel arranca en frío: cachés de Streamlit, almacén de velas y telemetría vacíos
+    import streamlit as st
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    shutil.rmtree(APP_DATA, ignore_errors=True)
+    os.makedirs(APP_DATA)
+    REGISTRY.reset()
+
+
+def _warm_process(symbol, timeout):
+    # Un rerun completo antes del primer nivel: los imports perezosos de la app
+    # (plotly, pandas, TextBlob...) no deben contarse como memoria de sesión
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.session_state['authenticated'] = True
+    at.session_state['user_current'] = 'load_warmup'
+    at.session_state['ticker_actual'] = symbol
+    at.run()
+
+
+def run_level(level, n, provider, symbols, steps, think, seed, timeout):
+    _reset_app()
+    provider.reset_calls()
+    store = UserStore()
+    names = [f'load{level:02d}_{i:04d}' for i in range(n)]
+    for name in names:
+        if not store.exists(name): store.create(name, PASSWORD)
+
+    gc.collect()
+    rss_before = _rss()
+    users = [SimulatedUser(name, symbols, steps, think, seed + i, timeout) for i, name in enumerate(names)]
+    start = threading.Barrier(n)
+    threads = [threading.Thread(target=u.session, args=(start,), name=u.name) for u in users]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t0
+    gc.collect()
+    rss_after = _rss()   # con todas las sesiones aún vivas
+
+    by_action = defaultdict(list)
+    for u in users:
+        for action, seconds in u.samples: by_action[action].append(seconds)
+    reruns = [s for u in users for a, s in u.samples if a != 'open']
+    errors = defaultdict(int)
+    for u in users:
+        for action, k in u.errors.items(): errors[action] += k
+    state = [_state_bytes(u.at) for u in users]
+    ledger = Ledger()
+    caches = [{k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in row.items()}
+              for row in REGISTRY.cache_table()]
+
+    rec = {
+        'users': n, 'steps': steps, 'think': think, 'elapsed_s': elapsed,
+        'reruns': len(reruns), 'reruns_per_s': len(reruns) / elapsed if elapsed else None,
+        'latency': _percentiles(reruns),
+        'by_action': {a: _percentiles(s) for a, s in sorted(by_action.items())},
+        'errors': dict(errors),
+        'memory': {'rss_before_mb': rss_before / 2**20, 'rss_after_mb': rss_after / 2**20,
+                   'rss_per_session_mb': (rss_after - rss_before) / n / 2**20,
+                   'session_state_kb': float(np.mean(state)) / 1024, 'session_state_max_kb': max(state) / 1024},
+        'caches': caches,
+        'fills': sum(ledger.count_fills(name) for name in names),
+        'upstream_calls': sum(provider.calls.values()),
+    }
+    lat, mem = rec['latency'], rec['memory']
+    print(f"N={n:<4} reruns={rec['reruns']:<5} p50={lat.get('p50_ms', 0):8.1f} ms  p95={lat.get('p95_ms', 0):8.1f} ms  "
+          f"p99={lat.get('p99_ms', 0):8.1f} ms  mem/sesión={mem['rss_per_session_mb']:6.1f} MB  "
+          f"state={mem['session_state_kb']:6.1f} KB  errores={sum(errors.values())}  ejecuciones={rec['fills']}  llamadas={rec['upstream_calls']}")
+    for row in caches:
+        ratio = row['hit_ratio']
+        print(f"    {row['cache']:<24} aciertos={'   -' if ratio is None else f'{ratio:6.1%}'}  "
+              f"hits={row['hits']:<6} stale={row['stale']:<5} misses={row['misses']:<5} evictions={row['evictions']}")
+    return rec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de TITANIUM con sesiones concurrentes")
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--steps', type=int, default=15, help="Acciones por usuario tras el login")
+    parser.add_argument('--think', type=float, default=0.0, help="Pausa media entre acciones (s)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latencia simulada por llamada (s)")
+    parser.add_argument('--fixtures', default=None, help="Fixtures grabados (por defecto, sintéticos del EXPLORADOR)")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Plazo por rerun (s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    try:
+        _serve_like_streamlit()
+    except ImportError:
+        parser.error("streamlit no disponible")
+
+    symbols = watchlist()
+    fixtures = args.fixtures or os.path.join(LOAD_DATA, 'fixtures')
+    provider = ReplayProvider(fixtures, latency=args.latency)
+    missing = [s for s in symbols if s not in provider.symbols()]
+    if missing:
+        print(f"Generando {len(missing)} fixtures sintéticos en {fixtures}")
+        synthesize(fixtures, missing)
+        provider = ReplayProvider(fixtures, latency=args.latency)
+    market_provider.set_provider(provider)
+
+    records = []
+    try:
+        _warm_process(symbols[0], args.timeout)
+        for level, n in enumerate(args.users):
+            records.append(run_level(level, n, provider, symbols, args.steps, args.think, args.seed, args.timeout))
+    finally:
+        shutil.rmtree(LOAD_DATA, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(), 'git_commit': _git_commit(),
+            'python': sys.version.split()[0], 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'fixtures': None if fixtures.startswith(LOAD_DATA) else os.path.abspath(fixtures),
+            'latency': args.latency, 'users': args.users, 'steps': args.steps, 'think': args.think,
+            'actions': ACTIONS, 'seed': args.seed,
+        },
+        'levels': records,
+    }
+    out = args.out or os.path.join(RESULTS, 'load_' + datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '.json')
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f: json.dump(report, f, indent=2, default=str)
+    print(f"\nResultados: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# PROVEEDOR LOCAL QUE REPRODUCE RESPUESTAS GRABADAS
+# ==========================================
+# Imita la parte de yfinance que usa la app (Ticker.history/info/fast_info/
+# news y download) leyendo fixtures de disco. Las velas se desplazan en
+# semanas completas para que la última caiga en la semana actual, y cada
+# llamada puede simular la latencia de red.
+#
+# Formato: <root>/<SÍMBOLO>/history_<intervalo>.csv, info.json,
+# fast_info.json y news.json (ver benchmarks/record.py).
+
+INTERVALS = ['5m', '15m', '60m', '1d', '1wk']
+RECORD_PERIODS = {'5m': '60d', '15m': '60d', '60m': '730d', '1d': '5y', '1wk': 'max'}
+HISTORY_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def parse_period(period):
+    # '5d', '6mo', '1y', 'max' -> DateOffset (None = todo)
+    if not period or period == 'max': return None
+    for suffix, key in (('mo', 'months'), ('d', 'days'), ('y', 'years'), ('wk', 'weeks')):
+        if period.endswith(suffix):
+            return pd.DateOffset(**{key: int(period[:-len(suffix)])})
+    raise ValueError(f"periodo no soportado: {period}")
+
+
+def _as_tz(value, tz):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize(tz) if ts.tzinfo is None else ts.tz_convert(tz)
+
+
+class _FastInfo:
+    def __init__(self, data):
+        self.last_price = data.get('last_price', np.nan)
+        self.previous_close = data.get('previous_close', np.nan)
+
+
+class ReplayTicker:
+    def __init__(self, provider, symbol):
+        self._p = provider
+        self.ticker = symbol.upper()
+
+    def history(self, period=None, interval='1d', start=None, end=None, **kwargs):
+        self._p._call('history', self.ticker)
+        return self._p.slice(self.ticker, interval, period, start, end)
+
+    @property
+    def info(self):
+        self._p._call('info', self.ticker)
+        return dict(self._p.json(self.ticker, 'info', {'longName': self.ticker}))
+
+    @property
+    def fast_info(self):
+        self._p._call('fast_info', self.ticker)
+        return _FastInfo(self._p.json(self.ticker, 'fast_info', {}))
+
+    @property
+    def news(self):
+        self._p._call('news', self.ticker)
+        return list(self._p.json(self.ticker, 'news', []))
+
+
+class ReplayProvider:
+    def __init__(self, root, latency=0.0, rebase=True):
+        self.root = root
+        self.latency = latency
+        self.rebase = rebase
+        self.calls = Counter()
+        self._frames = {}
+        self._json = {}
+        self._lock = threading.Lock()
+
+    # --- CARGA DE FIXTURES (en memoria tras la primera lectura) ---
+    def symbols(self):
+        if not os.path.isdir(self.root): return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def frame(self, symbol, interval):
+        key = (symbol, interval)
+        with self._lock:
+            if key in self._frames: return self._frames[key]
+        path = os.path.join(self.root, symbol, f'history_{interval}.csv')
+        if not os.path.exists(path):
+            df = pd.DataFrame(columns=HISTORY_COLUMNS, index=pd.DatetimeIndex([], tz='UTC'))
+        else:
+            df = pd.read_csv(path, index_col=0)
+            df.index = pd.to_datetime(df.index, utc=True).tz_convert(self.json(symbol, 'meta', {}).get('tz', 'UTC'))
+            if self.rebase and len(df):
+                # Desplazamiento en semanas completas: conserva días hábiles y horarios
+                weeks = (pd.Timestamp.now(tz=df.index.tz) - df.index[-1]).days // 7
+                if weeks > 0: df.index = df.index + pd.Timedelta(weeks=weeks)
+        with self._lock:
+            self._frames[key] = df
+        return df
+
+    def slice(self, symbol, interval, period=None, start=None, end=None):
+        # Mismo recorte que Yahoo: 'start' manda sobre 'period'
+        df = self.frame(symbol, interval)
+        if df.empty: return df
+        if start is not None:
+            df = df[df.index >= _as_tz(start, df.index.tz)]
+        elif period:
+            offset = parse_period(period)
+            if offset is not None: df = df[df.index > df.index[-1] - offset]
+        if end is not None: df = df[df.index < _as_tz(end, df.index.tz)]
+        return df.copy()
+
+    def json(self, symbol, name, default):
+        key = (symbol, name)
+        with self._lock:
+            if key in self._json: return self._json[key]
+        path = os.path.join(self.root, symbol, f'{name}.json')
+        try:
+            with open(path, 'r') as f: data = json.load(f)
+        except (OSError, ValueError):
+            data = default
+        with self._lock:
+            self._json[key] = data
+        return data
+
+    def _call(self, kind, symbol):
+        with self._lock:
+            self.calls[kind] += 1
+        if self.latency: time.sleep(self.latency)
+
+    # --- API TIPO yfinance ---
+    def Ticker(self, symbol):
+        return ReplayTicker(self, symbol)
+
+    def download(self, tickers, period=None, interval='1d', start=None, group_by='column', **kwargs):
+        if isinstance(tickers, str): tickers = tickers.replace(',', ' ').split()
+        self._call('download', ','.join(tickers))
+        frames = {}
+        for s in tickers:
+            df = self.slice(s.upper(), interval, period, start)
+            if len(df): frames[s.upper()] = df.tz_convert('UTC')[HISTORY_COLUMNS]
+        if not frames: return pd.DataFrame()
+        data = pd.concat(frames, axis=1, sort=True)            # columnas (ticker, campo)
+        if group_by != 'ticker': data = data.swaplevel(0, 1, axis=1).sort_index(axis=1)
+        return data
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+
+# ==========================================
+# FIXTURES SINTÉTICOS DETERMINISTAS
+# ==========================================
+# Para máquinas sin fixtures grabados: series GBM con el mismo formato.
+
+def _bars(index, rng, start_price, vol):
+    steps = rng.standard_normal(len(index)) * vol
+    close = start_price * np.exp(np.cumsum(steps))
+    spread = np.abs(rng.standard_normal(len(index))) * vol * close
+    open_ = np.concatenate([[start_price], close[:-1]])
+    return pd.DataFrame({
+        'Open': open_, 'High': np.maximum(open_, close) + spread, 'Low': np.minimum(open_, close) - spread,
+        'Close': close, 'Volume': rng.integers(1_000, 1_000_000, len(index)).astype(float)
+    }, index=index)
+
+
+def synthesize(root, symbols, seed=7, tz='America/New_York'):
+    end = pd.Timestamp.now(tz=tz).normalize()
+    days = pd.bdate_range(end=end, periods=5 * 252, tz=tz)
+    headlines = ["Strong earnings beat expectations", "Shares fall after weak guidance",
+                 "Analysts remain neutral ahead of results", "Record revenue lifts outlook",
+                 "Regulators open investigation", "New product launch draws praise"]
+    for i, sym in enumerate(symbols):
+        rng = np.random.default_rng(seed + i)
+        folder = os.path.join(root, sym)
+        os.makedirs(folder, exist_ok=True)
+        price = float(rng.uniform(10, 500))
+        for interval in INTERVALS:
+            if interval in ('5m', '15m', '60m'):
+                step = {'5m': 5, '15m': 15, '60m': 60}[interval]
+                n_days = 60 if interval != '60m' else 250
+                idx = pd.DatetimeIndex([d + pd.Timedelta(hours=9, minutes=30) + pd.Timedelta(minutes=step * k)
+                                        for d in days[-n_days:] for k in range(390 // step)])
+                df = _bars(idx, rng, price, 0.002)
+            elif interval == '1d':
+                df = daily = _bars(days, rng, price, 0.02)
+            else:
+                weeks = pd.date_range(end=end, periods=20 * 52, freq='W-MON', tz=tz)
+                df = _bars(weeks, rng, price, 0.045)
+            df.to_csv(os.path.join(folder, f'history_{interval}.csv'))
+        last = daily['Close'].iloc[-1]
+        with open(os.path.join(folder, 'meta.json'), 'w') as f: json.dump({'tz': tz}, f)
+        with open(os.path.join(folder, 'info.json'), 'w') as f: json.dump({'longName': f'{sym} Synthetic Corp.'}, f)
+        with open(os.path.join(folder, 'fast_info.json'), 'w') as f:
+            json.dump({'last_price': float(last), 'previous_close': float(last * 0.99)}, f)
+        news = [{'title': f"{sym}: {headlines[(i + k) % len(headlines)]}", 'publisher': 'Synthetic Wire', 'link': '#'} for k in range(8)]
+        with open(os.path.join(folder, 'news.json'), 'w') as f: json.dump(news, f)
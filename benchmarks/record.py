@@ -0,0 +1,49 @@
+import os
+import json
+import argparse
+
+from benchmarks.provider import INTERVALS, RECORD_PERIODS
+
+# ==========================================
+# GRABACIÓN DE FIXTURES DESDE YAHOO
+# ==========================================
+# Guarda history (todos los intervalos que usa la app), info, fast_info y
+# news de cada símbolo en el formato que lee ReplayProvider.
+#
+#   python -m benchmarks.record AAPL MSFT BTC-USD --out benchmarks/fixtures
+
+
+def record(symbols, out):
+    import yfinance as yf
+    for sym in symbols:
+        sym = sym.upper().strip()
+        folder = os.path.join(out, sym)
+        os.makedirs(folder, exist_ok=True)
+        t = yf.Ticker(sym)
+        tz = 'UTC'
+        for interval in INTERVALS:
+            df = t.history(period=RECORD_PERIODS[interval], interval=interval)
+            if df.empty: continue
+            if df.index.tz is not None: tz = str(df.index.tz)
+            df.to_csv(os.path.join(folder, f'history_{interval}.csv'))
+        try: info = t.info
+        except Exception: info = {'longName': sym}
+        try: fast = {'last_price': float(t.fast_info.last_price), 'previous_close': float(t.fast_info.previous_close)}
+        except Exception: fast = {}
+        try: news = t.news or []
+        except Exception: news = []
+        for name, data in (('meta', {'tz': tz}), ('info', info), ('fast_info', fast), ('news', news)):
+            with open(os.path.join(folder, f'{name}.json'), 'w') as f: json.dump(data, f, default=str)
+        print(f"{sym}: grabado en {folder}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Graba fixtures de yfinance para los benchmarks")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--out', default=os.path.join('benchmarks', 'fixtures'))
+    args = parser.parse_args()
+    record(args.symbols, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+# El almacén de velas y el libro se crean en un directorio temporal propio
+# (hay que fijarlo antes de importar los módulos de la app)
+BENCH_DATA = tempfile.mkdtemp(prefix='titanium_bench_')
+os.environ['TITANIUM_DATA_DIR'] = BENCH_DATA
+os.environ.setdefault('TITANIUM_LEDGER', os.path.join(BENCH_DATA, 'ledger.db'))
+# Sin precalentamiento: sus llamadas en segundo plano falsearían el recuento por caso
+os.environ.setdefault('TITANIUM_WARMUP_BUDGET', '0')
+
+import numpy as np
+
+import charting
+import market_provider
+from analysis import AnalysisPipeline
+import pandas as pd
+
+from bar_store import BarStore, Bars
+from indicators import IndicatorEngine
+from quotes import QuoteEngine
+from screener import screen
+from sentiment import SentimentCache
+from benchmarks.provider import ReplayProvider, synthesize
+
+# ==========================================
+# BENCHMARKS OFFLINE
+# ==========================================
+# Reproduce fixtures grabados (o sintéticos) a través de ReplayProvider y
+# mide las funciones de datos, el arranque en frío de un proceso hasta el
+# login y un rerun completo de la app con AppTest, para varios tamaños de
+# universo y rangos. El resultado es un JSON que se
+# puede comparar entre ejecuciones:
+#
+#   python -m benchmarks.run --sizes 1 10 50 --latency 0.05
+#   python -m benchmarks.run --compare results/a.json results/b.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+TIMEFRAMES = ['1d', '5d', '1mo', '6mo', '1y']
+
+
+def _stats(samples):
+    ms = np.array(samples) * 1000
+    return {'repeat': len(ms), 'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)), 'min_ms': float(ms.min())}
+
+
+def _fresh_dir(name):
+    path = os.path.join(BENCH_DATA, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+class Bench:
+    def __init__(self, provider, repeat):
+        self.provider = provider
+        self.repeat = repeat
+        self.records = []
+
+    def measure(self, name, fn, setup=None, universe=0, timeframe=None, phase='cold'):
+        # 'setup' se ejecuta antes de cada repetición y no se cronometra
+        samples, calls = [], 0
+        for _ in range(self.repeat):
+            ctx = setup() if setup else None
+            self.provider.reset_calls()
+            t0 = time.perf_counter()
+            fn(ctx)
+            samples.append(time.perf_counter() - t0)
+            calls += sum(self.provider.calls.values())
+        rec = dict(name=name, universe=universe, timeframe=timeframe, phase=phase,
+                   upstream_calls=calls / self.repeat, **_stats(samples))
+        self.records.append(rec)
+        print(f"{name:<18} n={universe:<5} tf={str(timeframe):<5} {phase:<5} "
+              f"p50={rec['p50_ms']:9.1f} ms  p95={rec['p95_ms']:9.1f} ms  calls={rec['upstream_calls']:.0f}")
+        return rec
+
+    # --- FUNCIONES DE DATOS ---
+    def quotes(self, universe):
+        n = len(universe)
+        self.measure('market_snapshot', lambda e: e.get_quotes(universe), lambda: QuoteEngine(self.provider), n)
+        warm = QuoteEngine(self.provider)
+        warm.get_quotes(universe)
+        self.measure('market_snapshot', lambda e: e.get_quotes(universe), lambda: warm, n, phase='warm')
+
+    def chart(self, universe, timeframes):
+        n = len(universe)
+        for tf in timeframes:
+            def cold():
+                return BarStore(root=_fresh_dir('chart'), provider=self.provider)
+            self.measure('chart_data', lambda st: [st.get_range(s, tf) for s in universe], cold, n, tf)
+            warm = cold()
+            for s in universe: warm.get_range(s, tf)
+            warm.min_refresh = float('inf')
+            self.measure('chart_data', lambda st: [st.get_range(s, tf) for s in universe], lambda: warm, n, tf, 'warm')
+
+    def analysis(self, universe):
+        n = len(universe)
+
+        def cold():
+            store = BarStore(root=_fresh_dir('analysis'), provider=self.provider)
+            return AnalysisPipeline(store, IndicatorEngine(), SentimentCache(), provider=self.provider, timeout=60)
+        self.measure('ai_analysis', lambda p: [p.analyze(s) for s in universe], cold, n)
+        warm = cold()
+        for s in universe: warm.analyze(s)
+        self.measure('ai_analysis', lambda p: [p.analyze(s) for s in universe], lambda: warm, n, phase='warm')
+
+    def screener(self, universe):
+        n = len(universe)
+        cold = lambda: BarStore(root=_fresh_dir('screener'), provider=self.provider)
+        self.measure('screener', lambda st: screen(st, universe), cold, n)
+        warm = cold()
+        screen(warm, universe)
+        warm.min_refresh = float('inf')
+        self.measure('screener', lambda st: screen(st, universe), lambda: warm, n, phase='warm')
+
+    # --- REDUCCIÓN DEL GRÁFICO (símbolo 24/7, 1mo de velas de 60m) ---
+    def downsample(self, n_bars=720, seed=0):
+        # Los fixtures son de acciones (~150 velas en 1mo, sin reducción); una
+        # cripto cotiza 24/7 y supera el presupuesto: se comprueba que la serie
+        # reducida conserva primera y última vela, extremos y volumen
+        rng = np.random.default_rng(seed)
+        close = 60000 * np.exp(np.cumsum(rng.normal(0, 0.004, n_bars)))
+        spread = np.abs(rng.normal(0, 0.003, n_bars)) * close
+        frame = pd.DataFrame({'Open': np.r_[close[0], close[:-1]], 'High': close + spread, 'Low': close - spread,
+                              'Close': close, 'Volume': rng.integers(1, 1000, n_bars).astype(float)},
+                             index=pd.date_range(end=pd.Timestamp.now(tz='UTC').floor('h'), periods=n_bars, freq='h'))
+        bars = Bars(frame.index.as_unit('ns').asi8, {c: frame[c].to_numpy() for c in frame.columns})
+        for method in ('lttb', 'minmax'):
+            for series in (frame, bars):
+                reduced = charting.downsample_ohlcv(series, charting.PIXEL_BUDGET, method)
+                problems = charting.reduction_problems(series, reduced)
+                if len(reduced) > charting.PIXEL_BUDGET: problems.append(f"{len(reduced)} puntos > presupuesto")
+                if problems: raise AssertionError(f"downsample {method} ({type(series).__name__}): {', '.join(problems)}")
+        self.measure('chart_downsample', lambda _: charting.downsample_ohlcv(bars, charting.PIXEL_BUDGET), timeframe='1mo')
+
+    # --- ARRANQUE EN FRÍO (proceso nuevo hasta pintar el login) ---
+    def startup(self):
+        code = ("from streamlit.testing.v1 import AppTest\n"
+                f"at = AppTest.from_file({os.path.join(ROOT, 'app.py')!r}, default_timeout=120)\n"
+                "at.run()\n"
+                "assert not at.exception, at.exception\n")
+        env = dict(os.environ, TITANIUM_METRICS_PORT='0')
+        run = lambda _: subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, check=True, capture_output=True)
+        self.measure('startup_login', run)
+
+    # --- RERUN COMPLETO (AppTest) ---
+    def rerun(self, ticker, timeframes):
+        try:
+            import streamlit as st
+            from streamlit.testing.v1 import AppTest
+        except ImportError:
+            print("streamlit no disponible: se omite el rerun completo")
+            return
+
+        def new_app(tf):
+            at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=120)
+            at.session_state['authenticated'] = True
+            at.session_state['user_current'] = 'bench'
+            at.session_state['ticker_actual'] = ticker
+            at.session_state['tf_selector'] = tf
+            return at
+
+        for tf in timeframes:
+            def cold():
+                st.cache_data.clear()
+                st.cache_resource.clear()
+                shutil.rmtree(BENCH_DATA, ignore_errors=True)
+                os.makedirs(BENCH_DATA)
+                return new_app(tf)
+            self.measure('main_app_rerun', lambda at: at.run(), cold, 1, tf)
+            warm = new_app(tf)
+            warm.run()
+            self.measure('main_app_rerun', lambda at: at.run(), lambda: warm, 1, tf, 'warm')
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(old_path, new_path):
+    # Compara dos ejecuciones por (nombre, universo, rango, fase)
+    def load(p):
+        with open(p, 'r') as f: data = json.load(f)
+        return {(r['name'], r['universe'], r['timeframe'], r['phase']): r for r in data['results']}
+    old, new = load(old_path), load(new_path)
+    print(f"{'benchmark':<40} {'antes p50':>12} {'después p50':>12} {'ratio':>8}")
+    for key in sorted(set(old) & set(new), key=str):
+        a, b = old[key]['p50_ms'], new[key]['p50_ms']
+        label = f"{key[0]} n={key[1]} tf={key[2]} {key[3]}"
+        print(f"{label:<40} {a:12.1f} {b:12.1f} {b / a if a else float('nan'):8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks offline de TITANIUM")
+    parser.add_argument('--fixtures', default=FIXTURES)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--timeframes', nargs='+', default=TIMEFRAMES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help="Latencia simulada por llamada (s)")
+    parser.add_argument('--skip-rerun', action='store_true')
+    parser.add_argument('--skip-startup', action='store_true')
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--compare', nargs=2, metavar=('ANTES', 'DESPUES'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    provider = ReplayProvider(args.fixtures, latency=args.latency)
+    symbols = provider.symbols()
+    if len(symbols) < max(args.sizes):
+        missing = [f'SYN{i:04d}' for i in range(max(args.sizes) - len(symbols))]
+        print(f"Generando {len(missing)} fixtures sintéticos en {args.fixtures}")
+        synthesize(args.fixtures, missing)
+        provider = ReplayProvider(args.fixtures, latency=args.latency)
+        symbols = provider.symbols()
+    market_provider.set_provider(provider)
+
+    bench = Bench(provider, args.repeat)
+    try:
+        for n in args.sizes:
+            universe = symbols[:n]
+            bench.quotes(universe)
+            bench.chart(universe, args.timeframes)
+            bench.analysis(universe)
+            bench.screener(universe)
+        bench.downsample()
+        if not args.skip_startup: bench.startup()
+        if not args.skip_rerun: bench.rerun(symbols[0], args.timeframes)
+    finally:
+        shutil.rmtree(BENCH_DATA, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(), 'git_commit': _git_commit(),
+            'python': sys.version.split()[0], 'platform': platform.platform(),
+            'fixtures': os.path.abspath(args.fixtures), 'latency': args.latency,
+            'repeat': args.repeat, 'sizes': args.sizes, 'timeframes': args.timeframes,
+        },
+        'results': bench.records,
+    }
+    out = args.out or os.path.join(RESULTS, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '.json')
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f: json.dump(report, f, indent=2, default=str)
+    print(f"\nResultados: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,23 @@
-from alpaca_trade_api.rest import REST, TimeFrame
-import time
+from broker_gateway import BrokerGateway, alpaca_client, new_order_id
 
-# --- 1. TUS CREDENCIALES (Cámbialas por las tuyas) ---
-API_KEY = "PKYUQQVTYS4GSDRSXP2XM2EOXF"
-SECRET_KEY = "FRFabiHozG4U5b2y5pc42kmyhiJoPZ2xyGULYGN4PASG"
-
-# Conectamos con la URL de "Paper Trading" (Dinero Ficticio)
-BASE_URL = "https://paper-api.alpaca.markets"
+# --- 1. TUS CREDENCIALES ---
+# Se leen del entorno (ALPACA_API_KEY / ALPACA_SECRET_KEY, y ALPACA_BASE_URL
+# si no es la de "Paper Trading"); nunca en el código.
 
 def probar_conexion():
     try:
-        # Inicializamos la conexión
-        api = REST(API_KEY, SECRET_KEY, BASE_URL)
-        
+        # Cliente persistente de la pasarela (el mismo que usa la app)
+        api = alpaca_client()
+
         # 1. Verificamos cuánto dinero tienes
         cuenta = api.get_account()
         print("--- CONEXIÓN EXITOSA 🚀 ---")
         print(f"Estado de la cuenta: {cuenta.status}")
         print(f"Dinero disponible para invertir: ${float(cuenta.cash):,.2f}")
-        
+
         # 2. Intentamos comprar 1 acción de Apple (AAPL)
         print("\n--- ENVIANDO ORDEN DE COMPRA... ---")
-        
+
         # Verificamos si el mercado está abierto
         clock = api.get_clock()
         if clock.is_open:
@@ -29,16 +25,14 @@ def probar_conexion():
         else:
             print("zzz El mercado está CERRADO. La orden quedará en cola para mañana.")
 
-        # Enviamos la orden
-        orden = api.submit_order(
-            symbol='AAPL',      # Empresa
-            qty=1,              # Cantidad
-            side='buy',         # Comprar
-            type='market',      # Al precio que esté ahora
-            time_in_force='gtc' # 'Good Till Cancelled' (Mantenla activa hasta que se cumpla)
-        )
-        
-        print(f"✅ ¡ORDEN ENVIADA! ID: {orden.id}")
+        # Enviamos la orden por la cola de la pasarela (id idempotente)
+        gateway = BrokerGateway(api)
+        orden = gateway.submit('broker.py', 'AAPL', 'BUY', qty=1, client_order_id=new_order_id()).wait(10)
+
+        if orden.error:
+            print(f"❌ Orden rechazada: {orden.error}")
+            return
+        print(f"✅ ¡ORDEN ENVIADA! ID: {orden.broker_id} (client_order_id {orden.client_order_id})")
         print(f"Estado de la orden: {orden.status}")
         print("Ve a tu panel de Alpaca en la web para verla.")
 
@@ -0,0 +1,443 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fetch_scheduler import TokenBucket
+from matching import MatchingEngine, ORDER_TYPES
+from telemetry import span, count, observe
+
+# ==========================================
+# PASARELA DE ÓRDENES AL BROKER
+# ==========================================
+# Un solo cliente persistente por proceso (su sesión HTTP reutiliza las
+# conexiones) y una cola asíncrona: submit() devuelve al instante un
+# OrderTicket y el envío corre en un pool de hilos acotado por un cubo de
+# tokens. Cada orden lleva un client_order_id elegido por el llamador:
+# repetir el mismo id devuelve la orden ya existente en lugar de duplicarla.
+# El estado de todas las órdenes abiertas se consulta en una sola petición
+# por vuelta del hilo de seguimiento; las que ya no aparecen abiertas se
+# consultan una a una (una vez, al cerrarse). Las órdenes cerradas se olvidan
+# pasado ORDER_RETENTION, así la memoria no crece con cada orden.
+#
+# TITANIUM_BROKER=alpaca usa la API de Alpaca (credenciales en ALPACA_API_KEY
+# y ALPACA_SECRET_KEY); por defecto se usa MockBroker, un broker local que
+# ejecuta a mercado al precio actual y deja las órdenes límite y stop en
+# reposo en un motor de casamiento (paper trading de la app). MockBroker
+# avisa de cada cambio de estado, así esas ejecuciones no esperan al sondeo.
+
+BROKER = os.environ.get('TITANIUM_BROKER', 'mock')
+ALPACA_API_KEY = os.environ.get('ALPACA_API_KEY')
+ALPACA_SECRET_KEY = os.environ.get('ALPACA_SECRET_KEY')
+ALPACA_BASE_URL = os.environ.get('ALPACA_BASE_URL', 'https://paper-api.alpaca.markets')
+
+MAX_INFLIGHT = 8          # envíos simultáneos (y tamaño del pool HTTP)
+ORDER_RATE = 3.0          # peticiones por segundo (Alpaca admite 200/min)
+ORDER_BURST = 10
+POLL_INTERVAL = 1.0       # s entre consultas de estado
+POLL_LIMIT = 500          # órdenes por página de list_orders
+ORDER_RETENTION = 600     # s que se conserva una orden cerrada (reintentos idempotentes y avisos)
+FINAL_STATES = {'filled', 'canceled', 'expired', 'rejected', 'replaced'}
+
+
+def new_order_id(prefix='tt'):
+    return f"{prefix}-{uuid.uuid4().hex}"
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+# ==========================================
+# BROKERS
+# ==========================================
+class MockOrder:
+    # Mismos campos que la entidad Order de alpaca_trade_api (los que usa la pasarela)
+    __slots__ = ('id', 'client_order_id', 'symbol', 'side', 'type', 'qty', 'notional', 'limit_price', 'stop_price',
+                 'status', 'filled_qty', 'filled_avg_price', 'submitted_at', 'filled_at', 'created')
+
+    def __init__(self, id, client_order_id, symbol, side, type, qty, notional, limit_price, stop_price=None):
+        self.id, self.client_order_id = id, client_order_id
+        self.symbol, self.side, self.type = symbol, side, type
+        self.qty, self.notional = qty, notional
+        self.limit_price, self.stop_price = limit_price, stop_price
+        self.status = 'new'
+        self.filled_qty, self.filled_avg_price = 0.0, None
+        self.created = time.time()
+        self.submitted_at, self.filled_at = _iso(self.created), None
+
+
+class MockBrokerError(RuntimeError):
+    pass
+
+
+class MockBroker:
+    # Broker local con la interfaz de alpaca_trade_api.REST que usa la
+    # pasarela. Las órdenes a mercado se ejecutan a price_fn(símbolo); con
+    # fill_delay quedan 'new' ese tiempo y se ejecutan al consultarlas (como un
+    # broker real). Límite y stop esperan en self.engine hasta que un precio
+    # (engine.on_price) cruza su disparo.
+    def __init__(self, price_fn, fill_delay=0.0, latency=0.0, retention=ORDER_RETENTION):
+        self.price_fn = price_fn
+        self.fill_delay = fill_delay
+        self.latency = latency
+        self.retention = retention
+        self._orders = {}      # client_order_id -> MockOrder
+        self._by_id = {}       # id del broker -> MockOrder
+        self._open = {}        # client_order_id -> MockOrder sin estado final
+        self._closed = OrderedDict()   # client_order_id -> instante de cierre (para olvidarlas)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.engine = MatchingEngine(self._matched)
+
+    def add_order_listener(self, fn):
+        # fn(orden) en cada ejecución o cancelación fuera de submit_order
+        self._listeners.append(fn)
+
+    def _notify(self, order):
+        for fn in self._listeners:
+            try:
+                fn(order)
+            except Exception as e:
+                print(f"Error notificando la orden {order.client_order_id}: {e}")
+
+    def _close(self, order, status):
+        # Con el candado tomado
+        order.status = status
+        self._open.pop(order.client_order_id, None)
+        self._closed[order.client_order_id] = time.time()
+
+    def _evict(self):
+        # Con el candado tomado: olvida las órdenes cerradas hace más de retention
+        limit = time.time() - self.retention
+        while self._closed:
+            cid, closed_at = next(iter(self._closed.items()))
+            if closed_at > limit: break
+            del self._closed[cid]
+            order = self._orders.pop(cid, None)
+            if order is not None: self._by_id.pop(order.id, None)
+
+    def _fill(self, order, price):
+        # Con el candado tomado
+        order.filled_qty = order.qty if order.qty is not None else order.notional / price
+        order.filled_avg_price, order.filled_at = price, _iso(time.time())
+        self._close(order, 'filled')
+
+    def _try_fill(self, order):
+        if order.type != 'market' or order.status != 'new' or time.time() - order.created < self.fill_delay: return
+        try:
+            price = float(self.price_fn(order.symbol))
+        except Exception:
+            price = np.nan
+        with self._lock:
+            if order.status != 'new': return
+            if not (np.isfinite(price) and price > 0): self._close(order, 'rejected')
+            else: self._fill(order, price)
+
+    def _matched(self, resting, price):
+        # Ejecución del motor de casamiento (hilo del motor)
+        order = resting.payload
+        with self._lock:
+            if order.status != 'new': return
+            self._fill(order, price)
+        self._notify(order)
+
+    def submit_order(self, symbol, qty=None, side='buy', type='market', time_in_force='day',
+                     limit_price=None, client_order_id=None, notional=None, stop_price=None, **kwargs):
+        if self.latency: time.sleep(self.latency)
+        if (qty is None) == (notional is None): raise MockBrokerError("indica qty o notional")
+        if type != 'market' and type not in ORDER_TYPES: raise MockBrokerError(f"tipo de orden no soportado: {type}")
+        trigger = limit_price if type == 'limit' else stop_price
+        if type != 'market' and not (trigger is not None and float(trigger) > 0):
+            raise MockBrokerError(f"la orden {type} necesita precio de disparo")
+        client_order_id = client_order_id or new_order_id('mock')
+        with self._lock:
+            self._evict()
+            if client_order_id in self._orders: raise MockBrokerError("client_order_id must be unique")
+            self._seq += 1
+            order = MockOrder(f'mock-{self._seq}', client_order_id, symbol, side, type,
+                              float(qty) if qty is not None else None,
+                              float(notional) if notional is not None else None,
+                              float(limit_price) if limit_price is not None else None,
+                              float(stop_price) if stop_price is not None else None)
+            self._orders[client_order_id] = order
+            self._by_id[order.id] = order
+            self._open[client_order_id] = order
+        if type == 'market':
+            self._try_fill(order)
+            return order
+        # Sin precio previo del símbolo se usa el actual: una orden ya cruzada se ejecuta al momento
+        seed = self.engine.last_price(symbol) is None
+        self.engine.add(order.id, symbol, side, type, trigger, payload=order)
+        if seed:
+            try:
+                self.engine.on_price(symbol, float(self.price_fn(symbol)))
+            except Exception:
+                pass
+        return order
+
+    def cancel_order(self, order_id):
+        order = self._by_id.get(order_id)
+        if order is None: raise MockBrokerError("order not found")
+        with self._lock:
+            if order.status in FINAL_STATES: raise MockBrokerError("order is not cancelable")
+            self._close(order, 'canceled')
+        self.engine.cancel(order.id)
+        self._notify(order)
+
+    def get_order_by_client_order_id(self, client_order_id):
+        order = self._orders.get(client_order_id)
+        if order is None: raise MockBrokerError("order not found")
+        self._try_fill(order)
+        return order
+
+    def list_orders(self, status='open', limit=50, after=None, direction='desc', **kwargs):
+        if self.latency: time.sleep(self.latency)
+        with self._lock:
+            self._evict()
+            # Las abiertas tienen su propio índice: el sondeo no recorre las cerradas
+            source = self._open if status == 'open' else self._orders
+            orders = [o for o in source.values() if after is None or o.submitted_at > after]
+        for o in orders: self._try_fill(o)
+        if status == 'open': orders = [o for o in orders if o.status not in FINAL_STATES]
+        elif status == 'closed': orders = [o for o in orders if o.status in FINAL_STATES]
+        orders.sort(key=lambda o: o.submitted_at, reverse=direction == 'desc')
+        return orders[:limit]
+
+
+def alpaca_client(key=ALPACA_API_KEY, secret=ALPACA_SECRET_KEY, base_url=ALPACA_BASE_URL, pool_size=MAX_INFLIGHT):
+    from alpaca_trade_api.rest import REST
+    if not key or not secret: raise RuntimeError("Faltan ALPACA_API_KEY / ALPACA_SECRET_KEY en el entorno")
+    client = REST(key, secret, base_url)
+    # Todas las órdenes reutilizan la sesión HTTP del cliente; su pool se
+    # amplía para los envíos concurrentes
+    session = getattr(client, '_session', None)
+    if session is not None:
+        from requests.adapters import HTTPAdapter
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return client
+
+
+def make_broker(price_fn=None, kind=BROKER):
+    if kind == 'alpaca': return alpaca_client()
+    return MockBroker(price_fn)
+
+
+# ==========================================
+# PASARELA
+# ==========================================
+class OrderTicket:
+    # Estado local de una orden enviada por la pasarela
+    def __init__(self, user, symbol, side, qty, notional, client_order_id, type='market', limit_price=None, stop_price=None):
+        self.user, self.symbol, self.side = user, symbol, side.upper()
+        self.qty, self.notional = qty, notional
+        self.client_order_id = client_order_id
+        self.type, self.limit_price, self.stop_price = type, limit_price, stop_price
+        self.status = 'queued'
+        self.broker_id = None
+        self.filled_qty, self.filled_avg_price = 0.0, None
+        self.error = None
+        self.submitted_at = time.time()
+        self.accepted = threading.Event()   # el broker ya respondió (aceptada o rechazada)
+        self.done = threading.Event()
+
+    @property
+    def is_final(self):
+        return self.status in FINAL_STATES
+
+    @property
+    def trigger(self):
+        return self.limit_price if self.type == 'limit' else self.stop_price
+
+    def wait(self, timeout=None, accepted=False):
+        # accepted=True solo espera la respuesta del broker (órdenes en reposo)
+        (self.accepted if accepted else self.done).wait(timeout)
+        return self
+
+
+class BrokerGateway:
+    def __init__(self, client, on_fill=None, on_close=None, max_inflight=MAX_INFLIGHT, rate=ORDER_RATE,
+                 burst=ORDER_BURST, poll_interval=POLL_INTERVAL, retention=ORDER_RETENTION):
+        self.client = client
+        self.on_fill = on_fill            # on_fill(ticket) al ejecutarse (p. ej. apunte en el libro)
+        self.on_close = on_close          # on_close(ticket) en todo estado final (p. ej. liberar reservas)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._tickets = {}     # client_order_id -> OrderTicket
+        self._open = {}        # client_order_id -> OrderTicket aceptadas y sin estado final
+        self._closed = OrderedDict()   # client_order_id -> instante de cierre (para olvidarlas)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix='broker')
+        # Brokers que avisan de sus ejecuciones (MockBroker): sin esperar al sondeo
+        listen = getattr(client, 'add_order_listener', None)
+        if listen is not None: listen(self.on_order_update)
+        self._stop = threading.Event()
+        self._poller = threading.Thread(target=self._poll_loop, name='broker-poll', daemon=True)
+        self._poller.start()
+
+    # --- ENVÍO ---
+    def submit(self, user, symbol, side, qty=None, notional=None, client_order_id=None, type='market',
+               limit_price=None, stop_price=None):
+        cid = client_order_id or new_order_id()
+        with self._lock:
+            ticket = self._tickets.get(cid)
+            if ticket is not None:
+                count('broker_duplicate_submits_total')
+                return ticket
+            ticket = OrderTicket(user, symbol, side, qty, notional, cid, type, limit_price, stop_price)
+            self._tickets[cid] = ticket
+        count('broker_orders_total', side=ticket.side)
+        self._pool.submit(self._send, ticket)
+        return ticket
+
+    def _send(self, ticket):
+        if self.bucket is not None:
+            delay = self.bucket.take()
+            if delay: time.sleep(delay)
+        kwargs = {'symbol': ticket.symbol, 'side': ticket.side.lower(), 'type': ticket.type,
+                  'time_in_force': 'day', 'client_order_id': ticket.client_order_id}
+        if ticket.qty is not None: kwargs['qty'] = ticket.qty
+        else: kwargs['notional'] = ticket.notional
+        if ticket.limit_price is not None: kwargs['limit_price'] = ticket.limit_price
+        if ticket.stop_price is not None: kwargs['stop_price'] = ticket.stop_price
+        try:
+            with span('broker.submit', side=ticket.side):
+                order = self.client.submit_order(**kwargs)
+        except Exception as e:
+            # Si el id ya estaba aceptado (reintento tras un corte) se adopta esa orden
+            try:
+                order = self.client.get_order_by_client_order_id(ticket.client_order_id)
+            except Exception:
+                self._finish(ticket, 'rejected', error=str(e))
+                return
+        self._update(ticket, order)
+
+    # --- SEGUIMIENTO ---
+    def _update(self, ticket, order):
+        status = str(order.status)
+        with self._lock:
+            if ticket.is_final: return
+            ticket.broker_id = str(order.id)
+            ticket.filled_qty = float(order.filled_qty or 0)
+            ticket.filled_avg_price = float(order.filled_avg_price) if order.filled_avg_price else None
+            if status not in FINAL_STATES:
+                ticket.status = status
+                self._open[ticket.client_order_id] = ticket
+                ticket.accepted.set()
+                return
+        self._finish(ticket, status)
+
+    def on_order_update(self, order):
+        # Aviso directo del broker (ejecución o cancelación de una orden en reposo)
+        ticket = self._tickets.get(order.client_order_id)
+        if ticket is not None: self._update(ticket, order)
+
+    def _finish(self, ticket, status, error=None):
+        with self._lock:
+            if ticket.is_final: return     # el envío y el seguimiento pueden llegar a la vez
+            ticket.status, ticket.error = status, error
+            self._open.pop(ticket.client_order_id, None)
+            self._closed[ticket.client_order_id] = time.time()
+        count('broker_order_results_total', status=status)
+        observe('broker_order_seconds', time.time() - ticket.submitted_at, status=status)
+        if ticket.filled_qty > 0 and self.on_fill is not None:
+            try:
+                self.on_fill(ticket)
+            except Exception as e:
+                ticket.error = str(e)
+                print(f"Error registrando la ejecución {ticket.client_order_id}: {e}")
+        if self.on_close is not None:
+            try:
+                self.on_close(ticket)
+            except Exception as e:
+                print(f"Error cerrando la orden {ticket.client_order_id}: {e}")
+        ticket.accepted.set()
+        ticket.done.set()
+
+    def poll(self):
+        # Una sola consulta (paginada) de las órdenes abiertas; las nuestras que
+        # ya no aparecen se cerraron y se consulta solo su estado final
+        with self._lock:
+            pending = dict(self._open)
+        if not pending: return 0
+        after = _iso(min(t.submitted_at for t in pending.values()) - 60)
+        seen, listed = 0, set()
+        try:
+            with span('broker.poll', orders=len(pending)):
+                while True:
+                    page = self.client.list_orders(status='open', after=after, limit=POLL_LIMIT, direction='asc')
+                    for order in page:
+                        ticket = pending.get(order.client_order_id)
+                        if ticket is not None:
+                            listed.add(order.client_order_id)
+                            self._update(ticket, order)
+                            seen += 1
+                    if len(page) < POLL_LIMIT: break
+                    after = page[-1].submitted_at
+                    if not isinstance(after, str): after = after.isoformat()
+                for cid, ticket in pending.items():
+                    if cid in listed or ticket.is_final: continue
+                    self._update(ticket, self.client.get_order_by_client_order_id(cid))
+                    seen += 1
+        except Exception as e:
+            count('broker_poll_errors_total')
+            print(f"Error consultando el estado de las órdenes: {e}")
+        return seen
+
+    def evict(self):
+        # Olvida las órdenes cerradas hace más de retention; devuelve cuántas
+        limit = time.time() - self.retention
+        evicted = 0
+        with self._lock:
+            while self._closed:
+                cid, closed_at = next(iter(self._closed.items()))
+                if closed_at > limit: break
+                del self._closed[cid]
+                self._tickets.pop(cid, None)
+                evicted += 1
+        return evicted
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            self.evict()
+            self.poll()
+
+    def stop(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False)
+
+    # --- CANCELACIÓN ---
+    def cancel(self, client_order_id):
+        # Asíncrona: el estado 'canceled' llega por aviso del broker o por el sondeo
+        ticket = self._tickets.get(client_order_id)
+        if ticket is None or ticket.is_final or ticket.broker_id is None: return False
+        self._pool.submit(self._cancel, ticket)
+        return True
+
+    def _cancel(self, ticket):
+        try:
+            with span('broker.cancel'):
+                self.client.cancel_order(ticket.broker_id)
+        except Exception as e:
+            # Normalmente ya se ejecutó: el siguiente aviso o sondeo trae el estado final
+            print(f"No se pudo cancelar {ticket.client_order_id}: {e}")
+
+    # --- CONSULTAS ---
+    def get(self, client_order_id):
+        return self._tickets.get(client_order_id)
+
+    def open_orders(self):
+        with self._lock:
+            return len(self._open)
+
+    def open_for(self, user):
+        # Órdenes abiertas de un usuario, de la más antigua a la más reciente
+        with self._lock:
+            return sorted((t for t in self._open.values() if t.user == user), key=lambda t: t.submitted_at)
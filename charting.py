@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# REDUCCIÓN DE SERIES PARA GRÁFICOS
+# ==========================================
+# El navegador no puede dibujar más puntos que píxeles: se reduce cada serie
+# en el servidor a un presupuesto fijo conservando su forma (LTTB o min/max
+# por bloque) antes de enviarla a Plotly.
+
+# Presupuesto ligado al ancho del gráfico: con más de un punto cada
+# POINTS_PER_PX píxeles las velas se solapan. En acciones los rangos del
+# selector salen de la pirámide con ~80-260 puntos (1d: 78 de 5m, 1y: ~252
+# diarias), por debajo del presupuesto; los símbolos que cotizan 24/7 (cripto,
+# p. ej. BTC-USD) lo superan: 1mo de velas de 60m son ~720 puntos, así que ahí
+# sí se reduce la serie y, en modo COMPLETO, se dibuja con WebGL.
+CHART_WIDTH_PX = int(os.environ.get('TITANIUM_CHART_WIDTH', '1200'))
+POINTS_PER_PX = 0.5
+
+
+def pixel_budget(width_px=CHART_WIDTH_PX, density=POINTS_PER_PX):
+    return max(100, int(width_px * density))
+
+
+PIXEL_BUDGET = pixel_budget()     # puntos máximos por serie enviada al navegador
+WEBGL_THRESHOLD = PIXEL_BUDGET    # más puntos de los que caben (modo COMPLETO): Scattergl
+
+
+def lttb_indices(y, n_out, x=None):
+    # Largest-Triangle-Three-Buckets: índices de los puntos que mejor
+    # conservan la forma visual de la serie
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3: return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+    y = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(np.nanmean(y)) else 0.0, y)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    out = np.empty(n_out, dtype=np.intp)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        nxt_lo, nxt_hi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if nxt_hi <= nxt_lo: nxt_hi = nxt_lo + 1
+        cx, cy = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return np.unique(out)
+
+
+def minmax_indices(y, n_out):
+    # Mínimo y máximo de cada bloque (conserva picos); vectorizado por bloques
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    if n <= n_out: return np.arange(n)
+    size = int(np.ceil(n / buckets))
+    pad = size * buckets - n
+    grid = np.concatenate([y, np.full(pad, np.nan)]).reshape(buckets, size)
+    base = np.arange(buckets) * size
+    lo = base + np.argmin(np.where(np.isnan(grid), np.inf, grid), axis=1)
+    hi = base + np.argmax(np.where(np.isnan(grid), -np.inf, grid), axis=1)
+    idx = np.unique(np.concatenate([[0, n - 1], lo, hi]))
+    return idx[idx < n]
+
+
+def _extreme_indices(df):
+    # Vela con el máximo y con el mínimo del tramo (High/Low si existen)
+    high = np.asarray(df['High'] if 'High' in df else df['Close'], dtype=float)
+    low = np.asarray(df['Low'] if 'Low' in df else df['Close'], dtype=float)
+    if np.isnan(high).all(): return []
+    return [int(np.nanargmax(high)), int(np.nanargmin(low))]
+
+
+def downsample_ohlcv(df, budget=PIXEL_BUDGET, method='lttb'):
+    # Reduce un DataFrame OHLCV (o bar_store.Bars) al presupuesto; el volumen
+    # de los puntos descartados se acumula en el punto conservado anterior.
+    # Primera y última vela, máximo y mínimo se conservan siempre.
+    if df is None or len(df) <= budget: return df
+    close = np.asarray(df['Close'], dtype=float)
+    keep = _extreme_indices(df)
+    n_out = max(3, budget - len(keep))
+    idx = minmax_indices(close, n_out) if method == 'minmax' else lttb_indices(close, n_out)
+    idx = np.unique(np.concatenate([idx, [0, len(close) - 1], keep]).astype(np.intp))
+    volume = np.add.reduceat(np.nan_to_num(np.asarray(df['Volume'], dtype=float)), idx) if 'Volume' in df else None
+    if not isinstance(df, pd.DataFrame):
+        return df.take(idx) if volume is None else df.take(idx, Volume=volume)
+    out = df.iloc[idx].copy()
+    if volume is not None: out['Volume'] = volume
+    return out
+
+
+def reduction_problems(df, reduced):
+    # Comprobación de una serie reducida frente a la original: lista de lo que
+    # no se conservó (vacía si está bien)
+    if reduced is None or len(reduced) == 0: return ["serie reducida vacía"]
+    problems = []
+    if reduced.index[0] != df.index[0]: problems.append("falta la primera vela")
+    if reduced.index[-1] != df.index[-1]: problems.append("falta la última vela")
+    for col, fn in (('High', np.nanmax), ('Low', np.nanmin)):
+        if col in df and fn(np.asarray(reduced[col], dtype=float)) != fn(np.asarray(df[col], dtype=float)):
+            problems.append(f"se perdió el extremo de {col}")
+    if 'Volume' in df and not np.isclose(np.nansum(np.asarray(reduced['Volume'], dtype=float)),
+                                         np.nansum(np.asarray(df['Volume'], dtype=float))):
+        problems.append("el volumen total no cuadra")
+    return problems
+
+
+def line_trace_class(n_points, threshold=WEBGL_THRESHOLD):
+    # Scatter SVG para series cortas, WebGL para las largas
+    import plotly.graph_objects as go
+    return go.Scattergl if n_points > threshold else go.Scatter
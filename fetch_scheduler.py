@@ -0,0 +1,325 @@
+import time
+import heapq
+import random
+import threading
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from telemetry import count, observe, register_collector
+
+# ==========================================
+# PLANIFICADOR DE PETICIONES AL PROVEEDOR
+# ==========================================
+# Todas las llamadas remotas pasan por aquí: cubo de tokens (ritmo máximo),
+# un número fijo de hilos (concurrencia acotada) y una cola por prioridad
+# (cotización > gráfico > noticias > precalentamiento). Los errores de
+# limitación o de red se reintentan con espera exponencial con jitter y, si
+# se repiten, abren un cortocircuito que rechaza al instante durante un
+# tiempo. Los errores llegan al llamador como UpstreamError con un mensaje
+# que la interfaz puede mostrar.
+
+QUOTE, CHART, NEWS, WARMUP = 0, 1, 2, 3
+PRIORITY_NAMES = {QUOTE: 'quote', CHART: 'chart', NEWS: 'news', WARMUP: 'warmup'}
+KIND_PRIORITY = {'download': QUOTE, 'info': QUOTE, 'fast_info': QUOTE, 'history': CHART, 'news': NEWS}
+
+RATE = 5.0                # peticiones por segundo sostenidas
+BURST = 10                # ráfaga máxima
+MAX_CONCURRENCY = 4
+RETRIES = 3
+BASE_DELAY = 0.5          # s; la espera n-ésima es uniforme en [0, BASE_DELAY * 2**n]
+MAX_DELAY = 8.0
+BREAKER_THRESHOLD = 5     # fallos transitorios seguidos para abrir
+BREAKER_COOLDOWN = 30.0
+CALL_TIMEOUT = 30.0
+
+
+class UpstreamError(RuntimeError):
+    pass
+
+
+class CircuitOpen(UpstreamError):
+    def __init__(self, retry_in):
+        super().__init__(f"proveedor en pausa, reintento en {retry_in:.0f} s")
+        self.retry_in = retry_in
+
+
+def is_transient(exc):
+    # Limitación (429 / YFRateLimitError) o fallo de red: merece reintento
+    name = type(exc).__name__
+    text = str(exc)
+    return ('RateLimit' in name or 'Timeout' in name or 'Connection' in name
+            or '429' in text or 'Too Many Requests' in text)
+
+
+def describe_error(exc):
+    # Texto para la interfaz en lugar de precios a cero
+    if isinstance(exc, CircuitOpen):
+        return f"El proveedor de datos está limitando las peticiones; reintento automático en {exc.retry_in:.0f} s."
+    if isinstance(exc, (FutureTimeout, TimeoutError)):
+        return "El proveedor de datos no respondió a tiempo."
+    if isinstance(exc, UpstreamError):
+        return f"Proveedor de datos: {exc}"
+    return f"Error del proveedor de datos: {exc}"
+
+
+class TokenBucket:
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        # Consume un token; devuelve cuánto hay que esperar antes de usarlo
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None: return 'closed'
+            return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def check(self):
+        # Lanza CircuitOpen si hay que rechazar; en semiabierto deja pasar una sonda
+        with self._lock:
+            if self.opened_at is None: return
+            remaining = self.cooldown - (time.monotonic() - self.opened_at)
+            if remaining > 0: raise CircuitOpen(remaining)
+            if self._probing: raise CircuitOpen(1)
+            self._probing = True
+
+    def reject_if_open(self):
+        # Igual que check() pero sin reservar la sonda (para rechazar antes de encolar)
+        with self._lock:
+            if self.opened_at is None: return
+            remaining = self.cooldown - (time.monotonic() - self.opened_at)
+            if remaining > 0: raise CircuitOpen(remaining)
+
+    def success(self):
+        with self._lock:
+            self.failures, self.opened_at, self._probing = 0, None, False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                if self.opened_at is None or self._probing: count('breaker_open_total')
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'kwargs', 'kind', 'priority', 'future', 'attempt', 'queued_at')
+
+    def __init__(self, fn, args, kwargs, kind, priority):
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+        self.kind, self.priority = kind, priority
+        self.future = Future()
+        self.attempt = 0
+        self.queued_at = time.monotonic()
+
+
+_local = threading.local()
+
+
+class fetch_priority:
+    # with fetch_priority(WARMUP): ... -> las llamadas de este hilo usan esa prioridad
+    def __init__(self, priority):
+        self.priority = priority
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'priority', None)
+        _local.priority = self.priority
+        return self
+
+    def __exit__(self, *exc):
+        _local.priority = self.previous
+        return False
+
+
+def current_priority():
+    # Prioridad fijada en este hilo (None si no hay); para pasarla a otros hilos
+    return getattr(_local, 'priority', None)
+
+
+class FetchScheduler:
+    def __init__(self, rate=RATE, burst=BURST, max_workers=MAX_CONCURRENCY, retries=RETRIES,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY, breaker=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._ready = []       # (prioridad, secuencia, job)
+        self._delayed = []     # (no antes de, secuencia, job) -> reintentos pendientes
+        self._seq = 0
+        self.submitted = Counter()   # prioridad -> trabajos aceptados (gasto por tipo de llamador)
+        self._cond = threading.Condition()
+        self._workers = [threading.Thread(target=self._work, name=f'fetch-{i}', daemon=True) for i in range(max_workers)]
+        for w in self._workers: w.start()
+
+    # --- COLA ---
+    def _push(self, job, not_before=None):
+        with self._cond:
+            self._seq += 1
+            if not_before is None: heapq.heappush(self._ready, (job.priority, self._seq, job))
+            else: heapq.heappush(self._delayed, (not_before, self._seq, job))
+            self._cond.notify()
+
+    def _pop(self):
+        # Espera a que haya un trabajo listo (los reintentos entran al vencer su espera)
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, seq, job = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (job.priority, seq, job))
+                if self._ready: return heapq.heappop(self._ready)[2]
+                self._cond.wait(self._delayed[0][0] - now if self._delayed else None)
+
+    def depth(self):
+        with self._cond:
+            return len(self._ready) + len(self._delayed)
+
+    # --- EJECUCIÓN ---
+    def _work(self):
+        while True:
+            # El token se toma antes de elegir trabajo: al despertar se atiende
+            # el de mayor prioridad que haya en ese momento
+            delay = self.bucket.take()
+            if delay: time.sleep(delay)
+            job = self._pop()
+            if job.attempt == 0 and not job.future.set_running_or_notify_cancel(): continue
+            observe('scheduler_wait_seconds', time.monotonic() - job.queued_at, priority=PRIORITY_NAMES[job.priority])
+            try:
+                self.breaker.check()
+            except CircuitOpen as e:
+                job.future.set_exception(e)
+                continue
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                self._failed(job, e)
+                continue
+            self.breaker.success()
+            job.future.set_result(result)
+
+    def _failed(self, job, exc):
+        if not is_transient(exc):
+            # El proveedor respondió (p. ej. símbolo inexistente): cuenta como éxito y libera la sonda
+            self.breaker.success()
+            job.future.set_exception(exc)
+            return
+        self.breaker.failure()
+        if job.attempt >= self.retries or self.breaker.state == 'open':
+            job.future.set_exception(UpstreamError(f"{job.kind}: {exc}"))
+            return
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** job.attempt))
+        job.attempt += 1
+        count('scheduler_retries_total', kind=job.kind)
+        self._push(job, time.monotonic() + delay)
+
+    # --- API ---
+    def submit(self, fn, *args, kind='call', priority=None, **kwargs):
+        if priority is None: priority = getattr(_local, 'priority', None)
+        if priority is None: priority = KIND_PRIORITY.get(kind, CHART)
+        self.breaker.reject_if_open()   # con el circuito abierto se falla sin hacer cola
+        job = _Job(fn, args, kwargs, kind, priority)
+        count('scheduler_jobs_total', priority=PRIORITY_NAMES[priority])
+        with self._cond: self.submitted[priority] += 1
+        self._push(job)
+        return job.future
+
+    def call(self, fn, *args, kind='call', priority=None, timeout=CALL_TIMEOUT, **kwargs):
+        future = self.submit(fn, *args, kind=kind, priority=priority, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise UpstreamError(f"{kind}: sin respuesta en {timeout:.0f} s")
+
+
+# ==========================================
+# PROVEEDOR PLANIFICADO
+# ==========================================
+class ScheduledTicker:
+    def __init__(self, scheduler, ticker):
+        self._s = scheduler
+        self._t = ticker
+
+    def history(self, *args, **kwargs):
+        return self._s.call(self._t.history, *args, kind='history', **kwargs)
+
+    @property
+    def info(self):
+        return self._s.call(getattr, self._t, 'info', kind='info')
+
+    @property
+    def fast_info(self):
+        return self._s.call(getattr, self._t, 'fast_info', kind='fast_info')
+
+    @property
+    def news(self):
+        return self._s.call(getattr, self._t, 'news', kind='news')
+
+    def __getattr__(self, name):
+        return getattr(self._t, name)
+
+
+class ScheduledProvider:
+    def __init__(self, provider, scheduler):
+        self._p = provider
+        self.scheduler = scheduler
+
+    def Ticker(self, symbol, *args, **kwargs):
+        return ScheduledTicker(self.scheduler, self._p.Ticker(symbol, *args, **kwargs))
+
+    def download(self, *args, **kwargs):
+        return self.scheduler.call(self._p.download, *args, kind='download', **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._p, name)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FetchScheduler()
+            register_collector('scheduler', lambda: {
+                ('scheduler_queue_depth', ()): _scheduler.depth(),
+                ('breaker_open', ()): int(_scheduler.breaker.state != 'closed'),
+            })
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    # Sustituye el planificador del proceso (p. ej. ritmo repartido entre los
+    # procesos de un lote); afecta a los proveedores creados después
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+
+
+def schedule(provider):
+    if provider is None or isinstance(provider, ScheduledProvider): return provider
+    return ScheduledProvider(provider, get_scheduler())
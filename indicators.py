@@ -0,0 +1,172 @@
+import threading
+
+import numpy as np
+
+# ==========================================
+# MOTOR INCREMENTAL DE INDICADORES (RSI / MACD)
+# ==========================================
+# Guarda por símbolo el estado del RSI de Wilder y de las EMAs del MACD y lo
+# avanza en O(1) por vela nueva. Todas las operaciones trabajan sobre arrays,
+# de modo que avanzar miles de símbolos cuesta una sola pasada de NumPy.
+#
+# Las EMAs reproducen pandas .ewm(span=n) (adjust=True) llevando numerador y
+# denominador por separado.
+
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+
+STATE_FIELDS = (
+    'n', 'prev', 'sum_gain', 'sum_loss', 'avg_gain', 'avg_loss',
+    'fast_num', 'fast_den', 'slow_num', 'slow_den', 'sig_num', 'sig_den',
+)
+
+
+def _decay(span):
+    return 1.0 - 2.0 / (span + 1.0)
+
+
+def new_state(size):
+    state = {f: np.zeros(size) for f in STATE_FIELDS}
+    state['prev'][:] = np.nan
+    return state
+
+
+def step(state, closes, period=RSI_PERIOD, fast=MACD_FAST, slow=MACD_SLOW, signal=MACD_SIGNAL):
+    # Devuelve un estado nuevo tras añadir una vela por fila (NaN = sin vela, no avanza)
+    x = np.asarray(closes, dtype=float)
+    valid = ~np.isnan(x)
+    n = state['n']
+    out = {f: a.copy() for f, a in state.items()}
+
+    with np.errstate(invalid='ignore'):
+        delta = np.where(valid & (n > 0), x - state['prev'], 0.0)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+
+    # Primeras 'period' variaciones: media simple; después, suavizado de Wilder
+    warm = valid & (n >= 1) & (n <= period)
+    out['sum_gain'] = np.where(warm, state['sum_gain'] + gain, state['sum_gain'])
+    out['sum_loss'] = np.where(warm, state['sum_loss'] + loss, state['sum_loss'])
+    seed = valid & (n == period)
+    out['avg_gain'] = np.where(seed, out['sum_gain'] / period, state['avg_gain'])
+    out['avg_loss'] = np.where(seed, out['sum_loss'] / period, state['avg_loss'])
+    smooth = valid & (n > period)
+    out['avg_gain'] = np.where(smooth, (state['avg_gain'] * (period - 1) + gain) / period, out['avg_gain'])
+    out['avg_loss'] = np.where(smooth, (state['avg_loss'] * (period - 1) + loss) / period, out['avg_loss'])
+
+    # EMAs ajustadas (equivalentes a pandas adjust=True)
+    xv = np.where(valid, x, 0.0)
+    for key, span in (('fast', fast), ('slow', slow)):
+        d = _decay(span)
+        out[f'{key}_num'] = np.where(valid, xv + d * state[f'{key}_num'], state[f'{key}_num'])
+        out[f'{key}_den'] = np.where(valid, 1.0 + d * state[f'{key}_den'], state[f'{key}_den'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        macd = out['fast_num'] / out['fast_den'] - out['slow_num'] / out['slow_den']
+    d = _decay(signal)
+    macd_v = np.where(valid, macd, 0.0)
+    out['sig_num'] = np.where(valid, macd_v + d * state['sig_num'], state['sig_num'])
+    out['sig_den'] = np.where(valid, 1.0 + d * state['sig_den'], state['sig_den'])
+
+    out['prev'] = np.where(valid, x, state['prev'])
+    out['n'] = np.where(valid, n + 1, n)
+    return out
+
+
+def read_values(state, period=RSI_PERIOD):
+    # (rsi, macd, signal) por fila; NaN si aún no hay historia suficiente
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rs = state['avg_gain'] / state['avg_loss']
+        rsi = np.where(state['n'] > period, 100 - (100 / (1 + rs)), np.nan)
+        macd = state['fast_num'] / state['fast_den'] - state['slow_num'] / state['slow_den']
+        sig = state['sig_num'] / state['sig_den']
+    started = state['n'] > 0
+    return rsi, np.where(started, macd, np.nan), np.where(started, sig, np.nan)
+
+
+class IndicatorEngine:
+    def __init__(self, capacity=64):
+        self._index = {}                      # símbolo -> fila
+        self._state = new_state(capacity)
+        self._last_ts = np.full(capacity, -1, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    # --- FILAS POR SÍMBOLO ---
+    def _grow(self, size):
+        cap = len(self._last_ts)
+        if size <= cap: return
+        new_cap = max(size, cap * 2)
+        extra = new_state(new_cap - cap)
+        self._state = {f: np.concatenate([self._state[f], extra[f]]) for f in STATE_FIELDS}
+        self._last_ts = np.concatenate([self._last_ts, np.full(new_cap - cap, -1, dtype=np.int64)])
+
+    def _rows(self, symbols):
+        for s in symbols:
+            if s not in self._index: self._index[s] = len(self._index)
+        self._grow(len(self._index))
+        return np.array([self._index[s] for s in symbols], dtype=np.intp)
+
+    def _sub(self, rows):
+        return {f: a[rows] for f, a in self._state.items()}
+
+    def _put(self, rows, sub):
+        for f in STATE_FIELDS: self._state[f][rows] = sub[f]
+
+    # --- AVANCE INCREMENTAL ---
+    def update_batch(self, symbols, closes, timestamps=None):
+        # Añade una vela cerrada a cada símbolo en una sola pasada vectorizada
+        with self._lock:
+            rows = self._rows(symbols)
+            self._put(rows, step(self._sub(rows), closes))
+            if timestamps is not None:
+                ts = np.asarray(timestamps, dtype=np.int64)
+                self._last_ts[rows] = np.where(np.isnan(np.asarray(closes, dtype=float)), self._last_ts[rows], ts)
+
+    def update(self, symbol, close, ts=None):
+        self.update_batch([symbol], [close], None if ts is None else [ts])
+
+    def rebuild_batch(self, symbols, close_matrix, timestamps=None):
+        # Reconstruye el estado desde historia almacenada (filas = velas, columnas = símbolos)
+        closes = np.asarray(close_matrix, dtype=float).reshape(-1, len(symbols))
+        with self._lock:
+            rows = self._rows(symbols)
+            sub = new_state(len(rows))
+            for x in closes: sub = step(sub, x)
+            self._put(rows, sub)
+            if timestamps is not None and len(timestamps):
+                self._last_ts[rows] = int(np.asarray(timestamps, dtype=np.int64)[-1])
+            else:
+                self._last_ts[rows] = -1
+
+    def rebuild(self, symbol, closes, timestamps=None):
+        self.rebuild_batch([symbol], np.asarray(closes, dtype=float).reshape(-1, 1), timestamps)
+
+    # --- LECTURA ---
+    def values_batch(self, symbols, provisional=None):
+        # Valores actuales; 'provisional' evalúa una vela aún abierta sin guardarla
+        with self._lock:
+            rows = self._rows(symbols)
+            sub = self._sub(rows)
+        if provisional is not None: sub = step(sub, provisional)
+        return read_values(sub)
+
+    def values(self, symbol, provisional=None):
+        rsi, macd, sig = self.values_batch([symbol], None if provisional is None else [provisional])
+        return float(rsi[0]), float(macd[0]), float(sig[0])
+
+    def sync(self, symbol, close):
+        # Pone al día el estado con una serie de cierres (índice temporal) y
+        # devuelve (rsi, macd, signal). La última vela se trata como provisional.
+        if close is None or len(close) == 0: return np.nan, np.nan, np.nan
+        ts = close.index.asi8 if hasattr(close.index, 'asi8') else np.arange(len(close), dtype=np.int64)
+        values = close.to_numpy(dtype=float)
+        closed_ts, closed = ts[:-1], values[:-1]
+
+        with self._lock:
+            last = int(self._last_ts[self._index[symbol]]) if symbol in self._index else -1
+        pos = np.searchsorted(closed_ts, last)
+        if last < 0 or pos >= len(closed_ts) or closed_ts[pos] != last:
+            # Sin estado o la historia ya no contiene la última vela procesada
+            self.rebuild(symbol, closed, closed_ts)
+        else:
+            for t_, x in zip(closed_ts[pos + 1:], closed[pos + 1:]): self.update(symbol, x, t_)
+        return self.values(symbol, provisional=values[-1])
@@ -0,0 +1,248 @@
+import os
+import time
+import sqlite3
+import threading
+
+from paths import DATA_DIR
+
+# ==========================================
+# LIBRO DE OPERACIONES DURABLE (SQLITE WAL)
+# ==========================================
+# Cada ejecución se añade a 'fills' (solo inserciones) y en la misma
+# transacción se actualizan los saldos materializados de 'accounts' y
+# 'positions' (cantidad y coste medio). Los saldos pueden reconstruirse
+# siempre desde el libro.
+#
+# Las órdenes en reposo reservan al enviarse el efectivo (compra) o las
+# acciones (venta) que gastarán: lo reservado no se puede usar en otras
+# órdenes y su ejecución ya no puede fallar por falta de fondos. Las
+# reservas viven en memoria, como las órdenes en reposo del broker simulado.
+
+LEDGER_PATH = os.environ.get('TITANIUM_LEDGER', os.path.join(DATA_DIR, 'ledger.db'))
+INITIAL_CASH = 10000.0
+COMMISSION_RATE = 0.0015   # comisión por operación (panel de operaciones y backtests)
+QTY_EPS = 1e-9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL CHECK (side IN ('BUY', 'SELL')),
+    qty REAL NOT NULL,
+    price REAL NOT NULL,
+    fee REAL NOT NULL,
+    cash_delta REAL NOT NULL,
+    ts REAL NOT NULL,
+    order_id TEXT
+);
+CREATE INDEX IF NOT EXISTS fills_user_ts ON fills (user, ts);
+CREATE INDEX IF NOT EXISTS fills_user_symbol_ts ON fills (user, symbol, ts);
+CREATE UNIQUE INDEX IF NOT EXISTS fills_order_id ON fills (order_id) WHERE order_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS accounts (
+    user TEXT PRIMARY KEY,
+    initial_cash REAL NOT NULL,
+    cash REAL NOT NULL,
+    last_fill_id INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS positions (
+    user TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    qty REAL NOT NULL,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, symbol)
+);
+"""
+
+
+class InsufficientFunds(ValueError):
+    pass
+
+
+class Ledger:
+    def __init__(self, path=LEDGER_PATH, initial_cash=INITIAL_CASH):
+        self.path = path
+        self.initial_cash = initial_cash
+        self._local = threading.local()
+        self._holds = {}       # order_id -> (usuario, símbolo, efectivo, cantidad)
+        self._holds_lock = threading.RLock()
+        folder = os.path.dirname(path)
+        if folder: os.makedirs(folder, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self._migrate()
+
+    # --- CONEXIÓN POR HILO ---
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self):
+        # Libros creados antes de la columna 'cost': se añade y se calcula desde los fills
+        conn = self._conn()
+        if any(r['name'] == 'cost' for r in conn.execute('PRAGMA table_info(positions)')): return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if any(r['name'] == 'cost' for r in conn.execute('PRAGMA table_info(positions)')):
+                conn.execute('COMMIT')   # otro proceso migró mientras tanto
+                return
+            conn.execute('ALTER TABLE positions ADD COLUMN cost REAL NOT NULL DEFAULT 0')
+            for (user,) in conn.execute('SELECT DISTINCT user FROM positions').fetchall():
+                self._store_costs(conn, user)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def open_account(self, user):
+        self._conn().execute(
+            'INSERT OR IGNORE INTO accounts (user, initial_cash, cash) VALUES (?, ?, ?)',
+            (user, self.initial_cash, self.initial_cash)
+        )
+
+    # --- EJECUCIONES ---
+    def record_fill(self, user, symbol, side, qty, price, fee, cash_delta, order_id=None, ts=None):
+        # Inserta la ejecución y actualiza saldos de forma atómica; valida
+        # fondos y posición dentro de la misma transacción
+        side = side.upper()
+        qty_delta = qty if side == 'BUY' else -qty
+        conn = self._conn()
+        self.open_account(user)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if order_id is not None:
+                # Idempotente por orden: una ejecución ya apuntada no se repite
+                row = conn.execute('SELECT id FROM fills WHERE order_id = ?', (order_id,)).fetchone()
+                if row:
+                    conn.execute('COMMIT')
+                    return row['id']
+            cash = conn.execute('SELECT cash FROM accounts WHERE user = ?', (user,)).fetchone()['cash']
+            row = conn.execute('SELECT qty, cost FROM positions WHERE user = ? AND symbol = ?', (user, symbol)).fetchone()
+            held, held_cost = (row['qty'], row['cost']) if row else (0.0, 0.0)
+            # Lo reservado por otras órdenes no está disponible (la reserva propia, sí)
+            res_cash, res_qty = self.reserved(user, symbol, exclude=order_id)
+            if cash + cash_delta - res_cash < -QTY_EPS: raise InsufficientFunds("Fondos insuficientes.")
+            if held + qty_delta - res_qty < -QTY_EPS: raise InsufficientFunds("Cantidad insuficiente para vender.")
+            # Coste medio: la compra suma lo pagado, la venta descarga su parte proporcional
+            cost_delta = -cash_delta if side == 'BUY' else -(held_cost * qty / held if held > QTY_EPS else 0.0)
+
+            cur = conn.execute(
+                'INSERT INTO fills (user, symbol, side, qty, price, fee, cash_delta, ts, order_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (user, symbol, side, qty, price, fee, cash_delta, ts if ts is not None else time.time(), order_id)
+            )
+            conn.execute('UPDATE accounts SET cash = cash + ?, last_fill_id = ? WHERE user = ?', (cash_delta, cur.lastrowid, user))
+            conn.execute(
+                'INSERT INTO positions (user, symbol, qty, cost) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (user, symbol) DO UPDATE SET qty = qty + excluded.qty, cost = cost + excluded.cost',
+                (user, symbol, qty_delta, cost_delta)
+            )
+            conn.execute('DELETE FROM positions WHERE user = ? AND symbol = ? AND ABS(qty) < ?', (user, symbol, QTY_EPS))
+            conn.execute('COMMIT')
+            if order_id is not None: self.release(order_id)
+            return cur.lastrowid
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # --- RESERVAS DE ÓRDENES EN REPOSO ---
+    def hold(self, order_id, user, symbol, cash=0.0, qty=0.0):
+        # Reserva efectivo o acciones para una orden; InsufficientFunds si no hay disponible
+        with self._holds_lock:
+            if order_id in self._holds: return
+            if cash > self.available_cash(user) + QTY_EPS: raise InsufficientFunds("Fondos insuficientes.")
+            if qty > self.available_qty(user, symbol) + QTY_EPS: raise InsufficientFunds("Cantidad insuficiente para vender.")
+            self._holds[order_id] = (user, symbol, float(cash), float(qty))
+
+    def release(self, order_id):
+        with self._holds_lock:
+            return self._holds.pop(order_id, None) is not None
+
+    def reserved(self, user, symbol=None, exclude=None):
+        # (efectivo reservado del usuario, acciones reservadas de 'symbol')
+        with self._holds_lock:
+            holds = [h for oid, h in self._holds.items() if h[0] == user and oid != exclude]
+        return sum(h[2] for h in holds), sum(h[3] for h in holds if h[1] == symbol)
+
+    def available_cash(self, user):
+        return self.cash(user) - self.reserved(user)[0]
+
+    def available_qty(self, user, symbol):
+        return self.position(user, symbol) - self.reserved(user, symbol)[1]
+
+    # --- SALDOS ---
+    def cash(self, user):
+        self.open_account(user)
+        return self._conn().execute('SELECT cash FROM accounts WHERE user = ?', (user,)).fetchone()['cash']
+
+    def positions(self, user):
+        rows = self._conn().execute('SELECT symbol, qty FROM positions WHERE user = ? ORDER BY symbol', (user,))
+        return {r['symbol']: r['qty'] for r in rows}
+
+    def holdings(self, user):
+        # [(símbolo, cantidad, coste)] para valorar la cartera completa
+        rows = self._conn().execute('SELECT symbol, qty, cost FROM positions WHERE user = ? ORDER BY symbol', (user,))
+        return [(r['symbol'], r['qty'], r['cost']) for r in rows]
+
+    def version(self, user):
+        # Cambia con cada ejecución del usuario (último fill apuntado)
+        row = self._conn().execute('SELECT last_fill_id FROM accounts WHERE user = ?', (user,)).fetchone()
+        return row['last_fill_id'] if row else 0
+
+    def position(self, user, symbol):
+        row = self._conn().execute('SELECT qty FROM positions WHERE user = ? AND symbol = ?', (user, symbol)).fetchone()
+        return row['qty'] if row else 0.0
+
+    def rebuild(self, user):
+        # Rematerializa saldos a partir del libro completo
+        conn = self._conn()
+        self.open_account(user)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            agg = conn.execute('SELECT COALESCE(SUM(cash_delta), 0) AS cash, COALESCE(MAX(id), 0) AS last FROM fills WHERE user = ?', (user,)).fetchone()
+            conn.execute('UPDATE accounts SET cash = initial_cash + ?, last_fill_id = ? WHERE user = ?', (agg['cash'], agg['last'], user))
+            conn.execute('DELETE FROM positions WHERE user = ?', (user,))
+            conn.execute(
+                "INSERT INTO positions (user, symbol, qty) SELECT user, symbol, "
+                "SUM(CASE side WHEN 'BUY' THEN qty ELSE -qty END) AS q FROM fills WHERE user = ? "
+                "GROUP BY symbol HAVING ABS(q) >= ?",
+                (user, QTY_EPS)
+            )
+            self._store_costs(conn, user)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _store_costs(self, conn, user):
+        # Coste medio recalculado recorriendo los fills en orden (dentro de la transacción del llamador)
+        qty, cost = {}, {}
+        for r in conn.execute('SELECT symbol, side, qty, cash_delta FROM fills WHERE user = ? ORDER BY id', (user,)):
+            s, held = r['symbol'], qty.get(r['symbol'], 0.0)
+            if r['side'] == 'BUY':
+                qty[s], cost[s] = held + r['qty'], cost.get(s, 0.0) - r['cash_delta']
+            else:
+                if held > QTY_EPS: cost[s] = cost.get(s, 0.0) * (1 - r['qty'] / held)
+                qty[s] = held - r['qty']
+        conn.executemany('UPDATE positions SET cost = ? WHERE user = ? AND symbol = ?',
+                         [(c, user, s) for s, c in cost.items()])
+
+    # --- CONSULTAS PAGINADAS ---
+    def fills(self, user, limit=20, offset=0, symbol=None):
+        sql = 'SELECT id, ts, symbol, side, qty, price, fee, cash_delta, order_id FROM fills WHERE user = ?'
+        args = [user]
+        if symbol:
+            sql += ' AND symbol = ?'
+            args.append(symbol)
+        sql += ' ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?'
+        return [dict(r) for r in self._conn().execute(sql, args + [limit, offset])]
+
+    def count_fills(self, user, symbol=None):
+        if symbol:
+            return self._conn().execute('SELECT COUNT(*) FROM fills WHERE user = ? AND symbol = ?', (user, symbol)).fetchone()[0]
+        return self._conn().execute('SELECT COUNT(*) FROM fills WHERE user = ?', (user,)).fetchone()[0]
@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+
+import numpy as np
+
+from telemetry import span, count
+
+# ==========================================
+# FEED DE PRECIOS EN VIVO
+# ==========================================
+# Un hilo productor consulta cada pocos segundos los símbolos suscritos (una
+# sola petición en lote) y guarda el último precio; el fragmento de cabecera
+# de la app solo lee de aquí, sin rerun completo ni llamadas propias. Las
+# suscripciones sin lecturas durante SUBSCRIPTION_TTL se dan de baja.
+#
+# TITANIUM_LIVE_FEED=sim usa un paseo aleatorio local (pruebas y demos).
+
+POLL_INTERVAL = float(os.environ.get('TITANIUM_LIVE_POLL', '5'))
+SUBSCRIPTION_TTL = 120
+FEED_SOURCE = os.environ.get('TITANIUM_LIVE_FEED', 'quotes')
+
+
+class QuoteSource:
+    # Precios reales a través del motor de cotizaciones (planificador incluido)
+    def __init__(self, engine):
+        self.engine = engine
+
+    def fetch(self, symbols):
+        # Una sola descarga por vuelta; si falla no se reintenta hasta la siguiente
+        self.engine.refresh_prices(symbols)
+        ok = [s for s in symbols if self.engine.error(s) is None]
+        if not ok: raise self.engine.error(symbols[0])
+        return self.engine.cached(ok)
+
+
+class SimulatedSource:
+    # Paseo aleatorio determinista por símbolo (no toca la red). Cada símbolo
+    # parte de su última cotización guardada (initial(símbolos)) o de 'start'.
+    def __init__(self, seed=7, start=100.0, vol=0.001, initial=None):
+        self.rng = np.random.default_rng(seed)
+        self.start = start
+        self.vol = vol
+        self.initial = initial
+        self._state = {}
+
+    def _seed(self, symbols):
+        new = [s for s in symbols if s not in self._state]
+        known = self.initial(new) if new and self.initial is not None else {}
+        for s in new:
+            price, prev = known.get(s, (np.nan, np.nan))
+            if not (np.isfinite(price) and price > 0): price = prev = self.start
+            self._state[s] = (float(price), float(prev) if np.isfinite(prev) else float(price))
+
+    def fetch(self, symbols):
+        self._seed(symbols)
+        out = {}
+        for s in symbols:
+            price, prev = self._state[s]
+            price *= float(np.exp(self.rng.standard_normal() * self.vol))
+            self._state[s] = (price, prev)
+            out[s] = (price, prev)
+        return out
+
+
+class PriceFeed:
+    def __init__(self, source, interval=POLL_INTERVAL, subscription_ttl=SUBSCRIPTION_TTL):
+        self.source = source
+        self.interval = interval
+        self.subscription_ttl = subscription_ttl
+        self._subs = {}       # símbolo -> última lectura (time.time)
+        self._prices = {}     # símbolo -> (timestamp, precio, cierre anterior)
+        self._listeners = []  # fn(cotizaciones) tras cada vuelta (p. ej. motor de casamiento)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='price-feed', daemon=True)
+        self._thread.start()
+
+    # --- PRODUCTOR ---
+    def _symbols(self, now):
+        with self._lock:
+            for s in [s for s, seen in self._subs.items() if now - seen > self.subscription_ttl]:
+                del self._subs[s]
+            return list(self._subs)
+
+    def poll(self):
+        # Una vuelta del productor: una sola consulta para todos los suscritos
+        symbols = self._symbols(time.time())
+        if not symbols: return 0
+        try:
+            with span('live_feed.poll', symbols=len(symbols)):
+                quotes = self.source.fetch(symbols)
+        except Exception as e:
+            count('live_feed_errors_total')
+            print(f"Error en el feed de precios: {e}")
+            return 0
+        now = time.time()
+        with self._lock:
+            for s, (price, prev) in quotes.items():
+                if np.isfinite(price): self._prices[s] = (now, float(price), float(prev))
+        for fn in self._listeners:
+            try:
+                fn(quotes)
+            except Exception as e:
+                print(f"Error en un consumidor del feed: {e}")
+        return len(quotes)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # --- CONSUMIDORES ---
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def subscribe(self, symbol):
+        symbol = symbol.upper().strip()
+        with self._lock:
+            new = symbol not in self._subs
+            self._subs[symbol] = time.time()
+        if new: self._wake.set()   # primer precio sin esperar a la siguiente vuelta
+
+    def latest(self, symbol):
+        # (precio, % cambio, cambio, antigüedad en s) o None si aún no hay dato
+        symbol = symbol.upper().strip()
+        with self._lock:
+            if symbol in self._subs: self._subs[symbol] = time.time()
+            item = self._prices.get(symbol)
+        if item is None: return None
+        ts, price, prev = item
+        change = price - prev if np.isfinite(prev) else np.nan
+        pct = change / prev * 100 if np.isfinite(prev) and prev else np.nan
+        return price, pct, change, time.time() - ts
+
+
+def make_source(engine, kind=FEED_SOURCE):
+    return SimulatedSource(initial=engine.cached) if kind == 'sim' else QuoteSource(engine)
@@ -0,0 +1,32 @@
+import threading
+
+from telemetry import instrument
+from fetch_scheduler import schedule
+
+# ==========================================
+# PROVEEDOR DE DATOS DE MERCADO
+# ==========================================
+# Punto único del que los motores obtienen 'yf'. Por defecto es yfinance;
+# los benchmarks y pruebas de carga instalan aquí un proveedor local que
+# reproduce respuestas grabadas. Las llamadas pasan por el planificador
+# (fetch_scheduler: ritmo, prioridad, reintentos y cortocircuito) y cada
+# intento real se cuenta y cronometra (telemetry.InstrumentedProvider).
+
+_provider = None
+_lock = threading.Lock()
+
+
+def get_provider():
+    global _provider
+    with _lock:
+        if _provider is None:
+            import yfinance as yf
+            _provider = schedule(instrument(yf))
+        return _provider
+
+
+def set_provider(provider):
+    # None vuelve a yfinance en el próximo get_provider()
+    global _provider
+    with _lock:
+        _provider = schedule(instrument(provider))
@@ -0,0 +1,148 @@
+import heapq
+import itertools
+import queue
+import threading
+
+import numpy as np
+
+from telemetry import count
+
+# ==========================================
+# MOTOR DE CASAMIENTO (PAPER TRADING)
+# ==========================================
+# Órdenes en reposo de todos los usuarios, por símbolo en dos montículos
+# indexados por precio de disparo: las que saltan cuando el precio sube
+# (venta límite / take-profit, compra stop) y las que saltan cuando baja
+# (compra límite, venta stop / stop-loss). Cada precio nuevo solo mira
+# la cima de cada montículo: sin cruces cuesta O(1) y cada ejecución
+# O(log n). Las ejecuciones se entregan desde un hilo propio, así ni el feed
+# de precios ni ninguna sesión esperan al libro de operaciones. Cancelar es
+# perezoso: la orden se marca y se descarta al llegar a la cima; cada símbolo
+# lleva la cuenta de sus órdenes vivas y su libro se borra al quedar en cero
+# (el feed deja de seguirlo) o se compacta si acumula demasiadas canceladas.
+
+UP, DOWN = 'up', 'down'
+COMPACT_MIN = 64      # entradas muertas toleradas antes de compactar un libro
+ORDER_TYPES = ('limit', 'stop')
+
+
+def trigger_side(side, type):
+    # Compra límite y venta stop saltan al bajar el precio; venta límite y compra stop, al subir
+    if type == 'limit': return DOWN if side == 'buy' else UP
+    if type == 'stop': return UP if side == 'buy' else DOWN
+    raise ValueError(f"tipo de orden sin precio de disparo: {type}")
+
+
+class RestingOrder:
+    __slots__ = ('order_id', 'symbol', 'side', 'type', 'trigger', 'payload', 'active')
+
+    def __init__(self, order_id, symbol, side, type, trigger, payload=None):
+        self.order_id, self.symbol, self.side, self.type = order_id, symbol, side, type
+        self.trigger, self.payload = trigger, payload
+        self.active = True
+
+
+class MatchingEngine:
+    def __init__(self, on_fill):
+        self.on_fill = on_fill     # on_fill(orden, precio) desde el hilo de ejecuciones
+        self._books = {}           # símbolo -> {UP: [(disparo, seq, orden)], DOWN: [(-disparo, seq, orden)]}
+        self._orders = {}          # order_id -> RestingOrder activa
+        self._live = {}            # símbolo -> órdenes activas en su libro
+        self._last = {}            # símbolo -> último precio visto
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._fills = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._deliver, name='matching', daemon=True)
+        self._thread.start()
+
+    # --- LIBRO ---
+    def add(self, order_id, symbol, side, type, trigger, payload=None):
+        # Si el último precio ya cruza el disparo, se ejecuta al momento
+        side, symbol = side.lower(), symbol.upper()
+        book_side = trigger_side(side, type)
+        order = RestingOrder(order_id, symbol, side, type, float(trigger), payload)
+        with self._lock:
+            if order_id in self._orders: return False
+            book = self._books.setdefault(symbol, {UP: [], DOWN: []})
+            key = order.trigger if book_side == UP else -order.trigger
+            heapq.heappush(book[book_side], (key, next(self._seq), order))
+            self._orders[order_id] = order
+            self._live[symbol] = self._live.get(symbol, 0) + 1
+            last = self._last.get(symbol)
+        count('matching_orders_total', type=type)
+        if last is not None: self.on_price(symbol, last)
+        return True
+
+    def cancel(self, order_id):
+        with self._lock:
+            order = self._orders.pop(order_id, None)
+            if order is None: return False
+            order.active = False
+            self._drop(order.symbol)
+        return True
+
+    def _drop(self, symbol, n=1):
+        # Con el candado tomado: n órdenes del símbolo dejaron de estar vivas
+        live = self._live.get(symbol, 0) - n
+        if live <= 0:
+            self._live.pop(symbol, None)
+            self._books.pop(symbol, None)
+            return
+        self._live[symbol] = live
+        book = self._books[symbol]
+        if len(book[UP]) + len(book[DOWN]) - live > max(COMPACT_MIN, live):
+            for side in (UP, DOWN):
+                book[side] = [entry for entry in book[side] if entry[2].active]
+                heapq.heapify(book[side])
+
+    # --- PRECIOS ---
+    def on_price(self, symbol, price):
+        # Cotización: lo cruzado se ejecuta a ese precio (igual o mejor que el límite)
+        if not np.isfinite(price): return 0
+        return self._match(symbol.upper(), price)
+
+    def on_prices(self, prices):
+        return sum(self.on_price(s, p) for s, p in prices.items())
+
+    def _match(self, symbol, price):
+        fills = []
+        with self._lock:
+            self._last[symbol] = price
+            book = self._books.get(symbol)
+            if book is None: return 0
+            up, down = book[UP], book[DOWN]
+            while up and up[0][0] <= price:
+                order = heapq.heappop(up)[2]
+                if order.active: fills.append((order, price))
+            while down and -down[0][0] >= price:
+                order = heapq.heappop(down)[2]
+                if order.active: fills.append((order, price))
+            for order, _ in fills:
+                order.active = False
+                self._orders.pop(order.order_id, None)
+            if fills: self._drop(symbol, len(fills))
+        for fill in fills: self._fills.put(fill)
+        return len(fills)
+
+    def _deliver(self):
+        while True:
+            order, price = self._fills.get()
+            try:
+                self.on_fill(order, price)
+                count('matching_fills_total', type=order.type)
+            except Exception as e:
+                print(f"Error entregando la ejecución {order.order_id}: {e}")
+
+    # --- CONSULTAS ---
+    def last_price(self, symbol):
+        with self._lock:
+            return self._last.get(symbol.upper())
+
+    def symbols(self):
+        # Símbolos con órdenes en reposo (los que el feed debe seguir consultando)
+        with self._lock:
+            return list(self._books)
+
+    def depth(self):
+        with self._lock:
+            return len(self._orders)
@@ -0,0 +1,9 @@
+import os
+
+# ==========================================
+# DIRECTORIO DE DATOS
+# ==========================================
+# Sin dependencias: los módulos que solo necesitan la ruta (usuarios, libro,
+# caché compartida) no cargan pandas al importarse.
+
+DATA_DIR = os.environ.get('TITANIUM_DATA_DIR', 'market_data')
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# VALORACIÓN DE CARTERA (MARK-TO-MARKET VECTORIZADO)
+# ==========================================
+# Las posiciones viven en arrays paralelos (cantidad, coste, precio, valor):
+# valor de mercado, P&L no realizado y pesos son operaciones sobre arrays.
+# Un cambio de precio solo toca su fila y los totales acumulados, sin
+# recorrer la cartera; la estructura se reconstruye únicamente cuando el
+# libro cambia (nueva ejecución).
+
+
+class PortfolioValuation:
+    def __init__(self, holdings=(), version=None):
+        self.version = None
+        self.symbols = []
+        self._index = {}
+        self.qty = np.zeros(0)
+        self.cost = np.zeros(0)
+        self.price = np.zeros(0)
+        self.value = np.zeros(0)
+        self.set_positions(holdings, version)
+
+    # --- ESTRUCTURA ---
+    def set_positions(self, holdings, version=None):
+        # holdings: [(símbolo, cantidad, coste)]. Se conservan los precios ya conocidos.
+        old_price = dict(zip(self.symbols, self.price))
+        self.version = version
+        self.symbols = [h[0] for h in holdings]
+        self._index = {s: i for i, s in enumerate(self.symbols)}
+        self.qty = np.array([h[1] for h in holdings], dtype=float)
+        self.cost = np.array([h[2] for h in holdings], dtype=float)
+        self.price = np.array([old_price.get(s, np.nan) for s in self.symbols], dtype=float)
+        self.value = self.qty * self.price
+        self._totals()
+
+    def _totals(self):
+        priced = np.isfinite(self.price)
+        self.total_value = float(self.value[priced].sum())
+        self.priced_cost = float(self.cost[priced].sum())
+
+    # --- PRECIOS (INCREMENTAL) ---
+    def update_prices(self, symbols, prices):
+        # Lote de precios (símbolos sin repetir); solo se tocan las filas que cambian
+        idx = np.fromiter((self._index.get(s, -1) for s in symbols), dtype=int, count=len(symbols))
+        prices = np.asarray(prices, dtype=float)
+        ok = (idx >= 0) & np.isfinite(prices)
+        idx, prices = idx[ok], prices[ok]
+        changed = prices != self.price[idx]
+        idx, prices = idx[changed], prices[changed]
+        if not len(idx): return 0
+        new_value = self.qty[idx] * prices
+        self.total_value += float((new_value - np.nan_to_num(self.value[idx])).sum())
+        self.priced_cost += float(self.cost[idx][np.isnan(self.price[idx])].sum())
+        self.price[idx], self.value[idx] = prices, new_value
+        return len(idx)
+
+    def update_quote(self, symbol, price):
+        # Un solo precio: O(1)
+        i = self._index.get(symbol)
+        if i is None or not np.isfinite(price) or price == self.price[i]: return False
+        new_value = float(self.qty[i] * price)
+        if np.isnan(self.price[i]): self.priced_cost += float(self.cost[i])
+        else: self.total_value -= float(self.value[i])
+        self.total_value += new_value
+        self.price[i], self.value[i] = price, new_value
+        return True
+
+    # --- CONSULTAS ---
+    def quantity(self, symbol):
+        i = self._index.get(symbol)
+        return float(self.qty[i]) if i is not None else 0.0
+
+    def missing(self):
+        return [s for s, p in zip(self.symbols, self.price) if not np.isfinite(p)]
+
+    def summary(self, cash=0.0):
+        unrealized = self.total_value - self.priced_cost
+        return {
+            'cash': cash,
+            'market_value': self.total_value,
+            'unrealized': unrealized,
+            'unrealized_pct': unrealized / self.priced_cost * 100 if self.priced_cost else 0.0,
+            'equity': cash + self.total_value,
+            'missing': len(self.symbols) - int(np.isfinite(self.price).sum()),
+        }
+
+    def table(self):
+        pnl = self.value - self.cost
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pnl_pct = np.where(self.cost != 0, pnl / self.cost * 100, np.nan)
+            weight = self.value / self.total_value * 100 if self.total_value else np.full(len(self.symbols), np.nan)
+        df = pd.DataFrame({
+            'qty': self.qty, 'price': self.price, 'value': self.value, 'cost': self.cost,
+            'pnl': pnl, 'pnl_pct': pnl_pct, 'weight': weight
+        }, index=pd.Index(self.symbols, name='symbol'))
+        return df.sort_values('value', ascending=False)
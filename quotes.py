@@ -0,0 +1,146 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from market_provider import get_provider
+from telemetry import cache_event
+
+# ==========================================
+# MOTOR DE COTIZACIONES MULTI-TICKER
+# ==========================================
+# Una sola descarga masiva para todos los símbolos pedidos y una caché
+# separada (de larga duración) para los nombres de las empresas.
+
+QUOTE_TTL = 60            # segundos de vida de un precio
+NAME_TTL = 24 * 3600      # los nombres casi nunca cambian
+NAME_RETRY = 600          # reintento si 'info' falló para un símbolo
+
+QUOTE_COLUMNS = ['price', 'prev_close', 'change', 'pct_change', 'name']
+
+
+
+def normalize_symbols(symbols):
+    # Mayúsculas, sin vacíos y sin duplicados, conservando el orden
+    seen = []
+    for s in symbols:
+        s = str(s).upper().strip()
+        if s and s not in seen: seen.append(s)
+    return seen
+
+
+def last_two_valid(close):
+    # Último y penúltimo valor no nulo de cada columna, sin bucles por símbolo.
+    # 'remaining' cuenta cuántos valores válidos quedan desde cada fila hasta el final.
+    valid = close.notna()
+    remaining = valid.iloc[::-1].cumsum().iloc[::-1]
+    last = close.where(valid & (remaining == 1)).max()
+    prev = close.where(valid & (remaining == 2)).max()
+    return last, prev
+
+
+class QuoteEngine:
+    def __init__(self, provider=None, quote_ttl=QUOTE_TTL, name_ttl=NAME_TTL, max_workers=8):
+        self.provider = provider if provider is not None else get_provider()
+        self.quote_ttl = quote_ttl
+        self.name_ttl = name_ttl
+        self.max_workers = max_workers
+        self._quotes = {}   # símbolo -> (timestamp, precio, cierre anterior)
+        self._names = {}    # símbolo -> (timestamp, nombre)
+        self._errors = {}   # símbolo -> excepción del último refresco fallido
+        self._lock = threading.Lock()
+
+    # --- PRECIOS ---
+    def _stale_quotes(self, symbols, now):
+        with self._lock:
+            return [s for s in symbols if s not in self._quotes or now - self._quotes[s][0] > self.quote_ttl]
+
+    def _download_closes(self, symbols):
+        data = self.provider.download(
+            symbols, period='5d', interval='1d', group_by='column',
+            auto_adjust=False, progress=False, threads=True
+        )
+        if data is None or data.empty: return pd.DataFrame(columns=symbols, dtype=float)
+        close = data['Close']
+        if isinstance(close, pd.Series): close = close.to_frame(symbols[0])
+        return close.reindex(columns=symbols).astype(float)
+
+    def refresh_prices(self, symbols):
+        symbols = normalize_symbols(symbols)
+        if not symbols: return
+        try:
+            close = self._download_closes(symbols)
+        except Exception as e:
+            print(f"Error fetching quotes: {e}")
+            with self._lock:
+                for s in symbols: self._errors[s] = e
+            return
+        last, prev = last_two_valid(close)
+        now = time.time()
+        with self._lock:
+            for s in symbols:
+                self._quotes[s] = (now, float(last.get(s, np.nan)), float(prev.get(s, np.nan)))
+                self._errors.pop(s, None)
+
+    # --- NOMBRES (CACHÉ DE METADATOS) ---
+    def _fetch_name(self, symbol):
+        try:
+            return self.provider.Ticker(symbol).info.get('longName', symbol), True
+        except Exception:
+            return symbol, False
+
+    def refresh_names(self, symbols):
+        now = time.time()
+        with self._lock:
+            missing = [s for s in symbols if s not in self._names or now - self._names[s][0] > self.name_ttl]
+        cache_event('names', 'hit', len(symbols) - len(missing))
+        if not missing: return
+        cache_event('names', 'miss', len(missing))
+        workers = max(1, min(self.max_workers, len(missing)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(self._fetch_name, missing))
+        with self._lock:
+            for s, (name, ok) in zip(missing, results):
+                # Si falló, se guarda el símbolo pero se reintenta antes
+                ts = now if ok else now - self.name_ttl + NAME_RETRY
+                self._names[s] = (ts, name or s)
+
+    # --- TABLA VECTORIZADA ---
+    def get_quotes(self, symbols, names=True):
+        symbols = normalize_symbols(symbols)
+        if not symbols: return pd.DataFrame(columns=QUOTE_COLUMNS)
+        stale = self._stale_quotes(symbols, time.time())
+        cache_event('quotes', 'hit', len(symbols) - len(stale))
+        if stale:
+            cache_event('quotes', 'miss', len(stale))
+            self.refresh_prices(stale)
+        if names: self.refresh_names(symbols)
+
+        with self._lock:
+            rows = [self._quotes.get(s, (0, np.nan, np.nan)) for s in symbols]
+            labels = [self._names.get(s, (0, s))[1] for s in symbols]
+        arr = np.array([r[1:] for r in rows], dtype=float).reshape(len(symbols), 2)
+        price, prev_close = arr[:, 0], arr[:, 1]
+        change = price - prev_close
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct_change = np.where(prev_close != 0, change / prev_close * 100, np.nan)
+
+        return pd.DataFrame({
+            'price': price, 'prev_close': prev_close,
+            'change': change, 'pct_change': pct_change, 'name': labels
+        }, index=pd.Index(symbols, name='symbol'))
+
+    def cached(self, symbols):
+        # {símbolo: (precio, cierre anterior)} de lo ya guardado, sin pedir nada al proveedor
+        with self._lock:
+            return {s: self._quotes[s][1:] for s in normalize_symbols(symbols) if s in self._quotes}
+
+    def get_quote(self, symbol):
+        return self.get_quotes([symbol]).iloc[0]
+
+    def error(self, symbol):
+        # Excepción del último intento fallido de cotizar 'symbol' (None si fue bien)
+        with self._lock:
+            return self._errors.get(str(symbol).upper().strip())
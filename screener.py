@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+from bar_store import slice_range
+from indicators import new_state, step, read_values
+from quotes import last_two_valid
+
+# ==========================================
+# SCREENER VECTORIZADO (FUSIÓN DE PROBABILIDAD)
+# ==========================================
+# Las mismas reglas que get_ai_analysis, aplicadas como operaciones de arrays
+# sobre una matriz de cierres alineada (filas = velas, columnas = símbolos).
+
+SCREENER_COLUMNS = ['price', 'pct_change', 'rsi', 'macd', 'signal', 'sentiment', 'prob', 'rec']
+
+
+def fusion_score(rsi, macd, signal, sent_score):
+    # Parte de 50 y suma/resta según RSI, cruce MACD y sentimiento; recorta a 0..100
+    rsi, macd, signal, sent = np.broadcast_arrays(
+        np.asarray(rsi, dtype=float), np.asarray(macd, dtype=float),
+        np.asarray(signal, dtype=float), np.asarray(sent_score, dtype=float)
+    )
+    prob = np.full(rsi.shape, 50.0)
+    prob += np.where(rsi < 30, 20, np.where(rsi > 70, -20, 0))
+    # Sin MACD (historia insuficiente o etapa técnica caída) no suma ni resta
+    prob += np.where(np.isnan(macd) | np.isnan(signal), 0, np.where(macd > signal, 10, -10))
+    prob += np.where(sent > 60, 15, np.where(sent < 40, -15, 0))
+    return np.clip(prob, 0, 100)
+
+
+def recommendation(prob):
+    # Misma etiqueta que muestra la pestaña de análisis
+    prob = np.asarray(prob, dtype=float)
+    return np.select(
+        [prob > 70, prob > 55, prob < 30],
+        ["COMPRA FUERTE", "COMPRA", "VENTA FUERTE"],
+        default="NEUTRAL"
+    )
+
+
+def close_matrix(store, symbols, period='6mo', refresh=True):
+    # Cierres diarios alineados por fecha; NaN donde un símbolo no cotiza
+    if refresh: store.update_many(symbols, '1d')
+    series = {}
+    for s in symbols:
+        df = slice_range(store.read(s, '1d'), period)
+        if df is not None and not df.empty:
+            series[s] = pd.Series(df['Close'].to_numpy(), index=df.index.tz_convert('UTC').normalize())
+    if not series: return pd.DataFrame(columns=symbols, dtype=float)
+    closes = pd.concat(series, axis=1, sort=True)
+    closes = closes[~closes.index.duplicated(keep='last')]
+    return closes.reindex(columns=symbols)
+
+
+def sentiment_vector(symbols, sentiment=None):
+    # Score 0..100 por símbolo; 50 (neutral) donde no hay sentimiento
+    if sentiment is None: return np.full(len(symbols), 50.0)
+    return pd.Series(sentiment, dtype=float).reindex(symbols).fillna(50.0).to_numpy()
+
+
+def apply_sentiment(table, sentiment):
+    # Re-puntúa una tabla ya calculada con el sentimiento conocido (sin
+    # recalcular indicadores): solo cambian sentiment, prob y rec
+    if table.empty or not sentiment: return table
+    table = table.copy()
+    table['sentiment'] = sentiment_vector(list(table.index), sentiment)
+    table['prob'] = fusion_score(table['rsi'], table['macd'], table['signal'], table['sentiment'])
+    table['rec'] = recommendation(table['prob'])
+    return table.sort_values(['prob', 'rsi'], ascending=[False, True], kind='stable')
+
+
+def score_matrix(closes, sentiment=None):
+    # Una pasada vectorizada por vela para todo el universo
+    symbols = list(closes.columns)
+    values = closes.to_numpy(dtype=float)
+    state = new_state(len(symbols))
+    for row in values: state = step(state, row)
+    rsi, macd, sig = read_values(state)
+
+    sent = sentiment_vector(symbols, sentiment)
+    prob = fusion_score(rsi, macd, sig, sent)
+    last, prev = last_two_valid(closes)
+    price, prev = last.to_numpy(dtype=float), prev.to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.where(prev > 0, (price - prev) / prev * 100, np.nan)
+
+    table = pd.DataFrame({
+        'price': price, 'pct_change': pct, 'rsi': rsi, 'macd': macd, 'signal': sig,
+        'sentiment': sent, 'prob': prob, 'rec': recommendation(prob)
+    }, index=pd.Index(symbols, name='symbol'))
+    # Sin historia suficiente no hay score
+    table = table[state['n'] > 0]
+    return table.sort_values(['prob', 'rsi'], ascending=[False, True], kind='stable')
+
+
+def screen(store, symbols, sentiment=None, period='6mo', refresh=True):
+    symbols = [s.upper().strip() for s in symbols if s and s.strip()]
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols: return pd.DataFrame(columns=SCREENER_COLUMNS)
+    return score_matrix(close_matrix(store, symbols, period, refresh), sentiment)
+
+
+def page(table, number, size=25):
+    # Página 'number' (desde 1) de la tabla ordenada
+    start = max(0, (number - 1) * size)
+    return table.iloc[start:start + size]
@@ -0,0 +1,163 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from telemetry import span, cache_event
+
+# ==========================================
+# CACHÉ DE SENTIMIENTO DE TITULARES
+# ==========================================
+# Clave = hash del titular normalizado, así el mismo titular cuesta un solo
+# análisis aunque aparezca en varios tickers o durante horas. LRU acotada con
+# caducidad, persistencia opcional en disco y puntuación de los fallos en lote
+# sobre un pool de hilos.
+
+MAX_ENTRIES = 20000
+ENTRY_TTL = 7 * 24 * 3600
+BATCH_SIZE = 16
+SAVE_EVERY = 50   # nuevas puntuaciones entre escrituras a disco
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_headline(title):
+    return _SPACES.sub(' ', str(title)).strip().lower()
+
+
+def headline_key(title):
+    return hashlib.sha1(normalize_headline(title).encode('utf-8')).hexdigest()
+
+
+def textblob_polarity(titles):
+    from textblob import TextBlob
+    return [TextBlob(t).sentiment.polarity for t in titles]
+
+
+def polarity_label(pol):
+    if pol > 0.1: return "POSITIVO"
+    elif pol < -0.1: return "NEGATIVO"
+    return "NEUTRAL"
+
+
+class SentimentCache:
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, ttl=ENTRY_TTL, max_workers=4, scorer=textblob_polarity):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.scorer = scorer
+        self._entries = OrderedDict()   # clave -> (polaridad, timestamp)
+        self._pending = {}              # clave -> Future del lote que la puntúa
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sentiment')
+        self._unsaved = 0
+        self.hits = self.misses = self.evictions = 0
+        if path: self.load()
+
+    # --- LRU CON CADUCIDAD ---
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None: return None
+        if now - entry[1] > self.ttl:
+            del self._entries[key]
+            self.evictions += 1
+            cache_event('sentiment', 'eviction')
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, pol, now):
+        self._entries[key] = (float(pol), now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            cache_event('sentiment', 'eviction')
+
+    def get(self, title):
+        with self._lock:
+            return self._get(headline_key(title), time.time())
+
+    # --- PUNTUACIÓN EN LOTE ---
+    def _score_chunk(self, keys, titles):
+        try:
+            with span('sentiment.score', headlines=len(titles)):
+                pols = self.scorer(titles)
+        except Exception:
+            pols = [None] * len(titles)
+        now = time.time()
+        with self._lock:
+            for k, p in zip(keys, pols):
+                self._pending.pop(k, None)
+                if p is not None:
+                    self._put(k, p, now)
+                    self._unsaved += 1
+            flush = self.path and self._unsaved >= SAVE_EVERY
+        if flush: self.save()
+        return dict(zip(keys, pols))
+
+    def submit(self, titles):
+        # Lanza en segundo plano los titulares que falten; devuelve los futures implicados
+        keys = [headline_key(t) for t in titles]
+        now = time.time()
+        futures, todo = set(), {}
+        with self._lock:
+            for k, t in zip(keys, titles):
+                if self._get(k, now) is not None:
+                    self.hits += 1
+                    cache_event('sentiment', 'hit')
+                elif k in self._pending:
+                    futures.add(self._pending[k])
+                elif k not in todo:
+                    self.misses += 1
+                    cache_event('sentiment', 'miss')
+                    todo[k] = t
+            items = list(todo.items())
+            for i in range(0, len(items), BATCH_SIZE):
+                chunk = items[i:i + BATCH_SIZE]
+                ks = [k for k, _ in chunk]
+                fut = self._pool.submit(self._score_chunk, ks, [t for _, t in chunk])
+                for k in ks: self._pending[k] = fut
+                futures.add(fut)
+        return keys, futures
+
+    def score_batch(self, titles, timeout=None):
+        # Polaridades en el orden de 'titles'; None si no se terminó a tiempo
+        # (el resultado queda en caché para la siguiente llamada)
+        titles = list(titles)
+        keys, futures = self.submit(titles)
+        if futures: wait(futures, timeout=timeout)
+        now = time.time()
+        with self._lock:
+            return [self._get(k, now) for k in keys]
+
+    # --- PERSISTENCIA ---
+    def load(self):
+        try:
+            with open(self.path, 'r') as f: raw = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            for k, (pol, ts) in sorted(raw.items(), key=lambda kv: kv[1][1]):
+                if now - ts <= self.ttl: self._put(k, pol, ts)
+
+    def save(self):
+        if not self.path: return
+        with self._lock:
+            data = {k: [p, ts] for k, (p, ts) in self._entries.items()}
+            self._unsaved = 0
+        folder = os.path.dirname(self.path)
+        if folder: os.makedirs(folder, exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f: json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'pending': len(self._pending),
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
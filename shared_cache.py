@@ -0,0 +1,305 @@
+import os
+import time
+import pickle
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from paths import DATA_DIR
+from telemetry import cache_event
+
+# ==========================================
+# CACHÉ COMPARTIDA ENTRE PROCESOS (SINGLE-FLIGHT + STALE-WHILE-REVALIDATE)
+# ==========================================
+# Los workers de Streamlit comparten resultados a través de un almacén común:
+# un directorio local (por defecto) o Redis si TITANIUM_REDIS_URL está
+# definido. Por clave solo un llamador refresca (candado con caducidad en el
+# propio almacén); el resto recibe el valor caducado si existe o espera al
+# que está refrescando. Dentro de stale_ttl el valor caducado se sirve de
+# inmediato y el refresco corre en segundo plano.
+#
+# Los valores ya deserializados se guardan en memoria (LRU) con un límite
+# total de bytes, medido por el tamaño serializado de cada valor, para que
+# la memoria del worker no crezca con cada símbolo y rango visitado.
+
+CACHE_DIR = os.environ.get('TITANIUM_SHARED_CACHE', os.path.join(DATA_DIR, 'shared_cache'))
+REDIS_URL = os.environ.get('TITANIUM_REDIS_URL')
+LOCK_TTL = 30          # un candado más viejo que esto se considera abandonado
+WAIT_TIMEOUT = 10      # espera máxima por el refresco de otro proceso
+POLL_INTERVAL = 0.05
+SWEEP_INTERVAL = 600   # cada cuánto se borran del disco los valores caducados
+MEMO_BYTES = int(float(os.environ.get('TITANIUM_CACHE_MEMORY_MB', '256')) * 2**20)
+
+
+class DiskBackend:
+    # Un fichero por clave (escritura atómica con os.replace) y un fichero de
+    # candado creado con O_EXCL. Cada fichero empieza con su caducidad (8 bytes,
+    # 0 = sin caducidad): los caducados no se leen y se barren periódicamente
+    _EXPIRY = struct.Struct('>d')
+
+    def __init__(self, root=CACHE_DIR, sweep_interval=SWEEP_INTERVAL):
+        self.root = root
+        self.sweep_interval = sweep_interval
+        self._swept_at = time.time()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, f'{key}.{ext}')
+
+    def stamp(self, key):
+        # Versión barata del valor guardado (permite reutilizar lo ya deserializado)
+        try:
+            return os.stat(self._path(key, 'pkl')).st_mtime_ns
+        except OSError:
+            return None
+
+    def _expired(self, header, now):
+        if len(header) < self._EXPIRY.size: return True
+        expires = self._EXPIRY.unpack(header[:self._EXPIRY.size])[0]
+        return 0 < expires < now
+
+    def get(self, key):
+        path = self._path(key, 'pkl')
+        try:
+            with open(path, 'rb') as f: data = f.read()
+        except OSError:
+            return None
+        if self._expired(data, time.time()):
+            self._remove(path)
+            return None
+        return data[self._EXPIRY.size:]
+
+    def set(self, key, data, ttl=None):
+        os.makedirs(self.root, exist_ok=True)
+        now = time.time()
+        tmp = self._path(key, f'{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(self._EXPIRY.pack(now + ttl + 1 if ttl else 0.0))
+            f.write(data)
+        os.replace(tmp, self._path(key, 'pkl'))
+        if now - self._swept_at >= self.sweep_interval: self.sweep(now)
+
+    def sweep(self, now=None):
+        # Borra los valores caducados (claves que ya nadie pide); devuelve cuántos
+        now = time.time() if now is None else now
+        self._swept_at = now
+        removed = 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith('.pkl'): continue
+            path = os.path.join(self.root, name)
+            try:
+                with open(path, 'rb') as f: header = f.read(self._EXPIRY.size)
+            except OSError:
+                continue
+            if self._expired(header, now) and self._remove(path): removed += 1
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, key, ttl=LOCK_TTL):
+        path = self._path(key, 'lock')
+        os.makedirs(self.root, exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(path).st_mtime <= ttl: return False
+                    os.remove(path)   # candado abandonado (proceso caído)
+                except OSError:
+                    pass
+        return False
+
+    def release(self, key):
+        try:
+            os.remove(self._path(key, 'lock'))
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    # Mismo contrato sobre Redis (o cualquier servidor compatible): SET NX PX
+    # como candado y expiración nativa para los valores
+    def __init__(self, url=REDIS_URL, prefix='titanium:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def stamp(self, key):
+        return None
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, data, ttl=None):
+        self.client.set(self.prefix + key, data, ex=int(ttl) + 1 if ttl else None)
+
+    def acquire(self, key, ttl=LOCK_TTL):
+        return bool(self.client.set(self.prefix + key + ':lock', os.getpid(), nx=True, px=int(ttl * 1000)))
+
+    def release(self, key):
+        self.client.delete(self.prefix + key + ':lock')
+
+
+def default_backend():
+    if REDIS_URL:
+        try:
+            return RedisBackend(REDIS_URL)
+        except Exception as e:
+            print(f"Redis no disponible ({e}); se usa la caché en disco")
+    return DiskBackend()
+
+
+class SharedCache:
+    def __init__(self, backend=None, max_workers=4, wait_timeout=WAIT_TIMEOUT, memo_bytes=MEMO_BYTES):
+        self.backend = backend if backend is not None else default_backend()
+        self.wait_timeout = wait_timeout
+        self.memo_bytes = memo_bytes
+        self._memo = OrderedDict()   # clave -> (stamp, stored_at, valor, bytes) ya deserializado
+        self._memo_size = 0
+        self._lock = threading.Lock()
+        self._inflight = {}          # clave -> Future del cálculo en curso en este proceso
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shared-cache')
+
+    @staticmethod
+    def make_key(namespace, *parts):
+        raw = '|'.join([namespace] + [str(p) for p in parts])
+        return f"{namespace}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    # --- MEMORIA (LRU POR BYTES) ---
+    def _remember(self, key, stamp, stored_at, value, size):
+        with self._lock:
+            old = self._memo.pop(key, None)
+            if old is not None: self._memo_size -= old[3]
+            if size > self.memo_bytes: return   # no cabe: se relee del almacén cada vez
+            self._memo[key] = (stamp, stored_at, value, size)
+            self._memo_size += size
+            evicted = 0
+            while self._memo_size > self.memo_bytes:
+                _, old = self._memo.popitem(last=False)
+                self._memo_size -= old[3]
+                evicted += 1
+        if evicted: cache_event('shared.memo', 'eviction', evicted)
+
+    def memo_stats(self):
+        with self._lock:
+            return {'entries': len(self._memo), 'bytes': self._memo_size, 'budget': self.memo_bytes}
+
+    # --- LECTURA Y ESCRITURA ---
+    def _read(self, key):
+        stamp = self.backend.stamp(key)
+        if stamp is not None:
+            with self._lock:
+                memo = self._memo.get(key)
+                if memo is not None and memo[0] == stamp:
+                    self._memo.move_to_end(key)
+                    return memo[1], memo[2]
+        data = self.backend.get(key)
+        if data is None: return None, None
+        try:
+            stored_at, value = pickle.loads(data)
+        except Exception:
+            return None, None
+        if stamp is not None: self._remember(key, stamp, stored_at, value, len(data))
+        return stored_at, value
+
+    def _refresh(self, key, compute, stale_ttl, store_if=None):
+        # Se llama con el candado adquirido; lo libera siempre. Los resultados
+        # que no pasan store_if (p. ej. degradados) se devuelven sin guardarse.
+        try:
+            value = compute()
+            if store_if is None or store_if(value):
+                self.backend.set(key, pickle.dumps((time.time(), value), protocol=pickle.HIGHEST_PROTOCOL), ttl=stale_ttl)
+            return value
+        finally:
+            self.backend.release(key)
+
+    def _refresh_background(self, key, compute, stale_ttl, store_if=None):
+        def run():
+            try:
+                self._refresh(key, compute, stale_ttl, store_if)
+            except Exception as e:
+                print(f"Error refrescando {key}: {e}")
+        self._pool.submit(run)
+
+    # --- API ---
+    def get_or_compute(self, namespace, key_parts, compute, ttl, stale_ttl=None, store_if=None):
+        # Devuelve el valor de compute() compartido entre procesos. Con stale_ttl
+        # el valor caducado (hasta esa edad) se sirve mientras se revalida.
+        stale_ttl = max(stale_ttl or ttl, ttl)
+        key = self.make_key(namespace, *key_parts)
+        stored_at, value = self._read(key)
+        age = time.time() - stored_at if stored_at is not None else None
+
+        if age is not None and age <= ttl:
+            cache_event(f'shared.{namespace}', 'hit')
+            return value
+        if age is not None and age <= stale_ttl:
+            # Stale-while-revalidate: un solo refresco en segundo plano
+            cache_event(f'shared.{namespace}', 'stale')
+            if self.backend.acquire(key): self._refresh_background(key, compute, stale_ttl, store_if)
+            return value
+
+        cache_event(f'shared.{namespace}', 'miss')
+        # Las sesiones de este proceso esperan al cálculo en curso y reciben su
+        # resultado aunque store_if lo rechace (no se guarda, pero tampoco se repite)
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader: flight = self._inflight[key] = Future()
+        if not leader:
+            try:
+                return flight.result(timeout=self.wait_timeout)
+            except FutureTimeout:
+                return compute()
+        try:
+            value = self._compute_shared(key, compute, ttl, stale_ttl, store_if, stored_at)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(value)
+            return value
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+
+    def _compute_shared(self, key, compute, ttl, stale_ttl, store_if, stored_at):
+        deadline = time.time() + self.wait_timeout
+        while True:
+            if self.backend.acquire(key):
+                return self._refresh(key, compute, stale_ttl, store_if)
+            # Otro proceso está calculando: se espera a su resultado
+            time.sleep(POLL_INTERVAL)
+            new_at, new_value = self._read(key)
+            if new_at is not None and new_at != stored_at and time.time() - new_at <= ttl: return new_value
+            if time.time() > deadline:
+                # El otro refresco no termina: se calcula sin coordinar
+                return compute()
+
+    def age(self, namespace, key_parts):
+        # Segundos desde que se guardó el valor (None si no hay)
+        stored_at, _ = self._read(self.make_key(namespace, *key_parts))
+        return time.time() - stored_at if stored_at is not None else None
+
+    def refresh(self, namespace, key_parts, compute, ttl, stale_ttl=None, store_if=None):
+        # Refresco anticipado (precalentamiento): solo si nadie más lo está
+        # refrescando; False si otro proceso tiene el candado
+        key = self.make_key(namespace, *key_parts)
+        if not self.backend.acquire(key): return False
+        self._refresh(key, compute, max(stale_ttl or ttl, ttl), store_if)
+        return True
@@ -0,0 +1,26 @@
+// JS para manejar la persistencia de la sesión en localStorage
+const USER_KEY = 'titanium_user_session';
+
+// 1. Al cargar la página, verifica si hay una sesión guardada
+window.onload = function() {
+    const savedUser = localStorage.getItem(USER_KEY);
+    if (savedUser) {
+        // Si hay un usuario, usa Streamlit.setComponentValue para notificar al backend
+        // Usaremos un componente Streamlit invisible para pasar el valor
+        const element = document.getElementById('session_manager');
+        if (element) {
+            element.value = savedUser;
+            element.dispatchEvent(new Event('change')); 
+        }
+    }
+};
+
+// 2. Función para guardar sesión
+function saveSession(username) {
+    localStorage.setItem(USER_KEY, username);
+}
+
+// 3. Función para borrar sesión (al hacer logout)
+function clearSession() {
+    localStorage.removeItem(USER_KEY);
+}
@@ -0,0 +1,357 @@
+import os
+import sys
+import time
+import bisect
+import threading
+import functools
+import importlib
+from collections import deque, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================================
+# TELEMETRÍA: TRAMOS, CACHÉS Y LLAMADAS AL PROVEEDOR
+# ==========================================
+# Registro único por proceso. Modos (TITANIUM_TELEMETRY):
+#   off  -> span() no mide nada y los contadores no se tocan
+#   low  -> solo agregados (contador, suma, máximo y cubetas por nombre);
+#           coste de un perf_counter y un lock por tramo. Por defecto.
+#   full -> además guarda los últimos tramos con hilo y etiquetas
+# Se exporta en formato de texto Prometheus (prometheus_text) y se puede
+# servir por HTTP en local (start_http_server).
+
+MODES = ('off', 'low', 'full')
+MODE = os.environ.get('TITANIUM_TELEMETRY', 'low').lower()
+if MODE not in MODES: MODE = 'low'
+METRICS_PORT = int(os.environ.get('TITANIUM_METRICS_PORT', '9464'))   # 0 = sin endpoint
+RECENT_SPANS = 500
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = 'titanium'
+
+
+class _Histogram:
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count, self.total, self.max = 0, 0.0, 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)   # la última es +Inf
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max: self.max = value
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+
+    def quantile(self, q):
+        # Límite superior de la cubeta que contiene el cuantil q
+        if not self.count: return 0.0
+        rank, acc = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            acc += n
+            if acc >= rank: return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+
+class Registry:
+    def __init__(self, mode=MODE):
+        self.mode = mode
+        self.started = time.time()
+        self._counters = defaultdict(float)     # (métrica, etiquetas) -> valor
+        self._histograms = {}                   # (métrica, etiquetas) -> _Histogram
+        self._collectors = {}                   # nombre -> fn() -> {(métrica, etiquetas): valor}
+        self._recent = deque(maxlen=RECENT_SPANS)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    # --- REGISTRO ---
+    def count(self, metric, value=1, **labels):
+        if self.mode == 'off': return
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, metric, seconds, **labels):
+        if self.mode == 'off': return
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None: hist = self._histograms[key] = _Histogram()
+            hist.observe(seconds)
+
+    def record_span(self, name, seconds, error=False, **labels):
+        self.observe('span_seconds', seconds, name=name)
+        if error: self.count('span_errors_total', name=name)
+        if self.mode == 'full':
+            with self._lock:
+                self._recent.append({'ts': time.time(), 'name': name, 'ms': seconds * 1000, 'error': error,
+                                     'thread': threading.current_thread().name, **labels})
+
+    def cache_event(self, cache, result, n=1):
+        # result: 'hit', 'miss', 'stale' o 'eviction'
+        self.count('cache_events_total', n, cache=cache, result=result)
+
+    def register_collector(self, name, fn):
+        # fn() devuelve {(métrica, ((etiqueta, valor), ...)): valor} en el momento de exportar
+        with self._lock:
+            self._collectors[name] = fn
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._recent.clear()
+            self.started = time.time()
+
+    # --- LECTURA ---
+    def _gauges(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        out = {}
+        for name, fn in collectors:
+            try:
+                out.update(fn())
+            except Exception as e:
+                print(f"Error en el colector de telemetría {name}: {e}")
+        return out
+
+    def snapshot(self):
+        # Copia consistente para el panel: contadores, histogramas, gauges y tramos recientes
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: {'count': h.count, 'total': h.total, 'max': h.max,
+                         'p50': h.quantile(0.5), 'p95': h.quantile(0.95), 'buckets': list(h.buckets)}
+                     for k, h in self._histograms.items()}
+            recent = list(self._recent)
+        return {'mode': self.mode, 'uptime': time.time() - self.started, 'counters': counters,
+                'histograms': hists, 'gauges': self._gauges(), 'recent': recent}
+
+    def spans_table(self):
+        rows = []
+        for (metric, labels), h in self.snapshot()['histograms'].items():
+            if metric != 'span_seconds': continue
+            rows.append({'span': dict(labels)['name'], 'count': h['count'], 'mean_ms': h['total'] / h['count'] * 1000,
+                         'p50_ms<=': h['p50'] * 1000, 'p95_ms<=': h['p95'] * 1000, 'max_ms': h['max'] * 1000,
+                         'total_s': h['total']})
+        return sorted(rows, key=lambda r: -r['total_s'])
+
+    def cache_table(self):
+        stats = defaultdict(lambda: {'hit': 0, 'stale': 0, 'miss': 0, 'eviction': 0})
+        for (metric, labels), v in self.snapshot()['counters'].items():
+            if metric != 'cache_events_total': continue
+            lab = dict(labels)
+            stats[lab['cache']][lab['result']] = stats[lab['cache']].get(lab['result'], 0) + v
+        rows = []
+        for cache, s in sorted(stats.items()):
+            served = s['hit'] + s['stale'] + s['miss']
+            rows.append({'cache': cache, 'hits': int(s['hit']), 'stale': int(s['stale']), 'misses': int(s['miss']),
+                         'evictions': int(s['eviction']),
+                         'hit_ratio': (s['hit'] + s['stale']) / served if served else float('nan')})
+        return rows
+
+    def upstream_table(self):
+        snap = self.snapshot()
+        rows = {}
+        for (metric, labels), h in snap['histograms'].items():
+            if metric != 'upstream_seconds': continue
+            kind = dict(labels)['kind']
+            rows[kind] = {'kind': kind, 'calls': h['count'], 'errors': 0, 'mean_ms': h['total'] / h['count'] * 1000,
+                          'p95_ms<=': h['p95'] * 1000, 'max_ms': h['max'] * 1000}
+        for (metric, labels), v in snap['counters'].items():
+            if metric == 'upstream_errors_total' and dict(labels)['kind'] in rows:
+                rows[dict(labels)['kind']]['errors'] = int(v)
+        return sorted(rows.values(), key=lambda r: -r['calls'])
+
+    # --- EXPORTACIÓN PROMETHEUS ---
+    def prometheus_text(self):
+        snap = self.snapshot()
+        lines = []
+
+        def fmt(labels):
+            if not labels: return ''
+            esc = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in labels) + '}'
+
+        for kind, items in (('counter', snap['counters']), ('gauge', snap['gauges'])):
+            for metric in sorted({m for m, _ in items}):
+                lines.append(f'# TYPE {PREFIX}_{metric} {kind}')
+                for (m, labels), v in sorted(items.items()):
+                    if m == metric: lines.append(f'{PREFIX}_{m}{fmt(labels)} {v}')
+        for metric in sorted({m for m, _ in snap['histograms']}):
+            lines.append(f'# TYPE {PREFIX}_{metric} histogram')
+            for (m, labels), h in sorted(snap['histograms'].items()):
+                if m != metric: continue
+                acc = 0
+                for bound, n in zip(list(BUCKETS) + ['+Inf'], h['buckets']):
+                    acc += n
+                    lines.append(f'{PREFIX}_{m}_bucket{fmt(labels + (("le", bound),))} {acc}')
+                lines.append(f'{PREFIX}_{m}_sum{fmt(labels)} {h["total"]}')
+                lines.append(f'{PREFIX}_{m}_count{fmt(labels)} {h["count"]}')
+        lines.append(f'# TYPE {PREFIX}_uptime_seconds gauge')
+        lines.append(f'{PREFIX}_uptime_seconds {snap["uptime"]}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+count = REGISTRY.count
+observe = REGISTRY.observe
+cache_event = REGISTRY.cache_event
+register_collector = REGISTRY.register_collector
+
+
+# ==========================================
+# TRAMOS CRONOMETRADOS
+# ==========================================
+class span:
+    # with span('render.chart'): ...  (también sirve como decorador: @span('x'))
+    __slots__ = ('name', 'labels', 't0')
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter() if REGISTRY.enabled else None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.t0 is not None:
+            # Solo cuentan como error las excepciones; st.rerun()/st.stop() son BaseException
+            error = exc_type is not None and issubclass(exc_type, Exception)
+            REGISTRY.record_span(self.name, time.perf_counter() - self.t0, error=error, **self.labels)
+        return False
+
+    def __call__(self, fn):
+        name, labels = self.name, self.labels
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+_miss = threading.local()
+
+
+def mark_miss():
+    # Se llama dentro del cuerpo de una función con @st.cache_data (solo corre en un fallo)
+    _miss.flag = True
+
+
+def traced_cache(name):
+    # Se coloca por fuera de @st.cache_data: cronometra cada llamada y la
+    # cuenta como acierto o fallo según si el cuerpo llamó a mark_miss()
+    def decorate(cached):
+        @functools.wraps(cached)
+        def wrapper(*args, **kwargs):
+            _miss.flag = False
+            with span(name):
+                result = cached(*args, **kwargs)
+            cache_event(name, 'miss' if _miss.flag else 'hit')
+            return result
+        return wrapper
+    return decorate
+
+
+def timed_import(name):
+    # Importación bajo demanda: la primera carga de cada módulo queda en el
+    # histograma 'import_seconds' (perfil de arranque del worker)
+    loaded = name in sys.modules
+    t0 = time.perf_counter()
+    module = importlib.import_module(name)
+    if not loaded: observe('import_seconds', time.perf_counter() - t0, module=name)
+    return module
+
+
+# ==========================================
+# PROVEEDOR INSTRUMENTADO
+# ==========================================
+# Envuelve el proveedor (yfinance o el de replay): cuenta y cronometra cada
+# llamada remota por tipo y registra errores. El resto de atributos pasa tal cual.
+
+def _timed_call(kind, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        count('upstream_errors_total', kind=kind)
+        raise
+    finally:
+        observe('upstream_seconds', time.perf_counter() - t0, kind=kind)
+
+
+class InstrumentedTicker:
+    def __init__(self, ticker):
+        self._t = ticker
+
+    def history(self, *args, **kwargs):
+        return _timed_call('history', self._t.history, *args, **kwargs)
+
+    @property
+    def info(self):
+        return _timed_call('info', getattr, self._t, 'info')
+
+    @property
+    def fast_info(self):
+        return _timed_call('fast_info', getattr, self._t, 'fast_info')
+
+    @property
+    def news(self):
+        return _timed_call('news', getattr, self._t, 'news')
+
+    def __getattr__(self, name):
+        return getattr(self._t, name)
+
+
+class InstrumentedProvider:
+    def __init__(self, provider):
+        self._p = provider
+
+    def Ticker(self, symbol, *args, **kwargs):
+        return InstrumentedTicker(self._p.Ticker(symbol, *args, **kwargs))
+
+    def download(self, *args, **kwargs):
+        return _timed_call('download', self._p.download, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._p, name)
+
+
+def instrument(provider):
+    if provider is None or isinstance(provider, InstrumentedProvider): return provider
+    return InstrumentedProvider(provider)
+
+
+# ==========================================
+# ENDPOINT LOCAL /metrics
+# ==========================================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = REGISTRY.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port=METRICS_PORT, host='127.0.0.1'):
+    # Devuelve el servidor o None si está desactivado o el puerto está ocupado
+    # (p. ej. otro worker ya lo sirve)
+    if not port or not REGISTRY.enabled: return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Endpoint de métricas no disponible en {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from paths import DATA_DIR
+
+# ==========================================
+# ALMACÉN DE USUARIOS (SQLITE WAL)
+# ==========================================
+# Un usuario por fila con clave primaria: búsqueda indexada y altas atómicas
+# de una sola fila (varias sesiones o workers pueden registrar a la vez sin
+# pisarse). Los hashes consultados se guardan en una LRU en memoria, así el
+# login no toca disco en el caso habitual. La primera vez (tabla vacía) se
+# importa el JSON antiguo de usuarios: por defecto users_db.json en el
+# directorio de trabajo (donde lo escribía la versión anterior), o el indicado
+# en TITANIUM_USERS_LEGACY. El JSON no se modifica ni se renombra.
+
+USERS_PATH = os.environ.get('TITANIUM_USERS', os.path.join(DATA_DIR, 'users.db'))
+LEGACY_FILE = os.environ.get('TITANIUM_USERS_LEGACY', 'users_db.json')
+LOGIN_CACHE_SIZE = 10000
+DEFAULT_USERS = {'admin': 'admin123'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    pw_hash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def hash_password(password):
+    return hashlib.sha256(str.encode(password)).hexdigest()
+
+
+class UserExists(ValueError):
+    pass
+
+
+class UserStore:
+    def __init__(self, path=USERS_PATH, legacy_file=LEGACY_FILE, cache_size=LOGIN_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()     # usuario -> hash (None = no existe)
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+        folder = os.path.dirname(path)
+        if folder: os.makedirs(folder, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self.migrate(legacy_file)
+
+    # --- CONEXIÓN POR HILO ---
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # --- MIGRACIÓN DESDE users_db.json ---
+    def migrate(self, legacy_file):
+        # Solo con la tabla vacía (después ya no se vuelve a leer el JSON).
+        # Sin JSON se crean las cuentas por defecto (igual que load_users).
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM users LIMIT 1').fetchone():
+                conn.execute('COMMIT')
+                return 0
+            legacy = None
+            if legacy_file and os.path.exists(legacy_file):
+                with open(legacy_file, 'r') as f: legacy = json.load(f)
+            else:
+                print(f"Aviso: no se encontró {legacy_file or 'el JSON de usuarios'}; se crean las cuentas por defecto")
+            rows = legacy if legacy is not None else {u: hash_password(p) for u, p in DEFAULT_USERS.items()}
+            now = time.time()
+            conn.executemany('INSERT OR IGNORE INTO users (username, pw_hash, created_at) VALUES (?, ?, ?)',
+                             [(u, h, now) for u, h in rows.items()])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    # --- CONSULTAS ---
+    def _hash(self, username):
+        with self._cache_lock:
+            if username in self._cache:
+                self._cache.move_to_end(username)
+                return self._cache[username]
+        row = self._conn().execute('SELECT pw_hash FROM users WHERE username = ?', (username,)).fetchone()
+        pw_hash = row[0] if row else None
+        # Los inexistentes no se guardan: otro worker puede darlos de alta
+        if pw_hash is not None: self._remember(username, pw_hash)
+        return pw_hash
+
+    def _remember(self, username, pw_hash):
+        with self._cache_lock:
+            self._cache[username] = pw_hash
+            self._cache.move_to_end(username)
+            while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+
+    def exists(self, username):
+        return bool(username) and self._hash(username) is not None
+
+    def authenticate(self, username, password):
+        if not username: return False
+        pw_hash = self._hash(username)
+        return pw_hash is not None and hash_password(password) == pw_hash
+
+    def create(self, username, password):
+        # Alta atómica de una fila; la clave primaria resuelve la carrera entre sesiones
+        pw_hash = hash_password(password)
+        try:
+            self._conn().execute('INSERT INTO users (username, pw_hash, created_at) VALUES (?, ?, ?)',
+                                 (username, pw_hash, time.time()))
+        except sqlite3.IntegrityError:
+            raise UserExists("Error: El ID de perfil ya existe.")
+        self._remember(username, pw_hash)
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM users').fetchone()[0]
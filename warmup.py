@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from collections import deque, defaultdict
+
+from fetch_scheduler import WARMUP, fetch_priority, get_scheduler
+from telemetry import span, count
+
+# ==========================================
+# PRECALENTAMIENTO EN SEGUNDO PLANO
+# ==========================================
+# Un hilo por proceso recorre cada pocos segundos el conjunto caliente (los
+# símbolos más visitados, con decaimiento exponencial, más las semillas del
+# EXPLORADOR) y refresca lo que está a punto de caducar, para que la página
+# casi siempre encuentre la caché llena. Sus peticiones salen con prioridad
+# WARMUP (las interactivas pasan antes) y respetan un presupuesto de llamadas
+# al proveedor por minuto; lo que no cabe espera a la siguiente vuelta.
+
+WARMUP_BUDGET = int(os.environ.get('TITANIUM_WARMUP_BUDGET', '60'))      # llamadas/min; 0 = desactivado
+WARMUP_INTERVAL = float(os.environ.get('TITANIUM_WARMUP_INTERVAL', '15'))
+HOT_SET_SIZE = int(os.environ.get('TITANIUM_WARMUP_SIZE', '20'))
+HALF_LIFE = 1800          # s; una visita pesa la mitad al cabo de media hora
+MAX_TRACKED = 5000
+MAX_TIMEFRAMES = 2        # rangos de gráfico precalentados por símbolo
+BUDGET_WINDOW = 60.0
+
+
+class AccessTracker:
+    # Frecuencia de acceso por (símbolo, rango) con decaimiento exponencial;
+    # el decaimiento se aplica al leer, no hay que recorrer todas las claves
+    def __init__(self, half_life=HALF_LIFE, max_keys=MAX_TRACKED):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._scores = {}      # clave -> (puntuación, última actualización)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, last, now):
+        return score * 0.5 ** ((now - last) / self.half_life)
+
+    def touch(self, key, weight=1.0, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            score, last = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, last, now) + weight, now)
+            if len(self._scores) > self.max_keys:
+                # Se descarta la cuarta parte menos visitada
+                ranked = sorted(self._scores, key=lambda k: self._decayed(*self._scores[k], now))
+                for k in ranked[:len(ranked) // 4]: del self._scores[k]
+
+    def scores(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return {k: self._decayed(s, last, now) for k, (s, last) in self._scores.items()}
+
+
+class WarmupScheduler:
+    # refresh(símbolo, rangos) refresca lo que caduca pronto de un símbolo;
+    # prepare(símbolos) se llama antes con todo el conjunto (lotes).
+    def __init__(self, refresh, prepare=None, seeds=(), default_timeframe='1y', budget=WARMUP_BUDGET,
+                 interval=WARMUP_INTERVAL, hot_size=HOT_SET_SIZE, tracker=None, upstream_calls=None):
+        self.refresh = refresh
+        self.prepare = prepare
+        self.seeds = list(seeds)
+        self.default_timeframe = default_timeframe
+        self.budget = budget
+        self.interval = interval
+        self.hot_size = hot_size
+        self.tracker = tracker or AccessTracker()
+        # Llamadas al proveedor hechas con prioridad WARMUP (medida del gasto real)
+        self.upstream_calls = upstream_calls or (lambda: get_scheduler().submitted[WARMUP])
+        self._spent = deque()     # (timestamp, llamadas)
+        self.last_hot_size = 0
+        self._stop = threading.Event()
+        self._thread = None
+        if budget > 0:
+            self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+            self._thread.start()
+
+    # --- ACCESOS ---
+    def touch(self, symbol, timeframe=None):
+        self.tracker.touch((symbol, timeframe or self.default_timeframe))
+
+    def hot_set(self):
+        # [(símbolo, [rangos])] de más a menos visitado; las semillas completan el cupo
+        by_symbol, timeframes = defaultdict(float), defaultdict(list)
+        for (symbol, tf), score in sorted(self.tracker.scores().items(), key=lambda kv: -kv[1]):
+            by_symbol[symbol] += score
+            if len(timeframes[symbol]) < MAX_TIMEFRAMES: timeframes[symbol].append(tf)
+        ranked = sorted(by_symbol, key=by_symbol.get, reverse=True)
+        ranked += [s for s in self.seeds if s not in by_symbol]
+        return [(s, timeframes[s] or [self.default_timeframe]) for s in ranked[:self.hot_size]]
+
+    # --- PRESUPUESTO ---
+    def remaining(self, now=None):
+        now = time.time() if now is None else now
+        while self._spent and now - self._spent[0][0] > BUDGET_WINDOW: self._spent.popleft()
+        return self.budget - sum(n for _, n in self._spent)
+
+    def _charged(self, fn, *args):
+        before = self.upstream_calls()
+        try:
+            fn(*args)
+        except Exception as e:
+            count('warmup_errors_total')
+            print(f"Error precalentando {args[0] if args else ''}: {e}")
+        spent = self.upstream_calls() - before
+        if spent: self._spent.append((time.time(), spent))
+        return spent
+
+    # --- CICLO ---
+    def run_once(self):
+        hot = self.hot_set()
+        done = 0
+        with span('warmup.cycle', symbols=len(hot)), fetch_priority(WARMUP):
+            if self.prepare is not None and self.remaining() > 0:
+                self._charged(self.prepare, [s for s, _ in hot])
+            for symbol, timeframes in hot:
+                if self.remaining() <= 0:
+                    count('warmup_budget_exhausted_total')
+                    break
+                self._charged(self.refresh, symbol, timeframes)
+                done += 1
+        count('warmup_symbols_total', done)
+        self.last_hot_size = len(hot)
+        return done
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def stop(self):
+        self._stop.set()